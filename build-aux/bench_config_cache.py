@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# bench_config_cache.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Compare the load and dump times of the bottle configurations as YAML
+and through the compact cache of bottles.backend.utils.yaml.
+
+Usage: PYTHONPATH=<dir containing the bottles package> \
+       python3 build-aux/bench_config_cache.py [bottles]
+"""
+
+import os
+import sys
+import copy
+import time
+import uuid
+import pickle
+import tempfile
+
+os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp(prefix="bottles-bench-")
+
+from bottles.backend.utils import yaml  # noqa: E402
+from bottles.backend.models.samples import Samples  # noqa: E402
+
+
+def make_config(i: int) -> dict:
+    config = copy.deepcopy(Samples.config)
+    config["Name"] = config["Path"] = f"bottle-{i}"
+    config["Installed_Dependencies"] = [f"dependency-{n}" for n in range(20)]
+    config["External_Programs"] = {
+        str(uuid.uuid4()): {"name": f"Program {n}", "executable": f"program{n}.exe",
+                            "path": f"C:\\Program Files\\Program {n}\\program{n}.exe"}
+        for n in range(10)
+    }
+    return config
+
+
+def pickle_file(data, path: str):
+    """Write data to path as load_file writes the compact copies."""
+    with open(f"{path}.part", "wb") as f:
+        pickle.dump({"stat": None, "data": data}, f, protocol=5)
+    os.replace(f"{path}.part", path)
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(count: int):
+    base = os.path.join(os.environ["XDG_DATA_HOME"], "configs")
+    os.makedirs(base)
+    configs = [make_config(i) for i in range(count)]
+    paths = [os.path.join(base, f"bottle-{i}.yml") for i in range(count)]
+    pickles = [os.path.join(base, f"bottle-{i}.pickle") for i in range(count)]
+
+    # both are timed writing to files in the same directory
+    yaml_dump = timed(lambda: [yaml.dump_file(c, p, indent=4) for c, p in zip(configs, paths)])
+    pickle_dump = timed(lambda: [pickle_file(c, p) for c, p in zip(configs, pickles)])
+
+    # backdate the files so the compact cache can be written
+    past = time.time() - 60
+    for path in paths:
+        os.utime(path, (past, past))
+
+    yaml_load = timed(lambda: [yaml.load(open(p)) for p in paths])
+    cold_load = timed(lambda: [yaml.load_file(p) for p in paths])
+    warm_load = timed(lambda: [yaml.load_file(p) for p in paths])
+
+    assert [yaml.load_file(p) for p in paths] == configs
+
+    print(f"{count} bottle configurations")
+    print(f"  dump  YAML            {yaml_dump * 1000:8.1f} ms")
+    print(f"  dump  pickle          {pickle_dump * 1000:8.1f} ms")
+    print(f"  load  YAML            {yaml_load * 1000:8.1f} ms")
+    print(f"  load  cache (cold)    {cold_load * 1000:8.1f} ms")
+    print(f"  load  cache (warm)    {warm_load * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 150)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# bench_registry_diff.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Measure the streaming diff of bottles.backend.wine.hive on a large
+hive. The hive is a copy of the given system.reg (e.g. the one of a
+bottle with many programs installed) repeated until it reaches the
+requested size, or a generated one if no hive is given. A modified
+copy is made (changed, added and removed values and keys), then the
+two are compared and the patch is checked by applying it to the
+original hive.
+
+Usage: PYTHONPATH=<dir containing the bottles package> \
+       python3 build-aux/bench_registry_diff.py [system.reg] [--size MB] [--no-verify]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+
+os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp(prefix="bottles-bench-")
+os.makedirs(os.path.join(os.environ["XDG_DATA_HOME"], "bottles"))
+
+from bottles.backend.wine import hive  # noqa: E402
+
+HEADER = "WINE REGISTRY Version 2\n;; All keys relative to \\\\Machine\n\n#arch=win64\n"
+
+
+def generate_keys(size: int):
+    """Yield (name, value lines) of a made up hive, in the order wine saves it."""
+    rnd = random.Random(1)
+    written, i = 0, 0
+    while written < size:
+        base = f"Software\\\\Classes\\\\CLSID\\\\{{{i:08X}-{rnd.getrandbits(16):04X}-4E1B-9A60-{i:012X}}}"
+        for sub, values in [
+            ("", [f'@="Component {i}"', f'"AppID"="{{{i:08X}-0000-0000-C000-000000000046}}"']),
+            ("\\\\Data", [
+                '"Blob"=hex:' + ",".join(f"{rnd.getrandbits(8):02x}" for _ in range(24)) + ",\\\n  " +
+                ",".join(f"{rnd.getrandbits(8):02x}" for _ in range(24))
+            ]),
+            ("\\\\InprocServer32", [
+                f'@=str(2):"%SystemRoot%\\\\system32\\\\component{i}.dll"',
+                '"ThreadingModel"="Both"'
+            ]),
+            ("\\\\Version", [f'@="{i % 9}.0"', f'"Flags"=dword:{i:08x}']),
+        ]:
+            lines = [f"#time=1d8{i:013x}"] + values
+            written += len(base) + len(sub) + sum(len(v) for v in lines) + 20
+            yield base + sub, lines
+        i += 1
+
+
+def read_keys(path: str):
+    with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+        reader = hive.HiveReader(f)
+        for key in reader:
+            yield escape_name(key.name), key.meta + key.value_lines
+
+
+def escape_name(name: str) -> str:
+    return hive.escape(name, "[]")
+
+
+def write_hive(path: str, keys):
+    with open(path, "w", encoding="utf-8", errors="surrogateescape") as f:
+        f.write(HEADER)
+        for name, lines in keys:
+            f.write(f"\n[{name}] 1651234567\n")
+            f.write("\n".join(lines) + "\n")
+
+
+def grow(keys_factory, size: int):
+    """Repeat the keys of a real hive, under numbered roots, up to size bytes."""
+    written, copy = 0, 0
+    while written < size:
+        for name, lines in keys_factory():
+            name = f"Copy{copy:04d}\\\\{name}"
+            written += len(name) + sum(len(v) for v in lines) + 20
+            yield name, lines
+            if written >= size:
+                return
+        copy += 1
+
+
+def mutate(keys, stats: dict):
+    """Change ~1% of the values, remove ~0.5% of the keys, add a few."""
+    rnd = random.Random(2)
+    for name, lines in keys:
+        roll = rnd.random()
+        if roll < .005:
+            stats["removed"] += 1
+            continue
+        if roll < .015 and len(lines) > 1:
+            lines = lines[:-1] + ['"Bottles"="changed"']
+            stats["changed"] += 1
+        yield name, lines
+        # wine creates the subkeys of a link under its target
+        if roll > .998 and "#link" not in lines:
+            stats["added"] += 1
+            yield f"{name}\\\\!Added", ['"Bottles"=dword:00000001']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("hive", nargs="?")
+    parser.add_argument("--size", type=int, default=300, help="size of the hives in MB")
+    parser.add_argument("--no-verify", action="store_true")
+    args = parser.parse_args()
+
+    tmp = os.environ["XDG_DATA_HOME"]
+    old = os.path.join(tmp, "old", "system.reg")
+    new = os.path.join(tmp, "new", "system.reg")
+    patch = os.path.join(tmp, "patch.reg")
+    os.makedirs(os.path.dirname(old))
+    os.makedirs(os.path.dirname(new))
+    size = args.size * 1024 * 1024
+
+    if args.hive:
+        source = os.path.abspath(args.hive)
+        write_hive(old, grow(lambda: read_keys(source), size))
+    else:
+        write_hive(old, generate_keys(size))
+
+    stats = {"changed": 0, "removed": 0, "added": 0}
+    write_hive(new, mutate(read_keys(old), stats))
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    count = hive.RegistryDiff(old, new).export(patch)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    total = (os.path.getsize(old) + os.path.getsize(new)) / 1024 / 1024
+    print(f"hives        {os.path.getsize(old) / 1024 / 1024:8.1f} MB + {os.path.getsize(new) / 1024 / 1024:.1f} MB")
+    print(f"mutations    {stats['changed']} changed, {stats['removed']} removed, {stats['added']} added keys")
+    print(f"diff         {elapsed:8.2f} s ({total / elapsed:.1f} MB/s), {count} keys in the patch "
+          f"({os.path.getsize(patch) / 1024:.0f} KB)")
+    print(f"peak RSS     {rss_after / 1024:8.1f} MB (+{(rss_after - rss_before) / 1024:.1f} MB during the diff)")
+
+    if args.no_verify:
+        return
+
+    applied = os.path.join(tmp, "applied")
+    os.makedirs(applied)
+    shutil.copy(old, os.path.join(applied, "system.reg"))
+    hive.OfflineRegistry(applied).apply_bundle(hive.RegistryDiff(old, new).get_bundle())
+    # the patched hive must not differ from the new one, but for the keys
+    # left without values, which wine does not save
+    left = {
+        k: v for k, v in hive.RegistryDiff(new, os.path.join(applied, "system.reg")).changes(sort=True)
+        if v or k.startswith("-")
+    }
+    print(f"verify       {'ok' if not left else f'FAILED, {len(left)} keys differ'}")
+    if left:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
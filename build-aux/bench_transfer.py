@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# bench_transfer.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Compare the copy methods of bottles.backend.utils.transfer.FileTransfer
+with cp on files of the given sizes. The files are written in the given
+directory (the temporary one by default), which should be on the same
+filesystem as the bottles: the reflink copy is only measured where the
+filesystem supports it. Sizes which do not fit in the free space are
+skipped.
+
+Usage: PYTHONPATH=<dir containing the bottles package> \
+       python3 build-aux/bench_transfer.py [--dir DIR] [--sizes MB,MB,…] [--runs N]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp(prefix="bottles-bench-")
+os.makedirs(os.path.join(os.environ["XDG_DATA_HOME"], "bottles"))
+
+from bottles.backend.utils.transfer import FileTransfer  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def make_file(path: str, size: int):
+    block = os.urandom(MB)
+    with open(path, "wb") as f:
+        for _ in range(size // MB):
+            f.write(block)
+    os.sync()
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    os.sync()
+    return time.perf_counter() - start
+
+
+def copy_with(method: str):
+    def copy(src: str, dest: str):
+        transfer = FileTransfer(src, dest, reflink=method == "reflink")
+        if method == "buffered":
+            # force the fallback used when the in-kernel copies are not supported
+            with open(src, "rb") as f_in, open(dest, "wb") as f_out:
+                transfer._FileTransfer__size = os.fstat(f_in.fileno()).st_size
+                transfer._FileTransfer__buffered(f_in.fileno(), f_out.fileno())
+            return
+        if not transfer.copy():
+            raise OSError(f"copy of {src} failed")
+        if transfer.method != method:
+            raise NotImplementedError(transfer.method)
+    return copy
+
+
+def cp(src: str, dest: str):
+    subprocess.run(["cp", "--reflink=never", src, dest], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", default=tempfile.gettempdir())
+    parser.add_argument("--sizes", default="100,1024,4096", help="file sizes in MB")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    methods = [
+        ("cp --reflink=never", cp),
+        ("reflink", copy_with("reflink")),
+        ("copy_file_range", copy_with("copy_file_range")),
+        ("buffered", copy_with("buffered"))
+    ]
+    work = tempfile.mkdtemp(prefix="bottles-bench-transfer-", dir=args.dir)
+    src = os.path.join(work, "src")
+    dest = os.path.join(work, "dest")
+
+    try:
+        print(f"{'size':>8}  {'method':<20} {'best':>8}  {'rate':>10}")
+        for size in [int(s) * MB for s in args.sizes.split(",")]:
+            if shutil.disk_usage(work).free < size * 2 + 256 * MB:
+                print(f"{size // MB:>5} MB  skipped, not enough free space")
+                continue
+            make_file(src, size)
+
+            for name, func in methods:
+                best, with_error = None, None
+                for _ in range(args.runs):
+                    try:
+                        elapsed = timed(lambda: func(src, dest))
+                    except NotImplementedError as e:
+                        with_error = f"unsupported, fell back to {e}"
+                    finally:
+                        if os.path.exists(dest):
+                            os.remove(dest)
+                    if with_error:
+                        break
+                    best = elapsed if best is None else min(best, elapsed)
+
+                if best is None:
+                    print(f"{size // MB:>5} MB  {name:<20} {with_error}")
+                else:
+                    print(f"{size // MB:>5} MB  {name:<20} {best:7.2f}s  {size / MB / best:7.0f} MB/s")
+            os.remove(src)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        shutil.rmtree(os.environ["XDG_DATA_HOME"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import os
-import hashlib
+
+from bottles.backend.utils.hashing import Hasher, HashCache
 
 
 class Diff:
@@ -14,11 +15,11 @@ class Diff:
     @staticmethod
     def hashify(path: str) -> dict:
         """
-        Hash (SHA-1) all files in a directory and return
-        them in a dictionary. Here we use SHA-1 instead of
-        better ones like SHA-256 because we only need to
-        compare the file hashes, it's faster, and it's
-        not a security risk.
+        Hash all files in a directory and return them in a
+        dictionary. Here we use the fast (non cryptographic)
+        hasher because we only need to compare the file
+        hashes, and it's not a security risk. The hashes are
+        cached, only new and modified files are read.
         """
         _files = {}
 
@@ -34,22 +35,20 @@ class Diff:
             for f in files:
                 if f in Diff.__ignored:
                     continue
-                with open(os.path.join(root, f), "rb") as fr:
-                    _hash = hashlib.sha1(fr.read()).hexdigest()
-
-                _key = os.path.join(root, f)
-                _key = _key.replace(path, "")
-                _files[_key] = _hash
+                _files[os.path.join(root, f)] = None
 
-        return _files
+        hashes = HashCache(path).files(list(_files), Hasher.FAST, prune=True)
+        return {_key.replace(path, "", 1): _hash for _key, _hash in hashes.items()}
 
     @staticmethod
     def file_hashify(path: str) -> str:
-        """Hash (SHA-1) a file and return it."""
-        with open(path, "rb") as fr:
-            _hash = hashlib.sha1(fr.read()).hexdigest()
+        """Hash a file and return it."""
+        return Hasher.file(path, Hasher.FAST)
 
-        return _hash
+    @staticmethod
+    def file_matches(path: str, _hash: str) -> bool:
+        """Check if a file matches a hash returned by hashify."""
+        return Hasher.matches(path, _hash)
 
     @staticmethod
     def compare(parent: dict, child: dict) -> dict:
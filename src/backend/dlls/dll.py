@@ -24,6 +24,7 @@ from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
 from bottles.backend.utils.manager import ManagerUtils
 from bottles.backend.wine.reg import Reg
 from bottles.backend.wine.wineboot import WineBoot
+from bottles.backend.wine.session import BottleSession
 
 logging = Logger()
 
@@ -64,7 +65,7 @@ class DLLComponent:
     def install(self, config: dict, overrides_only: bool = False, exclude=None):
         dll_in = []
         bundle = {"HKEY_CURRENT_USER\\Software\\Wine\\DllOverrides": []}
-        reg = Reg(config)
+        reg = BottleSession.get(config).get_program(Reg)
 
         if exclude is None:
             exclude = []
@@ -88,7 +89,7 @@ class DLLComponent:
         reg.import_bundle(bundle)
 
     def uninstall(self, config: dict, exclude=None):
-        reg = Reg(config)
+        reg = BottleSession.get(config).get_program(Reg)
         dll_in = []
         bundle = {"HKEY_CURRENT_USER\\Software\\Wine\\DllOverrides": []}
 
@@ -15,11 +15,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import os
 import time
+import shutil
+import threading
+import contextlib
 import requests
 from gi.repository import GLib
 
 from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.globals import Paths
+from bottles.backend.utils import yaml
 from bottles.backend.utils.file import FileUtils
 
 logging = Logger()
@@ -30,52 +36,52 @@ class Downloader:
     Download a resource from a given URL. It shows and update a progress
     bar while downloading but can also be used to update external progress
     bars using the func parameter.
+    The data is written to a .part file next to the destination, so an
+    interrupted download is resumed with a Range request on the next try.
+    Large files are fetched over multiple connections when the server
+    supports ranges. All the downloads share the same requests.Session.
     """
 
+    chunk_size = 1024 * 1024
+    segment_min_size = 32 * 1024 * 1024
+    max_segments = 4
+    progress_interval = .1
+    state_interval = 2
+
+    __session = None
+    __session_lock = threading.Lock()
+
     def __init__(self, url: str, file: str, func: callable = None, task_id: int = None):
         self.start_time = None
         self.url = url
         self.file = file
         self.func = func
         self.task_id = task_id
+        self.part = f"{file}.part"
+        self.state = f"{file}.part.yml"
+        self.__done = 0
+        self.__total = 0
+        self.__last_update = 0
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """Return the session shared by all the downloads."""
+        with cls.__session_lock:
+            if cls.__session is None:
+                requests.packages.urllib3.disable_warnings()
+                cls.__session = requests.Session()
+                cls.__session.headers.update({"User-Agent": "curl/7.79.1"})
+            return cls.__session
 
     def download(self):
         """Start the download."""
+        self.start_time = time.time()
         try:
-            with open(self.file, "wb") as file:
-                self.start_time = time.time()
-                headers = {"User-Agent": "curl/7.79.1"}
-                response = requests.get(self.url, stream=True, headers=headers)
-                total_size = int(response.headers.get("content-length", 0))
-                block_size = 1024
-                count = 0
-
-                if total_size != 0:
-                    for data in response.iter_content(block_size):
-                        file.write(data)
-                        count += 1
-                        if self.func is not None:
-                            if self.task_id:
-                                GLib.idle_add(
-                                    self.func,
-                                    self.task_id,
-                                    count,
-                                    block_size,
-                                    total_size
-                                )
-                            else:
-                                GLib.idle_add(
-                                    self.func,
-                                    count,
-                                    block_size,
-                                    total_size
-                                )
-                            self.__progress(count, block_size, total_size)
-                else:
-                    file.write(response.content)
-                    if self.func is not None:
-                        GLib.idle_add(self.func, 1, 1, 1)
-                        self.__progress(1, 1, 1)
+            if os.path.exists(self.state):
+                res = self.__resume_segments()
+            else:
+                res = self.__download_stream()
         except requests.exceptions.SSLError:
             logging.error("Download failed due to a SSL error. Your system may have a wrong date/time or wrong certificates.")
             return False
@@ -83,14 +89,178 @@ class Downloader:
             logging.error("Download failed! Check your internet connection.")
             return False
 
+        if not res:
+            return False
+
+        os.replace(self.part, self.file)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.state)
+        return True
+
+    def __download_stream(self) -> bool:
+        """
+        Download (or resume) the resource over a single connection. If the
+        resource is large enough and the server supports ranges, the
+        download is handed to __download_segments.
+        """
+        offset = os.path.getsize(self.part) if os.path.exists(self.part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        response = self.get_session().get(self.url, stream=True, headers=headers)
+
+        if response.status_code == 416 and offset:
+            response.close()
+            # the .part file is complete only if it has the size of the resource
+            if self.__get_range_total(response) == offset:
+                self.__total = self.__done = offset
+                self.__update(0, force=True)
+                return True
+            logging.warning(f"Discarding the partial download of [{os.path.basename(self.file)}].")
+            os.remove(self.part)
+            return self.__download_stream()
+
+        with response:
+            if response.status_code not in [200, 206]:
+                logging.warning(f"Failed to download [{self.url}] with code: {response.status_code} != 200")
+                return False
+
+            if response.status_code == 200:
+                offset = 0
+            total_size = offset + int(response.headers.get("content-length", 0))
+
+            if offset == 0 and total_size >= self.segment_min_size \
+                    and response.headers.get("accept-ranges") == "bytes":
+                url = response.url
+                response.close()
+                return self.__download_segments(url, total_size)
+
+            self.__total = total_size
+            self.__done = offset
+            with open(self.part, "ab" if offset else "wb") as file:
+                for data in response.iter_content(self.chunk_size):
+                    file.write(data)
+                    self.__update(len(data))
+
+        if total_size == 0:
+            self.__total = max(self.__done, 1)
+        self.__update(0, force=True)
         return True
 
+    @staticmethod
+    def __get_range_total(response) -> int:
+        """Return the size in the Content-Range header of a 416 response."""
+        # e.g. "bytes */1234"
+        total = response.headers.get("content-range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else -1
+
+    def __download_segments(self, url: str, total_size: int) -> bool:
+        """Split the resource in segments and fetch them in parallel."""
+        count = min(self.max_segments, total_size // (self.segment_min_size // 2))
+        size = total_size // count
+        segments = []
+        for i in range(count):
+            start = i * size
+            end = total_size - 1 if i == count - 1 else start + size - 1
+            segments.append([start, end, 0])
+
+        with open(self.part, "wb") as file:
+            file.truncate(total_size)
+
+        self.__write_state(url, total_size, segments)
+        return self.__run_segments(url, total_size, segments)
+
+    def __resume_segments(self) -> bool:
+        try:
+            with open(self.state, "r") as f:
+                state = yaml.load(f)
+            url, total_size, segments = state["url"], state["size"], state["segments"]
+        except (FileNotFoundError, yaml.YAMLError, KeyError, TypeError):
+            state = None
+
+        if state is None or not os.path.exists(self.part) \
+                or os.path.getsize(self.part) != total_size:
+            for path in [self.state, self.part]:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+            return self.__download_stream()
+
+        logging.info(f"Resuming download of [{os.path.basename(self.file)}].")
+        return self.__run_segments(url, total_size, segments)
+
+    def __run_segments(self, url: str, total_size: int, segments: list) -> bool:
+        self.__total = total_size
+        self.__done = sum(s[2] for s in segments)
+        errors = []
+
+        def fetch(segment):
+            start, end, written = segment
+            if start + written > end:
+                return
+            headers = {"Range": f"bytes={start + written}-{end}"}
+            try:
+                with self.get_session().get(url, stream=True, headers=headers) as response:
+                    if response.status_code != 206:
+                        raise requests.exceptions.RequestException(
+                            f"Range request answered with code {response.status_code}"
+                        )
+                    fd = os.open(self.part, os.O_WRONLY)
+                    try:
+                        for data in response.iter_content(self.chunk_size):
+                            os.pwrite(fd, data, start + segment[2])
+                            segment[2] += len(data)
+                            self.__update(len(data))
+                    finally:
+                        os.close(fd)
+            except (requests.exceptions.RequestException, OSError) as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=fetch, args=(s,), daemon=True) for s in segments]
+        for t in threads:
+            t.start()
+
+        # keep the state on disk up to date, so a killed download can
+        # still be resumed from where it was
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=self.state_interval)
+                self.__write_state(url, total_size, segments)
+
+        self.__write_state(url, total_size, segments)
+        if errors:
+            raise errors[0]
+
+        self.__update(0, force=True)
+        return True
+
+    def __write_state(self, url: str, total_size: int, segments: list):
+        with open(self.state, "w") as f:
+            yaml.dump({"url": url, "size": total_size, "segments": segments}, f)
+
+    def __update(self, size: int, force: bool = False):
+        """Account size bytes and update the progress, at most every progress_interval."""
+        with self.__lock:
+            self.__done += size
+            now = time.time()
+            if not force and now - self.__last_update < self.progress_interval:
+                return
+            self.__last_update = now
+            done, total = self.__done, self.__total
+
+        if total == 0:
+            return
+
+        if self.func is not None:
+            if self.task_id:
+                GLib.idle_add(self.func, self.task_id, done, 1, total)
+            else:
+                GLib.idle_add(self.func, done, 1, total)
+            self.__progress(done, 1, total)
+
     def __progress(self, count, block_size, total_size):
         """Update the progress bar."""
         percent = int(count * block_size * 100 / total_size)
         done_str = FileUtils.get_human_size(count * block_size)
         total_str = FileUtils.get_human_size(total_size)
-        speed_str = FileUtils.get_human_size(count * block_size / (time.time() - self.start_time))
+        speed_str = FileUtils.get_human_size(count * block_size / max(time.time() - self.start_time, .001))
         name = self.file.split("/")[-1]
         c_close, c_complete, c_incomplete = "\033[0m", "\033[92m", "\033[90m"
         print(
@@ -100,3 +270,96 @@ class Downloader:
         )
         if percent == 100:
             print(f"{c_close}\n")
+
+
+class DownloadCache:
+    """
+    Store the downloaded files keyed on their checksum, outside of the
+    temp directory, so a file is never downloaded twice even if the
+    temp directory is cleared. The cache is bounded to max_size bytes:
+    the least recently used files are evicted first.
+    """
+
+    path = os.path.join(Paths.cache, "downloads")
+    max_size = 2 * 1024 * 1024 * 1024
+
+    @classmethod
+    def __entry(cls, checksum: str) -> str:
+        return os.path.join(cls.path, checksum.lower())
+
+    @classmethod
+    def restore(cls, checksum: str, dest: str) -> bool:
+        """
+        Place the cached file for checksum at dest, if any. The entry is
+        verified first and evicted if it does not match the checksum.
+        """
+        entry = cls.__entry(checksum)
+        if not checksum or not os.path.isfile(entry):
+            return False
+        if FileUtils.get_checksum(entry) != checksum.lower():
+            logging.warning(f"Evicting corrupted [{os.path.basename(entry)}] from the download cache.")
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(entry)
+            return False
+        if not cls.__link(entry, dest):
+            return False
+        # the mtime of the entries tracks their last use
+        with contextlib.suppress(OSError):
+            os.utime(entry)
+        return True
+
+    @classmethod
+    def store(cls, checksum: str, file: str) -> bool:
+        """Add file to the cache under checksum."""
+        if not checksum:
+            return False
+        os.makedirs(cls.path, exist_ok=True)
+        entry = cls.__entry(checksum)
+        if os.path.isfile(entry):
+            return True
+        if not cls.__link(file, entry):
+            return False
+        with contextlib.suppress(OSError):
+            os.utime(entry)
+        cls.__evict(keep=entry)
+        return True
+
+    @classmethod
+    def __evict(cls, keep: str):
+        """Remove the least recently used entries until the cache fits in max_size."""
+        entries = []
+        with os.scandir(cls.path) as it:
+            for e in it:
+                if e.name.endswith(".tmp") or not e.is_file(follow_symlinks=False):
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    st = e.stat(follow_symlinks=False)
+                    entries.append((st.st_mtime, st.st_size, e.path))
+
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= cls.max_size:
+                break
+            if path == keep:
+                continue
+            logging.info(f"Evicting [{os.path.basename(path)}] from the download cache.")
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+    @staticmethod
+    def __link(src: str, dest: str) -> bool:
+        """Hardlink src to dest, falling back to a copy on other filesystems."""
+        tmp = f"{dest}.tmp"
+        try:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+            try:
+                os.link(src, tmp)
+            except OSError:
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, dest)
+        except OSError as e:
+            logging.warning(f"Cannot link [{src}] to [{dest}]: {e}")
+            return False
+        return True
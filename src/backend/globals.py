@@ -71,6 +71,8 @@ class Paths:
     nvapi = f"{base}/nvapi"
     latencyflex = f"{base}/latencyflex"
     templates = f"{base}/templates"
+    cache = f"{base}/cache"
+    compact = f"{cache}/compact"
     library = f"{base}/library.yml"
 
     data = DataManager()
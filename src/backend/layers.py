@@ -27,6 +27,7 @@ from bottles.backend.models.samples import Samples
 from bottles.backend.utils.manager import ManagerUtils
 from bottles.backend.globals import Paths
 from bottles.backend.diff import Diff
+from bottles.backend.wine.hive import RegistryDiff
 
 logging = Logger()
 
@@ -85,8 +86,7 @@ class Layer:
     - layer = Layer.new("dotnet48") | create a new empty layer (@__dotnet48__uuid)
     - layer.mount_bottle(bottle) | link the bottle to the layer
     - Dependency.install(layer.config) | install dependency on layer
-    - layer.sweep() | unlink bottle files from layer
-        - sweep should also export registry diffs
+    - layer.sweep() | unlink bottle files from layer and export registry diffs
     - layer.save() | create a index.yml file with stored files and hashes
     - layer = Layer.new("epic") | create a new empty layer (@__epic__uuid)
     - layer.mount_bottle(bottle) | link the bottle to the layer
@@ -237,23 +237,65 @@ class Layer:
         self.runtime_conf["Runner"] = config["Runner"]
         self.runtime_conf["IsLayer"] = True
 
+    def __export_registry(self, mount: dict):
+        """
+        Export the changes made in the layer to the registry hives of
+        a mounted directory as .reg patches in the layer registry
+        directory, so they can be imported in the bottles using it.
+        """
+        for hive in ["system.reg", "user.reg", "userdef.reg"]:
+            _source = os.path.join(mount["Path"], hive)
+            _layer = os.path.join(self.__path, hive)
+
+            # wine replaces the hives it saves, a link means no changes
+            if os.path.islink(_layer) or not os.path.isfile(_layer) or not os.path.isfile(_source):
+                continue
+
+            _patch = os.path.join(self.__path, "registry", f"{mount['UUID']}-{hive}")
+            os.makedirs(os.path.dirname(_patch), exist_ok=True)
+            try:
+                count = RegistryDiff(_source, _layer).export(_patch)
+            except (OSError, ValueError) as e:
+                logging.error(f"Could not export the registry diff of {hive}: {e}")
+                continue
+
+            if count == 0:
+                os.remove(_patch)
+                continue
+
+            logging.info(f"Exported {count} registry keys from {hive}…")
+            _patches = self.__config.setdefault("Registry", [])
+            _patch = os.path.relpath(_patch, self.__path)
+            if _patch not in _patches:
+                _patches.append(_patch)
+
     def sweep(self):
         """
-        Unlink all the files in the layer and update the layer tree
-        with residues.
+        Export the registry diffs, unlink all the files in the layer
+        and update the layer tree with residues.
         """
         logging.info(f"Sweeping layer {self.__config['Name']}…")
-        for mount in self.__mounts:
+        _current = Diff.hashify(self.__path)
+        for mount in list(self.__mounts):
             _tree = mount["Tree"]
 
+            if mount["Type"] == "absDir":
+                self.__export_registry(mount)
+
             for f in _tree:
                 _file = f"{self.__path}/{f}"
 
                 if not os.path.exists(_file):
                     continue
 
-                if Diff.file_hashify(_file) != _tree[f]:
-                    continue
+                _hash = _current.get(f)
+                if _hash != _tree[f]:
+                    # hashes of the same kind differ only if the file changed,
+                    # others (e.g. from older versions) need to be checked
+                    if _hash and _hash.rpartition(":")[0] == _tree[f].rpartition(":")[0]:
+                        continue
+                    if not Diff.file_matches(_file, _tree[f]):
+                        continue
 
                 if os.path.islink(_file):
                     os.unlink(_file)
@@ -20,6 +20,7 @@ from bottles.backend.utils import yaml
 import uuid
 import tarfile
 import shutil
+import tempfile
 from typing import NewType
 from gettext import gettext as _
 from gi.repository import GLib
@@ -29,6 +30,8 @@ from bottles.backend.managers.manager import Manager
 from bottles.backend.models.result import Result
 from bottles.backend.globals import Paths
 from bottles.backend.utils.manager import ManagerUtils
+from bottles.backend.utils.transfer import TreeCloner
+from bottles.backend.utils.archive import ArchiveWriter, ArchiveReader
 from bottles.operation import OperationManager
 
 logging = Logger()
@@ -39,12 +42,17 @@ RunnerName = NewType('RunnerName', str)
 class BackupManager:
 
     @staticmethod
-    def export_backup(window, config: dict, scope: str, path: str) -> Result:
+    def export_backup(window, config: dict, scope: str, path: str, level: int = 6, codec: str = None) -> Result:
         """
         Exports a bottle backup to the specified path.
-        Use the scope parameter to specify the backup type: config, full.
-        Config will only export the bottle configuration, full will export
-        the full bottle in tar.gz format.
+        Use the scope parameter to specify the backup type: config, full,
+        incremental. Config will only export the bottle configuration, full
+        will export the full bottle as a tar archive compressed on all the
+        cores, with the given level and codec (gzip or zstd, the one of the
+        path extension takes precedence). Incremental will only export the
+        files changed since the last backup of the bottle, chaining the new
+        archive to that one; it falls back to a full backup if there is no
+        previous one.
         """
         if path in [None, ""]:
             logging.error(_("No path specified"))
@@ -54,6 +62,7 @@ class BackupManager:
         task_id = str(uuid.uuid4())
 
         logging.info(f"New {scope} backup for [{config['Name']}] in [{path}]")
+        window.manager.config_store.flush()
 
         if scope == "config":
             try:
@@ -72,15 +81,31 @@ class BackupManager:
                 False
             )
             bottle_path = ManagerUtils.get_bottle_path(config)
+
+            def update(done, total):
+                GLib.idle_add(BackupManager.operation_manager.update_task, task_id, done, 1, total)
+
+            base = None
+            if scope == "incremental":
+                base = BackupManager.get_backup_index(config)
+                if base and os.path.abspath(path) == base["path"]:
+                    # the base archive is going to be overwritten
+                    base = None
+                if base:
+                    logging.info(f"Chaining backup to [{base['path']}]")
+
             try:
-                with tarfile.open(path, "w:gz") as tar:
-                    parent = os.path.dirname(bottle_path)
-                    folder = os.path.basename(bottle_path)
-                    os.chdir(parent)
-                    tar.add(folder, filter=BackupManager.exclude_filter)
+                entries = ArchiveWriter.scan(
+                    src=bottle_path,
+                    arcname=os.path.basename(bottle_path),
+                    exclude=BackupManager.is_excluded
+                )
+                with ArchiveWriter(path, level=level, fn_update=update, base=base, codec=codec) as archive:
+                    archive.add_entries(entries)
+                BackupManager.__save_backup_index(config, path, archive.manifest)
                 backup_created = True
-            except (FileNotFoundError, PermissionError, tarfile.TarError, ValueError):
-                logging.error(f"Error creating backup for [{config['Name']}]")
+            except (OSError, tarfile.TarError, ValueError) as e:
+                logging.error(f"Error creating backup for [{config['Name']}]: {e}")
                 backup_created = False
 
             GLib.idle_add(BackupManager.operation_manager.remove_task, task_id)
@@ -92,21 +117,68 @@ class BackupManager:
         logging.error(f"Failed to save backup in path: {path}.")
         return Result(status=False)
 
+    @staticmethod
+    def __get_index_path(config: dict) -> str:
+        return os.path.join(Paths.cache, "backups", f"{config.get('Path')}.yml")
+
+    @staticmethod
+    def get_backup_index(config: dict) -> dict:
+        """
+        Return the index of the last backup of the bottle: the archive
+        path, its id and the path, size, mtime and hash of every file.
+        An empty dict is returned if there is no backup or the archive
+        has been removed in the meantime.
+        """
+        try:
+            with open(BackupManager.__get_index_path(config), "r") as f:
+                index = yaml.load(f)
+        except (FileNotFoundError, yaml.YAMLError):
+            return {}
+
+        if not isinstance(index, dict) or not os.path.exists(index.get("path", "")):
+            return {}
+        return index
+
+    @staticmethod
+    def __save_backup_index(config: dict, path: str, manifest: dict):
+        index_path = BackupManager.__get_index_path(config)
+        index = {
+            "path": os.path.abspath(path),
+            "id": manifest["id"],
+            "files": manifest["files"]
+        }
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            with open(f"{index_path}.part", "w") as f:
+                yaml.dump(index, f)
+            os.replace(f"{index_path}.part", index_path)
+        except OSError as e:
+            logging.warning(f"Cannot save the backup index: {e}")
+
     @staticmethod
     def exclude_filter(tarinfo):
         """Filter which excludes some unwanted files from the backup."""
-        if "dosdevices" in tarinfo.name:
+        if BackupManager.is_excluded(tarinfo.name):
             return None
 
         return tarinfo
 
+    @staticmethod
+    def is_excluded(name: str) -> bool:
+        # snapshots share their data with the bottle, archiving them would
+        # multiply the size of the backup
+        return "dosdevices" in name or name.split("/")[1:2] == [".snapshots"]
+
     @staticmethod
     def import_backup(window, scope: str, path: str, manager: Manager) -> Result:
         """
         Imports a backup from the specified path.
         Use the scope parameter to specify the backup type: config, full.
         Config will make a new bottle reproducing the configuration, full will
-        import the full bottle from a tar.gz file.
+        import the full bottle from a tar.gz file. If the archive is an
+        incremental backup, the chained archives (expected in the same
+        directory or at their original path) are used to restore the
+        bottle as it was at the time of the selected one.
         """
         if path in [None, ""]:
             logging.error(_("No path specified"))
@@ -145,18 +217,24 @@ class BackupManager:
             except (FileNotFoundError, PermissionError, yaml.YAMLError):
                 import_status = False
         else:
-            if backup_name.endswith(".tar.gz"):
-                backup_name = backup_name[:-7]
+            for ext in [".tar.gz", ".tar.zst"]:
+                if backup_name.endswith(ext):
+                    backup_name = backup_name[:-len(ext)]
 
             if backup_name.lower().startswith("backup_"):
                 # remove the "backup_" prefix if it exists
                 backup_name = backup_name[7:]
 
             try:
-                with tarfile.open(path, "r:gz") as tar:
-                    tar.extractall(Paths.bottles)
-                import_status = True
-            except (FileNotFoundError, PermissionError, tarfile.TarError):
+                def update(done, total, rate):
+                    GLib.idle_add(
+                        BackupManager.operation_manager.update_task,
+                        task_id, done, 1, total, False, rate
+                    )
+
+                import_status = BackupManager.__restore_chain(path, update)
+            except (OSError, tarfile.TarError, ValueError, yaml.YAMLError) as e:
+                logging.error(f"Cannot extract the backup: {e}")
                 import_status = False
 
         GLib.idle_add(BackupManager.operation_manager.remove_task, task_id)
@@ -169,6 +247,67 @@ class BackupManager:
         logging.error(f"Failed importing backup: {backup_name}")
         return Result(status=False)
 
+    @staticmethod
+    def __restore_chain(path: str, fn_update: callable = None) -> bool:
+        """
+        Extract the given archive, then the regular files it lists but
+        does not contain from its base archives, newest first. Every
+        archive is read only once. The archives are extracted in a
+        temporary directory, moved in the bottles directory only if the
+        whole chain was restored. Existing bottles are never replaced:
+        the restore fails if a bottle with the same name exists.
+        """
+        tmp = tempfile.mkdtemp(prefix=".import-", dir=Paths.bottles)
+        try:
+            if not BackupManager.__extract_chain(path, tmp, fn_update):
+                return False
+
+            names = os.listdir(tmp)
+            existing = [n for n in names if os.path.lexists(os.path.join(Paths.bottles, n))]
+            if existing:
+                logging.error(f"A bottle named [{existing[0]}] already exists, remove or rename it first.")
+                return False
+
+            for name in names:
+                os.rename(os.path.join(tmp, name), os.path.join(Paths.bottles, name))
+            return True
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @staticmethod
+    def __extract_chain(path: str, dest: str, fn_update: callable = None) -> bool:
+        reader = ArchiveReader(path, fn_update)
+        done = reader.extract(dest)
+        files = reader.manifest.get("files", {})
+        missing = set(files) - done
+
+        manifest = reader.manifest
+        while missing:
+            if not manifest.get("base"):
+                break
+            base = os.path.join(os.path.dirname(path), os.path.basename(manifest["base"]))
+            if not os.path.exists(base):
+                base = manifest["base"]
+            if not os.path.exists(base):
+                break
+
+            logging.info(f"Extracting changes from base archive [{base}]")
+            reader = ArchiveReader(base, fn_update)
+            done = reader.extract(
+                dest,
+                wanted=lambda member: member.isreg() and member.name in missing
+            )
+            if reader.manifest.get("id") != manifest["base_id"]:
+                logging.error(f"The archive [{base}] is not the base of the backup.")
+                return False
+            missing -= done
+            manifest = reader.manifest
+
+        if missing:
+            logging.error(f"{len(missing)} files are missing from the backup chain of [{path}].")
+            return False
+        return True
+
     @staticmethod
     def duplicate_bottle(config, name) -> Result:
         """Duplicates the bottle with the specified new name."""
@@ -210,12 +349,12 @@ class BackupManager:
             with open(dest_config, "w") as config_file:
                 yaml.dump(config, config_file, indent=4)
 
-            shutil.copytree(
+            TreeCloner(
                 src=source_drive,
-                dst=dest_drive,
+                dest=dest_drive,
                 ignore=shutil.ignore_patterns(".*"),
                 symlinks=False
-            )
+            ).clone()
         except (FileNotFoundError, PermissionError, OSError):
             logging.error(f"Failed duplicate bottle: {name}")
             return Result(status=False)
@@ -19,7 +19,6 @@ import os
 import uuid
 import shutil
 import tarfile
-import requests
 import contextlib
 from functools import lru_cache
 from gi.repository import GLib
@@ -35,7 +34,7 @@ from bottles.backend.utils.manager import ManagerUtils
 from bottles.backend.utils.file import FileUtils
 from bottles.backend.globals import Paths
 from bottles.backend.models.result import Result
-from bottles.backend.downloader import Downloader
+from bottles.backend.downloader import Downloader, DownloadCache
 from bottles.backend.logger import Logger
 
 logging = Logger()
@@ -169,10 +168,11 @@ class ComponentManager:
             GLib.idle_add(_update_func, task_id, count, block_size, total_size, completed)
 
         existing_file = rename if rename else file
+        file_path = os.path.join(Paths.temp, existing_file)
         temp_dest = os.path.join(Paths.temp, file)
         just_downloaded = False
 
-        if os.path.isfile(os.path.join(Paths.temp, existing_file)):
+        if os.path.isfile(file_path):
             '''
             Check if the file already exists in the /temp directory.
             If so, then skip the download process and set the update_func
@@ -180,60 +180,42 @@ class ComponentManager:
             '''
             logging.warning(f"File [{existing_file}] already exists in temp, skipping.")
             GLib.idle_add(update_func, task_id, False, False, False, True)
+        elif checksum and DownloadCache.restore(checksum, file_path):
+            '''
+            The file was already downloaded (maybe for another bottle) and
+            its checksum was verified, so it can be taken from the cache.
+            '''
+            logging.info(f"File [{existing_file}] found in the download cache, skipping.")
+            GLib.idle_add(update_func, task_id, False, False, False, True)
+            GLib.idle_add(self.__operation_manager.remove_task, task_id)
+            return True
         else:
             '''
-            As some urls can be redirect, we need to take care of this
-            and make sure to use the final url. This check should be
-            skipped for large files (e.g. runners).
+            Redirects are followed by the Downloader, which also takes
+            care of failing on unexpected status codes and of resuming
+            a previously interrupted download.
             '''
-            try:
-                requests.packages.urllib3.disable_warnings()
-                headers = {"User-Agent": "curl/7.79.1"}
-                response = requests.head(
-                    download_url,
-                    allow_redirects=True,
-                    headers=headers
-                )
-                download_url = response.url
-                req_code = response.status_code
-            except requests.exceptions.RequestException:
-                logging.exception(f"Failed to download [{download_url}]")
+            res = Downloader(
+                url=download_url,
+                file=temp_dest,
+                func=update_func,
+                task_id=task_id
+            ).download()
+
+            if not res:
                 GLib.idle_add(self.__operation_manager.remove_task, task_id)
                 return False
 
-            if req_code == 200:
-                """
-                If the status code is 200, the resource should be available
-                and the download should be started. Any exceptions return
-                False and the download is removed from the download manager.
-                """
-                res = Downloader(
-                    url=download_url,
-                    file=temp_dest,
-                    func=update_func,
-                    task_id=task_id
-                ).download()
-
-                if not res:
-                    GLib.idle_add(self.__operation_manager.remove_task, task_id)
-                    return False
-
-                if not os.path.isfile(temp_dest):
-                    """Fail if the file is not available in the /temp directory."""
-                    GLib.idle_add(self.__operation_manager.remove_task, task_id)
-                    return False
-
-                just_downloaded = True
-            else:
-                logging.warning(f"Failed to download [{download_url}] with code: {req_code} != 200")
+            if not os.path.isfile(temp_dest):
+                """Fail if the file is not available in the /temp directory."""
                 GLib.idle_add(self.__operation_manager.remove_task, task_id)
                 return False
 
-        file_path = os.path.join(Paths.temp, existing_file)
+            just_downloaded = True
+
         if rename and just_downloaded:
             """Renaming the downloaded file if requested."""
             logging.info(f"Renaming [{file}] to [{rename}].")
-            file_path = os.path.join(Paths.temp, rename)
             os.rename(temp_dest, file_path)
 
         if checksum:
@@ -254,6 +236,9 @@ class ComponentManager:
                 GLib.idle_add(self.__operation_manager.remove_task, task_id)
                 return False
 
+            if just_downloaded:
+                DownloadCache.store(checksum, file_path)
+
         GLib.idle_add(self.__operation_manager.remove_task, task_id)
         return True
 
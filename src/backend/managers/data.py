@@ -43,10 +43,9 @@ class DataManager:
 
     def __get_data(self):
         try:
-            with open(self.__p_data, 'r') as s:
-                self.__data = yaml.load(s)
-                if self.__data == None:
-                    raise AttributeError
+            self.__data = yaml.load_file(self.__p_data)
+            if self.__data == None:
+                raise AttributeError
         except FileNotFoundError:
             logging.error('Data file not found. Creating new one.', )
             self.__create_data_file()
@@ -79,16 +78,14 @@ class DataManager:
                 self.__data[key] = value
 
         with contextlib.suppress(FileNotFoundError):
-            with open(self.__p_data, 'w') as s:
-                yaml.dump(self.__data, s)
+            yaml.dump_file(self.__data, self.__p_data)
 
     def remove(self, key):
         """Removes a key from the data dictionary."""
         if self.__data.get(key):
             del self.__data[key]
             with contextlib.suppress(FileNotFoundError):
-                with open(self.__p_data, 'w') as s:
-                    yaml.dump(self.__data, s)
+                yaml.dump_file(self.__data, self.__p_data)
 
     def get(self, key):
         """Returns the value of a key in the data dictionary."""
@@ -18,8 +18,10 @@
 import os
 import uuid
 import shutil
+import contextlib
 import patoolib
 from glob import glob
+from itertools import groupby
 from functools import lru_cache
 from typing import Union, NewType
 from gi.repository import GLib
@@ -42,11 +44,14 @@ from bottles.backend.wine.reg import Reg
 from bottles.backend.wine.regsvr32 import Regsvr32
 from bottles.backend.wine.regkeys import RegKeys
 from bottles.backend.wine.executor import WineExecutor
+from bottles.backend.wine.session import BottleSession
 
 logging = Logger()
 
 
 class DependencyManager:
+    # steps which only change the registry, applied together when consecutive
+    __registry_actions = ["set_register_key", "register_font", "replace_font", "use_windows"]
 
     def __init__(self, manager, offline: bool = False):
         self.__manager = manager
@@ -88,19 +93,66 @@ class DependencyManager:
         Install a given dependency in a bottle. It will
         return True if the installation was successful.
         """
-        task_id = str(uuid.uuid4())
-        uninstaller = True
-
         if config["Parameters"]["versioning_automatic"]:
             '''
             If the bottle has the versioning system enabled, we need
             to create a new version of the bottle, before installing
-            the dependency.
+            the dependency. A single state is taken for the dependency
+            and its sub-dependencies, in the background while their
+            files are downloaded; the bottle is only touched after the
+            state is ready.
             '''
-            self.__manager.versioning_manager.create_state(
+            state = self.__manager.versioning_manager.create_state_async(
                 config=config,
                 message=f"Before installing {dependency[0]}"
             )
+            self.__prefetch(config, dependency[0])
+            state.wait()
+
+        # the config changes of the dependency tree are written at once
+        with self.__manager.config_store.batch():
+            return self.__install(config, dependency, reinstall)
+
+    def __prefetch(self, config: dict, name: str, _seen: set = None):
+        """
+        Download the files needed by a dependency and its sub-dependencies
+        to the temp directory, where the install steps will find them.
+        Failures are ignored here, the steps will report them.
+        """
+        _seen = _seen if _seen is not None else set()
+        if name in _seen:
+            return
+        _seen.add(name)
+
+        manifest = self.get_dependency(name)
+        if not manifest:
+            return
+
+        for _ext_dep in manifest.get("Dependencies", []):
+            if _ext_dep not in config["Installed_Dependencies"] \
+                    and _ext_dep in self.__manager.supported_dependencies:
+                self.__prefetch(config, _ext_dep, _seen)
+
+        for step in manifest.get("Steps", []):
+            if not self.__step_applies(config, step) or step["action"] not in [
+                "download_archive", "install_exe", "install_msi", "cab_extract", "archive_extract"
+            ] or not validate_url(step.get("url", "")):
+                continue
+            self.__manager.component_manager.download(
+                download_url=step.get("url"),
+                file=step.get("file_name"),
+                rename=step.get("rename"),
+                checksum=step.get("file_checksum")
+            )
+
+    def __install(
+            self,
+            config: dict,
+            dependency: list,
+            reinstall: bool = False
+    ) -> Result:
+        task_id = str(uuid.uuid4())
+        uninstaller = True
 
         GLib.idle_add(
             self.__operation_manager.new_task, task_id, dependency[0], False
@@ -132,24 +184,31 @@ class DependencyManager:
                     continue
                 if _ext_dep in self.__manager.supported_dependencies:
                     _dep = self.__manager.supported_dependencies[_ext_dep]
-                    _res = self.install(config, [_ext_dep, _dep])
+                    _res = self.__install(config, [_ext_dep, _dep])
                     if not _res.status:
                         return _res
 
-        for step in manifest.get("Steps"):
+        reg = BottleSession.get(config).get_program(Reg)
+        for is_registry, steps in groupby(
+                [s for s in manifest.get("Steps") if self.__step_applies(config, s)],
+                key=lambda s: s["action"] in self.__registry_actions
+        ):
             '''
             Here we execute all steps in the manifest.
             Steps are the actions performed to install the dependency.
+            Consecutive registry steps are applied with a single import.
             '''
-            res = self.__perform_steps(config, step)
-            if not res.status:
-                GLib.idle_add(self.__operation_manager.remove_task, task_id)
-                return Result(
-                    status=False,
-                    message=f"One or more steps failed for {dependency[0]}."
-                )
-            if not res.data.get("uninstaller"):
-                uninstaller = False
+            with reg.transaction() if is_registry else contextlib.nullcontext():
+                for step in steps:
+                    res = self.__perform_steps(config, step)
+                    if not res.status:
+                        GLib.idle_add(self.__operation_manager.remove_task, task_id)
+                        return Result(
+                            status=False,
+                            message=f"One or more steps failed for {dependency[0]}."
+                        )
+                    if not res.data.get("uninstaller"):
+                        uninstaller = False
 
         if dependency[0] not in config.get("Installed_Dependencies") \
                 or reinstall:
@@ -200,6 +259,19 @@ class DependencyManager:
             data={"uninstaller": True}
         )
 
+    @staticmethod
+    def __step_applies(config: dict, step: dict) -> bool:
+        """
+        Steps can be restricted to some bottle architectures with the
+        for key (e.g. for: win64), the others are skipped.
+        """
+        arch = step.get("for")
+        if not arch:
+            return True
+        if isinstance(arch, str):
+            arch = [arch]
+        return config.get("Arch") in arch
+
     def __perform_steps(
             self,
             config: dict,
@@ -341,7 +413,7 @@ class DependencyManager:
         Download and install the .exe or .msi file
         declared in the step, in a bottle.
         """
-        winedbg = WineDbg(config)
+        winedbg = BottleSession.get(config).get_program(WineDbg)
         download = self.__manager.component_manager.download(
             download_url=step.get("url"),
             file=step.get("file_name"),
@@ -589,7 +661,7 @@ class DependencyManager:
     @staticmethod
     def __step_override_dll(config: dict, step: dict):
         """Register a new override for each dll."""
-        reg = Reg(config)
+        reg = BottleSession.get(config).get_program(Reg)
 
         if step.get("url") and step.get("url").startswith("temp/"):
             path = step["url"].replace("temp/", f"{Paths.temp}/")
@@ -618,7 +690,7 @@ class DependencyManager:
     @staticmethod
     def __step_set_register_key(config: dict, step: dict):
         """Set a registry key."""
-        reg = Reg(config)
+        reg = BottleSession.get(config).get_program(Reg)
         reg.add(
             key=step.get("key"),
             value=step.get("value"),
@@ -630,7 +702,7 @@ class DependencyManager:
     @staticmethod
     def __step_register_font(config: dict, step: dict):
         """Register a font in the registry."""
-        reg = Reg(config)
+        reg = BottleSession.get(config).get_program(Reg)
         reg.add(
             key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion\\Fonts",
             value=step.get("name"),
@@ -641,7 +713,7 @@ class DependencyManager:
     @staticmethod
     def __step_replace_font(config: dict, step: dict):
         """Register a font replacement in the registry."""
-        reg = Reg(config)
+        reg = BottleSession.get(config).get_program(Reg)
         replaces = step.get("replace")
 
         if len(replaces) == 1:
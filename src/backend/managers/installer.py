@@ -371,13 +371,14 @@ class InstallerManager:
         if parameters.get("sync") and config["Parameters"]["sync"] != "wine":
             del parameters["sync"]
 
-        for param in parameters:
-            self.__manager.update_config(
-                config=config,
-                key=param,
-                value=parameters[param],
-                scope="Parameters"
-            )
+        with self.__manager.config_store.batch():
+            for param in parameters:
+                self.__manager.update_config(
+                    config=config,
+                    key=param,
+                    value=parameters[param],
+                    scope="Parameters"
+                )
 
     def count_steps(self, installer) -> dict:
         manifest = self.get_installer(installer[0])
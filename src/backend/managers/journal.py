@@ -51,13 +51,12 @@ class JournalManager:
             with open(JournalManager.path, "w") as f:
                 yaml.dump({}, f)
 
-        with open(JournalManager.path, "r") as f:
-            try:
-                journal = yaml.load(f)
-            except yaml.YAMLError:
-                journal_backup = f"{JournalManager.path}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.bak"
-                shutil.copy2(JournalManager.path, journal_backup)
-                journal = {}
+        try:
+            journal = yaml.load_file(JournalManager.path)
+        except yaml.YAMLError:
+            journal_backup = f"{JournalManager.path}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.bak"
+            shutil.copy2(JournalManager.path, journal_backup)
+            journal = {}
 
         if journal is None:
             return {}
@@ -97,8 +96,7 @@ class JournalManager:
         if journal is None:
             journal = JournalManager.__get_journal()
         with contextlib.suppress(IOError, OSError):
-            with open(JournalManager.path, "w") as f:
-                yaml.dump(journal, f)
+            yaml.dump_file(journal, JournalManager.path)
 
     @staticmethod
     def get(period: str = "today", plain: bool = False):
@@ -48,8 +48,7 @@ class LibraryManager:
             self.__library = {}
             self.save_library()
         else:
-            with open(self.library_path, 'r') as library_file:
-                self.__library = yaml.load(library_file)
+            self.__library = yaml.load_file(self.library_path)
 
         if self.__library is None:
             self.__library = {}
@@ -89,8 +88,7 @@ class LibraryManager:
         """
         Saves the library.yml file.
         """
-        with open(self.library_path, 'w') as library_file:
-            yaml.dump(self.__library, library_file)
+        yaml.dump_file(self.__library, self.library_path)
         logging.info(f'Library saved')
 
     def get_library(self):
@@ -16,6 +16,7 @@
 #
 
 import os
+import re
 import hashlib
 import subprocess
 import random
@@ -45,10 +46,14 @@ from bottles.backend.managers.installer import InstallerManager
 from bottles.backend.managers.dependency import DependencyManager
 from bottles.backend.managers.steam import SteamManager
 from bottles.backend.utils.file import FileUtils
-from bottles.backend.utils.lnk import LnkUtils
+from bottles.backend.utils.lnk import LnkIndex
 from bottles.backend.utils.manager import ManagerUtils
 from bottles.backend.utils.generic import sort_by_version
 from bottles.backend.utils.decorators import cache
+from bottles.backend.utils.startup import StartupCache, StartupScheduler
+from bottles.backend.utils.registry import BottleRegistry
+from bottles.backend.utils.watcher import FileWatcher
+from bottles.backend.utils.config import ConfigStore
 from bottles.backend.managers.importer import ImportManager
 from bottles.backend.layers import Layer, LayersStore
 from bottles.backend.dlls.dxvk import DXVKComponent
@@ -61,9 +66,28 @@ from bottles.backend.wine.wineserver import WineServer
 from bottles.backend.wine.reg import Reg
 from bottles.backend.wine.regkeys import RegKeys
 from bottles.backend.wine.winepath import WinePath
+from bottles.backend.wine.session import BottleSession
+from bottles.utils.threading import RunAsync
 
 logging = Logger()
 
+# programs discovered from the shortcuts matching these patterns are skipped
+ignored_programs = re.compile("|".join(fnmatch.translate(p) for p in [
+    "*installer*",
+    "*unins*",
+    "*setup*",
+    "*debug*",
+    "*report*",
+    "*crash*",
+    "*err*",
+    "_*",
+    "start",
+    "OriginEr",
+    "*website*",
+    "*web site*",
+    "*user_manual*"
+]))
+
 
 class Manager:
     """
@@ -100,98 +124,85 @@ class Manager:
     def __init__(self, window, is_cli=False, repo_fn_update=None, **kwargs):
         super().__init__(**kwargs)
 
-        times = {"start": time.time()}
+        times = {}
 
         # common variables
         self.window = window
         self.settings = window.settings
         self.utils_conn = window.utils_conn
         self.is_cli = is_cli
+        self.startup_cache = StartupCache()
+        self.bottle_registry = BottleRegistry(self.__load_bottle, self.__setup_bottle)
+        self.config_store = ConfigStore(fn_written=self.bottle_registry.touch)
         _offline = not window.utils_conn.check_connection()
 
-        self.repository_manager = RepositoryManager(repo_fn_update)
-        times["RepositoryManager"] = time.time()
-
-        self.versioning_manager = VersioningManager(window, self)
-        times["VersioningManager"] = time.time()
-
-        self.component_manager = ComponentManager(self, _offline)
-        times["ComponentManager"] = time.time()
-
-        self.installer_manager = InstallerManager(self, _offline)
-        times["InstallerManager"] = time.time()
-
-        self.dependency_manager = DependencyManager(self, _offline)
-        times["DependencyManager"] = time.time()
-
-        self.import_manager = ImportManager(self)
-        times["ImportManager"] = time.time()
+        def timed(name, func):
+            start = time.time()
+            res = func()
+            times[name] = time.time() - start
+            return res
 
-        self.steam_manager = SteamManager()
-        times["SteamManager"] = time.time()
+        self.repository_manager = timed("RepositoryManager", lambda: RepositoryManager(repo_fn_update))
+        self.versioning_manager = timed("VersioningManager", lambda: VersioningManager(window, self))
+        self.component_manager = timed("ComponentManager", lambda: ComponentManager(self, _offline))
+        self.installer_manager = timed("InstallerManager", lambda: InstallerManager(self, _offline))
+        self.dependency_manager = timed("DependencyManager", lambda: DependencyManager(self, _offline))
+        self.import_manager = timed("ImportManager", lambda: ImportManager(self))
+        self.steam_manager = timed("SteamManager", lambda: SteamManager())
 
         if not is_cli:
             times.update(self.checks(install_latest=False, first_run=True))
+            self.__start_watcher()
         else:
             logging.set_silent()
 
-        if "BOOT_TIME" in os.environ:
-            _temp_times = times.copy()
-            last = 0
-            times_str = "Boot times:"
-            for f, t in _temp_times.items():
-                if last == 0:
-                    last = int(round(t))
-                    continue
-                t = int(round(t))
-                times_str += f"\n\t - {f} took: {t - last}s"
-                last = t
-            logging.info(times_str)
+        StartupScheduler.report(times)
 
     def checks(self, install_latest=False, first_run=False):
+        """
+        Perform the startup checks. Component checks and catalog fetches
+        don't depend on each other, so they are run concurrently by the
+        StartupScheduler. The bottles check reads the component lists,
+        so it waits for the component checks. If install_latest is True,
+        the catalogs are fetched first, as they are needed to pick the
+        components to install. Returns the time taken by each stage.
+        """
         logging.info("Performing Bottles checks…")
-        times = {}
-
-        self.check_app_dirs()
-        times["check_app_dirs"] = time.time()
-
-        self.check_dxvk(install_latest)
-        times["check_dxvk"] = time.time()
-
-        self.check_vkd3d(install_latest)
-        times["check_vkd3d"] = time.time()
-
-        self.check_nvapi(install_latest)
-        times["check_nvapi"] = time.time()
-
-        self.check_latencyflex(install_latest)
-        times["check_latencyflex"] = time.time()
-
-        self.check_runtimes(install_latest)
-        times["check_runtimes"] = time.time()
-
-        self.check_winebridge(install_latest)
-        times["check_winebridge"] = time.time()
-
-        self.check_runners(install_latest)
-        times["check_runners"] = time.time()
-
+        scheduler = StartupScheduler()
+
+        scheduler.run({"check_app_dirs": self.check_app_dirs})
+
+        local_checks = {
+            "check_dxvk": lambda: self.check_dxvk(install_latest),
+            "check_vkd3d": lambda: self.check_vkd3d(install_latest),
+            "check_nvapi": lambda: self.check_nvapi(install_latest),
+            "check_latencyflex": lambda: self.check_latencyflex(install_latest),
+            "check_runtimes": lambda: self.check_runtimes(install_latest),
+            "check_winebridge": lambda: self.check_winebridge(install_latest),
+            "check_runners": lambda: self.check_runners(install_latest),
+            "check_bottles": self.check_bottles,
+        }
+        depends = {"check_bottles": [c for c in local_checks if c != "check_bottles"]}
+        catalogs = {
+            "organize_dependencies": self.organize_dependencies,
+            "organize_installers": self.organize_installers,
+        }
         if first_run:
-            self.organize_components()
-            times["organize_components"] = time.time()
-            self.__clear_temp()
-            times["clear_temp"] = time.time()
+            catalogs["organize_components"] = self.organize_components
 
-        self.organize_dependencies()
-        times["organize_dependencies"] = time.time()
-
-        self.organize_installers()
-        times["organize_installers"] = time.time()
+        if install_latest:
+            scheduler.run(catalogs)
+            scheduler.run(local_checks, depends)
+        else:
+            scheduler.run({**local_checks, **catalogs}, depends)
 
-        self.check_bottles()
-        times["check_bottles"] = time.time()
+        if first_run:
+            # the temp directory can only be cleared once nothing is
+            # downloading into it anymore
+            scheduler.run({"clear_temp": self.__clear_temp})
 
-        return times
+        self.startup_cache.save()
+        return scheduler.times
 
     def __clear_temp(self, force: bool = False):
         """Clears the temp directory if user setting allows it. Use the force
@@ -212,6 +223,48 @@ class Manager:
         with contextlib.suppress(AttributeError):
             self.window.page_list.update_bottles()
 
+    def __start_watcher(self):
+        """
+        Watch the bottles and components directories, so the lists are
+        updated as soon as something is added or removed, also from
+        outside Bottles, instead of being rescanned on every refresh.
+        The bottle.yml files are watched too, to catch external edits.
+        """
+        self.watcher = FileWatcher()
+        self.watcher.watch("bottles", Paths.bottles, self.__on_bottles_changed)
+        # checking the runners can spawn wine, so it runs off the main loop
+        self.watcher.watch("runners", Paths.runners, lambda: RunAsync(self.check_runners, install_latest=False))
+        for component_type in ["dxvk", "vkd3d", "nvapi", "latencyflex"]:
+            self.watcher.watch(
+                component_type,
+                getattr(Paths, component_type),
+                lambda c=component_type: self.__on_component_changed(c)
+            )
+        self.__watch_bottle_configs()
+
+    def __watch_bottle_configs(self):
+        paths = self.bottle_registry.get_config_paths()
+        tags = self.watcher.get_tags()
+
+        for tag in tags:
+            if tag.startswith("bottle:") and tag[7:] not in paths:
+                self.watcher.unwatch(tag)
+
+        for name, path in paths.items():
+            if f"bottle:{name}" not in tags:
+                self.watcher.watch(f"bottle:{name}", path, self.__on_bottles_changed, directory=False)
+
+    def __on_bottles_changed(self):
+        # our own config writes are already known to the registry and
+        # don't need the list to be rebuilt
+        if self.bottle_registry.refresh():
+            self.update_bottles(silent=True)
+            self.__watch_bottle_configs()
+
+    def __on_component_changed(self, component_type: str):
+        res = self.__check_component(component_type, install_latest=False)
+        getattr(self, f"{component_type}_available")[:] = res or []
+
     def check_app_dirs(self):
         """
         Checks for the existence of the bottles' directories, and creates them
@@ -266,6 +319,10 @@ class Manager:
             logging.info("LatencyFlex path doesn't exist, creating now.")
             os.makedirs(Paths.latencyflex, exist_ok=True)
 
+        if not os.path.isdir(Paths.cache):
+            logging.info("Cache path doesn't exist, creating now.")
+            os.makedirs(Paths.cache, exist_ok=True)
+
     def organize_components(self):
         """Get components catalog and organizes into supported_ lists."""
         catalog = self.component_manager.fetch_catalog()
@@ -337,10 +394,17 @@ class Manager:
         """
         Check for available runners (both system and Bottles) and install
         the latest version if install_latest is True. It also masks the
-        winemenubuilder tool.
+        winemenubuilder tool. The runners_available list is updated in
+        place, so the references held by other objects stay valid.
         """
+        mtimes = self.startup_cache.mtimes([Paths.runners, shutil.which("wine")])
+        cached = self.startup_cache.get("runners", mtimes)
+        if cached is not None and (len(cached) > 0 or not install_latest):
+            self.runners_available[:] = cached
+            return True
+
         runners = glob(f"{Paths.runners}/*/")
-        self.runners_available = []
+        runners_available = []
 
         # lock winemenubuilder.exe
         for runner in runners:
@@ -354,7 +418,8 @@ class Manager:
                 if winemenubuilder.startswith("Proton"):
                     continue
                 if os.path.isfile(winemenubuilder):
-                    os.rename(winemenubuilder, f"{winemenubuilder}.lock")
+                    with contextlib.suppress(FileNotFoundError):
+                        os.rename(winemenubuilder, f"{winemenubuilder}.lock")
 
         # check system wine
         if shutil.which("wine") is not None:
@@ -368,17 +433,19 @@ class Manager:
                 shell=True
             ).communicate()[0].decode("utf-8")
             version = "sys-" + version.split("\n")[0].split(" ")[0]
-            self.runners_available.append(version)
+            runners_available.append(version)
 
         # check bottles runners
         for runner in runners:
             _runner = os.path.basename(os.path.normpath(runner))
-            self.runners_available.append(_runner)
+            runners_available.append(_runner)
 
-        if len(self.runners_available) > 0:
-            logging.info("Runners found:\n - {0}".format("\n - ".join(self.runners_available)))
+        if len(runners_available) > 0:
+            logging.info("Runners found:\n - {0}".format("\n - ".join(runners_available)))
 
-        tmp_runners = [x for x in self.runners_available if not x.startswith('sys-')]
+        runners_available = sorted(runners_available, reverse=True)
+        self.runners_available[:] = runners_available
+        tmp_runners = [x for x in runners_available if not x.startswith('sys-')]
 
         if len(tmp_runners) == 0 and install_latest:
             logging.warning("No runners found.")
@@ -395,13 +462,15 @@ class Manager:
                     else:
                         tmp_runners = self.supported_wine_runners
                         runner_name = next(iter(tmp_runners))
+                    # the installation checks the runners again
                     self.component_manager.install("runner", runner_name)
+                    return True
                 except StopIteration:
                     return False
             else:
                 return False
 
-        self.runners_available = sorted(self.runners_available, reverse=True)
+        self.startup_cache.set("runners", mtimes, runners_available)
         return True
 
     def check_runtimes(self, install_latest: bool = True) -> bool:
@@ -410,6 +479,12 @@ class Manager:
             self.runtimes_available = ["flatpak-managed"]
             return True
 
+        mtimes = self.startup_cache.mtimes([Paths.runtimes] + glob(f"{Paths.runtimes}/*/manifest.yml"))
+        cached = self.startup_cache.get("runtimes", mtimes)
+        if cached:
+            self.runtimes_available = cached
+            return True
+
         runtimes = os.listdir(Paths.runtimes)
 
         if len(runtimes) == 0:
@@ -432,9 +507,17 @@ class Manager:
                 if version:
                     version = f"runtime-{version}"
                     self.runtimes_available = [version]
+                    self.startup_cache.set("runtimes", mtimes, self.runtimes_available)
 
     def check_winebridge(self, install_latest: bool = True, update: bool = False) -> bool:
         self.winebridge_available = []
+        version_file = os.path.join(Paths.winebridge, "VERSION")
+        mtimes = self.startup_cache.mtimes([Paths.winebridge, version_file])
+        cached = self.startup_cache.get("winebridge", mtimes)
+        if cached and not update:
+            self.winebridge_available = cached
+            return True
+
         winebridge = os.listdir(Paths.winebridge)
 
         if len(winebridge) == 0 or update:
@@ -449,12 +532,12 @@ class Manager:
                     return False
             return False
 
-        version_file = os.path.join(Paths.winebridge, "VERSION")
         if os.path.exists(version_file):
             with open(version_file, "r") as f:
                 version = f.read().strip()
                 if version:
                     self.winebridge_available = [f"winebridge-{version}"]
+                    self.startup_cache.set("winebridge", mtimes, self.winebridge_available)
 
     def check_dxvk(self, install_latest: bool = True):
         res = self.__check_component("dxvk", install_latest)
@@ -510,6 +593,11 @@ class Manager:
             raise ValueError("Component type not supported.")
 
         component = components[component_type]
+        mtimes = self.startup_cache.mtimes([component["path"]])
+        cached = self.startup_cache.get(component_type, mtimes)
+        if cached is not None and (len(cached) > 0 or not install_latest):
+            return cached
+
         component["available"] = os.listdir(component["path"])
 
         if len(component["available"]) > 0:
@@ -533,9 +621,12 @@ class Manager:
                 return False
 
         try:
-            return sort_by_version(component["available"])
+            res = sort_by_version(component["available"])
         except ValueError:
-            return sorted(component["available"], reverse=True)
+            res = sorted(component["available"], reverse=True)
+
+        self.startup_cache.set(component_type, mtimes, res)
+        return res
 
     @staticmethod
     def launch_layer_program(config, layer):
@@ -580,39 +671,8 @@ class Manager:
             return []
 
         bottle = ManagerUtils.get_bottle_path(config)
-        winepath = WinePath(config)
-        results = glob(
-            f"{bottle}/drive_c/users/*/Desktop/*.lnk",
-            recursive=True
-        )
-        results += glob(
-            f"{bottle}/drive_c/users/*/Start Menu/Programs/**/*.lnk",
-            recursive=True
-        )
-        results += glob(
-            f"{bottle}/drive_c/ProgramData/Microsoft/Windows/Start Menu/Programs/**/*.lnk",
-            recursive=True
-        )
-        results += glob(
-            f"{bottle}/drive_c/users/*/AppData/Roaming/Microsoft/Windows/Start Menu/Programs/**/*.lnk",
-            recursive=True
-        )
+        winepath = BottleSession.get(config).get_program(WinePath)
         installed_programs = []
-        ignored_patterns = [
-            "*installer*",
-            "*unins*",
-            "*setup*",
-            "*debug*",
-            "*report*",
-            "*crash*",
-            "*err*",
-            "_*",
-            "start",
-            "OriginEr",
-            "*website*",
-            "*web site*",
-            "*user_manual*"
-        ]
         found = []
         ext_programs = config.get("External_Programs")
 
@@ -644,28 +704,18 @@ class Manager:
                 "id": _program.get("id")
             })
 
-        for program in results:
+        for program, executable_path in LnkIndex.get(bottle).get_shortcuts():
             '''
             for each .lnk file, try to get the executable path and
             append it to the installed_programs list with its icon, 
             skip if the path contains the "Uninstall" word.
             '''
-            executable_path = LnkUtils.get_data(program)
             if executable_path is None:
                 continue
             executable_name = executable_path.split("\\")[-1]
-            program_folder = ManagerUtils.get_exe_parent_dir(config, executable_path)
-            stop = False
-
-            for pattern in ignored_patterns:
-                try:
-                    if fnmatch.fnmatch(executable_name.lower(), pattern):
-                        stop = True
-                        break
-                except:  # safe to ignore
-                    pass
-            if stop:
+            if ignored_programs.match(executable_name.lower()):
                 continue
+            program_folder = ManagerUtils.get_exe_parent_dir(config, executable_path)
 
             path_check = os.path.join(
                 bottle,
@@ -698,125 +748,21 @@ class Manager:
     def check_bottles(self, silent: bool = False):
         """
         Check for local bottles and update the local_bottles list.
-        Will also mark the broken ones if the configuration file is missing
+        Will also mark the broken ones if the configuration file is missing.
+        Only the new and modified bottles are parsed, the others are kept
+        in the bottle registry.
         TODO: move to bottle.py (Bottle manager)
         """
-        bottles = os.listdir(Paths.bottles)
-
-        def process_bottle(bottle):
-            _name = bottle
-            _bottle = os.path.join(Paths.bottles, bottle)
-            _placeholder = os.path.join(_bottle, "placeholder.yml")
-            _config = os.path.join(_bottle, "bottle.yml")
-
-            if os.path.exists(_placeholder):
-                with open(_placeholder, "r") as f:
-                    try:
-                        placeholder_yaml = yaml.load(f)
-                        if placeholder_yaml.get("Path"):
-                            _config = os.path.join(placeholder_yaml.get("Path"), "bottle.yml")
-                        else:
-                            raise ValueError("Missing Path in placeholder.yml")
-                    except (yaml.YAMLError, ValueError):
-                        return
+        # the migrations of each bottle are written at once
+        with self.config_store.batch():
+            changed = self.bottle_registry.refresh()
+        bottles = self.bottle_registry.get_configs()
 
-            try:
-                if not os.path.exists(_config):
-                    raise AttributeError
-                with open(_config, "r") as f:
-                    conf_file_yaml = yaml.load(f)
-            except (FileNotFoundError, AttributeError, yaml.YAMLError):
-                return
-
-            if conf_file_yaml is None:
-                return
-
-            # Clear Latest_Executables on new session start
-            if conf_file_yaml.get("Latest_Executables"):
-                conf_file_yaml["Latest_Executables"] = []
-
-            # Migrate old programs to [id] and [name]
-            # TODO: remove this migration after 2022.9.28
-            _temp = {}
-            _changed = False
-            for k, v in conf_file_yaml.get("External_Programs").items():
-                _uuid = str(uuid.uuid4())
-                _k = k
-                _v = v
-                if isinstance(v, str):
-                    continue
-                try:
-                    uuid.UUID(k)
-                except (ValueError, TypeError):
-                    _k = _uuid
-                    _changed = True
-                if "id" not in v:
-                    _v["id"] = _uuid
-                    _changed = True
-                if "name" not in v:
-                    _v["name"] = _v["executable"].split(".")[0]
-                    _changed = True
-                _temp[_k] = _v
-
-            if _changed:
-                self.update_config(
-                    config=conf_file_yaml,
-                    key="External_Programs",
-                    value=_temp
-                )
-            conf_file_yaml["External_Programs"] = _temp
+        for name in [n for n in self.local_bottles if n not in bottles]:
+            del self.local_bottles[name]
+        self.local_bottles.update(bottles)
 
-            miss_keys = Samples.config.keys() - conf_file_yaml.keys()
-            for key in miss_keys:
-                logging.warning(f"Key {key} is missing for bottle {_name}, updating…")
-                self.update_config(
-                    config=conf_file_yaml,
-                    key=key,
-                    value=Samples.config[key]
-                )
-
-            miss_params_keys = Samples.config["Parameters"].keys() - conf_file_yaml["Parameters"].keys()
-
-            for key in miss_params_keys:
-                '''
-                For each missing key in the bottle configuration, set
-                it to the default value.
-                '''
-                logging.warning(f"Parameters key {key} is missing for bottle {_name}, updating…")
-                self.update_config(
-                    config=conf_file_yaml,
-                    key=key,
-                    value=Samples.config["Parameters"][key],
-                    scope="Parameters"
-                )
-            self.local_bottles[conf_file_yaml['Name']] = conf_file_yaml
-
-            for p in [
-                os.path.join(_bottle, "cache", "dxvk_state"),
-                os.path.join(_bottle, "cache", "gl_shader"),
-                os.path.join(_bottle, "cache", "mesa_shader"),
-                os.path.join(_bottle, "cache", "vkd3d_shader"),
-            ]:
-                if not os.path.exists(p):
-                    os.makedirs(p)
-
-            for c in os.listdir(_bottle):
-                c = str(c)
-                if c.endswith(".dxvk-cache"):
-                    shutil.move(os.path.join(_bottle, c), os.path.join(_bottle, "cache", "dxvk_state"))
-                elif "vkd3d-proton.cache" in c:
-                    shutil.move(os.path.join(_bottle, c), os.path.join(_bottle, "cache", "vkd3d_shader"))
-                elif c == "GLCache":
-                    shutil.move(os.path.join(_bottle, c), os.path.join(_bottle, "cache", "gl_shader"))
-
-        for b in bottles:
-            '''
-            For each bottle add the path name to the `local_bottles` variable
-            and append the config.
-            '''
-            process_bottle(b)
-
-        if len(self.local_bottles) > 0 and not silent:
+        if changed and len(self.local_bottles) > 0 and not silent:
             logging.info("Bottles found:\n - {0}".format("\n - ".join(self.local_bottles)))
 
         if self.settings.get_boolean("steam-proton-support") \
@@ -825,6 +771,105 @@ class Manager:
             self.steam_manager.update_bottles()
             self.local_bottles.update(self.steam_manager.list_prefixes())
 
+    def __load_bottle(self, name: str, bottle_path: str, config_path: str) -> Union[dict, None]:
+        """
+        Parse the configuration of a bottle and migrate it to the current
+        format, called by the bottle registry when the bottle is new or
+        its bottle.yml changed. Return None for broken bottles.
+        """
+        try:
+            conf_file_yaml = yaml.load_file(config_path)
+        except (FileNotFoundError, yaml.YAMLError):
+            return None
+
+        if conf_file_yaml is None:
+            return None
+
+        # Clear Latest_Executables on new session start
+        if conf_file_yaml.get("Latest_Executables"):
+            conf_file_yaml["Latest_Executables"] = []
+
+        # Migrate old programs to [id] and [name]
+        # TODO: remove this migration after 2022.9.28
+        _temp = {}
+        _changed = False
+        for k, v in conf_file_yaml.get("External_Programs").items():
+            _uuid = str(uuid.uuid4())
+            _k = k
+            _v = v
+            if isinstance(v, str):
+                continue
+            try:
+                uuid.UUID(k)
+            except (ValueError, TypeError):
+                _k = _uuid
+                _changed = True
+            if "id" not in v:
+                _v["id"] = _uuid
+                _changed = True
+            if "name" not in v:
+                _v["name"] = _v["executable"].split(".")[0]
+                _changed = True
+            _temp[_k] = _v
+
+        if _changed:
+            self.update_config(
+                config=conf_file_yaml,
+                key="External_Programs",
+                value=_temp
+            )
+        conf_file_yaml["External_Programs"] = _temp
+
+        miss_keys = Samples.config.keys() - conf_file_yaml.keys()
+        for key in miss_keys:
+            logging.warning(f"Key {key} is missing for bottle {name}, updating…")
+            self.update_config(
+                config=conf_file_yaml,
+                key=key,
+                value=Samples.config[key]
+            )
+
+        miss_params_keys = Samples.config["Parameters"].keys() - conf_file_yaml["Parameters"].keys()
+
+        for key in miss_params_keys:
+            '''
+            For each missing key in the bottle configuration, set
+            it to the default value.
+            '''
+            logging.warning(f"Parameters key {key} is missing for bottle {name}, updating…")
+            self.update_config(
+                config=conf_file_yaml,
+                key=key,
+                value=Samples.config["Parameters"][key],
+                scope="Parameters"
+            )
+
+        return conf_file_yaml
+
+    @staticmethod
+    def __setup_bottle(name: str, bottle_path: str):
+        """
+        Create the cache directories of a bottle and move the shader caches
+        left in its root by older versions, done once per session.
+        """
+        for p in [
+            os.path.join(bottle_path, "cache", "dxvk_state"),
+            os.path.join(bottle_path, "cache", "gl_shader"),
+            os.path.join(bottle_path, "cache", "mesa_shader"),
+            os.path.join(bottle_path, "cache", "vkd3d_shader"),
+        ]:
+            if not os.path.exists(p):
+                os.makedirs(p)
+
+        for c in os.listdir(bottle_path):
+            c = str(c)
+            if c.endswith(".dxvk-cache"):
+                shutil.move(os.path.join(bottle_path, c), os.path.join(bottle_path, "cache", "dxvk_state"))
+            elif "vkd3d-proton.cache" in c:
+                shutil.move(os.path.join(bottle_path, c), os.path.join(bottle_path, "cache", "vkd3d_shader"))
+            elif c == "GLCache":
+                shutil.move(os.path.join(bottle_path, c), os.path.join(bottle_path, "cache", "gl_shader"))
+
     # Update parameters in bottle config
     def update_config(
             self,
@@ -839,15 +884,15 @@ class Manager:
         Update parameters in bottle config. Use the scope argument to
         update the parameters in the specified scope (e.g. Parameters).
         A new key will be created if another already exists and fallback
-        is set to True.
+        is set to True. The change is written to disk by the config store
+        shortly after, together with the other changes made in the
+        meantime; wrap consecutive updates in config_store.batch() to
+        write them at once.
         TODO: move to bottle.py (Bottle manager)
         """
         _name = config.get('Name')
         logging.info(f"Setting Key {key}={value} for bottle {_name}…")
 
-        _config = config
-        wineboot = WineBoot(_config)
-        wineserver = WineServer(_config)
         bottle_path = ManagerUtils.get_bottle_path(config)
 
         if key == "sync":
@@ -856,29 +901,30 @@ class Manager:
             Sync type change requires wineserver restart or wine will fail
             to execute any command.
             '''
-            wineboot.kill()
-            wineserver.wait()
-
-        if scope != "":
-            if remove:
-                del config[scope][key]
-            elif config[scope].get(key) and fallback:
-                config[scope][f"{key}-{uuid.uuid4()}"] = value
+            session = BottleSession.get(config)
+            session.get_program(WineBoot).kill()
+            session.get_program(WineServer).wait()
+
+        config_path = os.path.join(bottle_path, "bottle.yml")
+        with self.config_store.edit(config_path, config, f"{scope}/{key}" if scope else key):
+            if scope != "":
+                if remove:
+                    del config[scope][key]
+                elif config[scope].get(key) and fallback:
+                    config[scope][f"{key}-{uuid.uuid4()}"] = value
+                else:
+                    config[scope][key] = value
             else:
-                config[scope][key] = value
-        else:
-            if remove:
-                del config[key]
-            elif config.get(key) and fallback:
-                config[f"{key}-{uuid.uuid4()}"] = value
-            else:
-                config[key] = value
+                if remove:
+                    del config[key]
+                elif config.get(key) and fallback:
+                    config[f"{key}-{uuid.uuid4()}"] = value
+                else:
+                    config[key] = value
 
-        with open(os.path.join(bottle_path, "bottle.yml"), "w") as conf_file:
-            yaml.dump(config, conf_file, indent=4)
-            conf_file.close()
+            config["Update_Date"] = str(datetime.now())
 
-        config["Update_Date"] = str(datetime.now())
+        BottleSession.get(config).clear_values()
 
         if config.get("Environment") == "Steam":
             config = self.steam_manager.update_bottle(config)
@@ -957,9 +1003,7 @@ class Manager:
 
         # write the bottle config file
         try:
-            with open(os.path.join(bottle_path, "bottle.yml"), "w") as conf_file:
-                yaml.dump(config, conf_file, indent=4)
-                conf_file.close()
+            ConfigStore.dump(os.path.join(bottle_path, "bottle.yml"), config)
         except (OSError, IOError, yaml.YAMLError, FileNotFoundError, PermissionError) as e:
             logging.error(f"Error writing config file {e}")
             return False
@@ -1160,10 +1204,11 @@ class Manager:
             config["Uninstallers"] = template["config"]["Uninstallers"]
 
         # initialize wineprefix
-        reg = Reg(config)
+        session = BottleSession.get(config)
+        reg = session.get_program(Reg)
         rk = RegKeys(config)
-        wineboot = WineBoot(config)
-        wineserver = WineServer(config)
+        wineboot = session.get_program(WineBoot)
+        wineserver = session.get_program(WineServer)
 
         # execute wineboot on the bottle path
         log_update(_("The Wine config is being updated…"))
@@ -1214,12 +1259,13 @@ class Manager:
             logging.info("Optimizing environment…")
             log_update(_("Optimizing environment…"))
             _blacklist_dll = ["winemenubuilder.exe", "mshtml"]  # avoid gecko, mono popups
-            for _dll in _blacklist_dll:
-                reg.add(
-                    key="HKEY_CURRENT_USER\\Software\\Wine\\DllOverrides",
-                    value=_dll,
-                    data=""
-                )
+            with reg.transaction():
+                for _dll in _blacklist_dll:
+                    reg.add(
+                        key="HKEY_CURRENT_USER\\Software\\Wine\\DllOverrides",
+                        value=_dll,
+                        data=""
+                    )
 
         # apply environment configuration
         logging.info(f"Applying environment: [{environment}]…")
@@ -1287,9 +1333,7 @@ class Manager:
             config["Layers"] = {}
 
         # save bottle config
-        with open(f"{bottle_complete_path}/bottle.yml", "w") as conf_file:
-            yaml.dump(config, conf_file, indent=4)
-            conf_file.close()
+        ConfigStore.dump(f"{bottle_complete_path}/bottle.yml", config)
 
         if versioning:
             # create first state if versioning enabled
@@ -1356,8 +1400,9 @@ class Manager:
         TODO: move to bottle.py (Bottle manager)
         """
         logging.info("Stopping bottle…")
-        wineboot = WineBoot(config)
-        wineserver = WineServer(config)
+        session = BottleSession.get(config)
+        wineboot = session.get_program(WineBoot)
+        wineserver = session.get_program(WineServer)
 
         wineboot.kill()
         wineserver.wait()
@@ -1413,9 +1458,7 @@ class Manager:
         new_config["Update_Date"] = str(datetime.now())
 
         try:
-            with open(os.path.join(bottle_path, "bottle.yml"), "w") as conf_file:
-                yaml.dump(new_config, conf_file, indent=4)
-                conf_file.close()
+            ConfigStore.dump(os.path.join(bottle_path, "bottle.yml"), new_config)
         except (OSError, IOError, yaml.YAMLError) as e:
             logging.error(f"Failed to repair bottle: {e}")
             return False
@@ -16,8 +16,6 @@
 #
 
 import os
-import urllib.request
-import http
 from typing import Union, NewType
 from gi.repository import GLib
 
@@ -25,6 +23,7 @@ from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
 from bottles.backend.repos.dependency import DependencyRepo
 from bottles.backend.repos.component import ComponentRepo
 from bottles.backend.repos.installer import InstallerRepo
+from bottles.backend.repos.cache import RepoCache
 from bottles.params import VERSION_NUM
 
 logging = Logger()
@@ -84,23 +83,30 @@ class RepositoryManager:
                 logging.error(f"Local {repo} path does not exist: {_path}")
 
     def __get_index(self):
+        """
+        Look for the index of each repository, preferring the one for the
+        current version. Indexes are fetched through the RepoCache, so the
+        cached ones are used straight away and revalidated in background.
+        """
         total = len(self.__repositories)
+        cache = RepoCache()
 
         for repo, data in self.__repositories.items():
             __index = os.path.join(data["url"], f"{VERSION_NUM}.yml")
             __fallback = os.path.join(data["url"], "index.yml")
 
-            try:
-                with urllib.request.urlopen(__index) as _:
-                    data["index"] = __index
+            candidates = [__index, __fallback]
+            if not cache.has(__index) and cache.has(__fallback):
+                # don't wait for the version index to show up, check it
+                # in background so it can be used from the next start
+                cache.revalidate(__index)
+                candidates = [__fallback]
+
+            for index in candidates:
+                if cache.get(index) is not None:
+                    data["index"] = index
                     if self.repo_fn_update is not None:
                         GLib.idle_add(self.repo_fn_update, total)
-            except (urllib.error.HTTPError, urllib.error.URLError):
-                try:
-                    with urllib.request.urlopen(__fallback) as _:
-                        data["index"] = __fallback
-                        if self.repo_fn_update is not None:
-                            GLib.idle_add(self.repo_fn_update, total)
-                except (urllib.error.HTTPError, urllib.error.URLError, http.client.RemoteDisconnected):
-                    logging.error(f"Could not get index for {repo} repository")
-                    continue
+                    break
+            else:
+                logging.error(f"Could not get index for {repo} repository")
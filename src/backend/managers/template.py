@@ -25,6 +25,7 @@ from pathlib import Path
 
 from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
 from bottles.backend.utils.manager import ManagerUtils
+from bottles.backend.utils.transfer import TreeCloner
 from bottles.backend.globals import Paths
 from bottles.backend.models.samples import Samples
 
@@ -55,13 +56,14 @@ class TemplateManager:
             "dosdevices",
             "states",
             ".fvs",
-            "*.yml"
+            ".snapshots",
+            "*.yml",
             ".*"
         ]
         _path = f"{Paths.templates}/{_uuid}"
         logging.info("Copying files …")
         with contextlib.suppress(FileNotFoundError):
-            shutil.copytree(bottle, _path, symlinks=True, ignore=shutil.ignore_patterns(*ignored))
+            TreeCloner(bottle, _path, symlinks=True, ignore=shutil.ignore_patterns(*ignored)).clone()
 
         template = {
             "uuid": _uuid,
@@ -166,5 +168,5 @@ class TemplateManager:
         bottle = ManagerUtils.get_bottle_path(config)
         _path = os.path.join(Paths.templates, template['uuid'])
 
-        shutil.copytree(_path, bottle, symlinks=True, dirs_exist_ok=True, ignore=shutil.ignore_patterns('.*'))
+        TreeCloner(_path, bottle, symlinks=True, ignore=shutil.ignore_patterns('.*')).clone()
         logging.info("Template unpacked successfully!")
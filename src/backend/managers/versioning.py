@@ -17,8 +17,12 @@
 
 import os
 from bottles.backend.utils import yaml
+import time
 import uuid
 import shutil
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 from typing import NewType
 from datetime import datetime
@@ -33,6 +37,8 @@ except (RuntimeError, GLib.GError):
     from bottles.operation_cli import OperationManager
 
 from bottles.backend.utils.file import FileUtils
+from bottles.backend.utils.hashing import HashCache
+from bottles.backend.utils.snapshot import SnapshotRepo
 from bottles.backend.models.result import Result
 from bottles.backend.utils.manager import ManagerUtils
 from bottles.backend.logger import Logger
@@ -40,11 +46,37 @@ from bottles.backend.logger import Logger
 logging = Logger()
 
 
+class StateBatch:
+    """
+    A state requested with VersioningManager.create_state_async, shared
+    by all the requests merged into it.
+    """
+
+    def __init__(self, message: str):
+        self.messages = [message]
+        self.started = False
+        self.result = None
+        self.__done = threading.Event()
+
+    def done(self, result: Result):
+        self.result = result
+        self.__done.set()
+
+    def wait(self) -> Result:
+        """Wait for the state to be created and return the result."""
+        self.__done.wait()
+        return self.result
+
+
 # noinspection PyTypeChecker
 class VersioningManager:
     # TODO: avoid instancing this class from the main manager when the old 
     #       versioning system will be deprecated
     
+    batch_delay = .5
+    __batches = {}
+    __batches_lock = threading.Lock()
+
     def __init__(self, window, manager):
         self.window = window
         self.manager = manager
@@ -61,13 +93,41 @@ class VersioningManager:
         return patterns
     
     @staticmethod
-    def is_initialized(config: dict):
+    def __get_repo(config: dict, no_init: bool = False):
+        """
+        Return the repository of the bottle states. Bottles on a CoW
+        filesystem use native snapshots (SnapshotRepo), unless they
+        already have FVS states; the others use FVS.
+        """
+        bottle_path = ManagerUtils.get_bottle_path(config)
+        if SnapshotRepo.exists(bottle_path):
+            return SnapshotRepo(bottle_path)
+
         try:
             repo = FVSRepo(
-                repo_path=ManagerUtils.get_bottle_path(config),
+                repo_path=bottle_path,
                 use_compression=config["Parameters"]["versioning_compression"],
                 no_init=True
             )
+            has_fvs_states = not repo.has_no_states
+        except FileNotFoundError:
+            has_fvs_states = False
+
+        if not has_fvs_states:
+            method = SnapshotRepo.get_method(bottle_path)
+            if method is not None:
+                return SnapshotRepo(bottle_path, method)
+
+        return FVSRepo(
+            repo_path=bottle_path,
+            use_compression=config["Parameters"]["versioning_compression"],
+            no_init=no_init
+        )
+
+    @staticmethod
+    def is_initialized(config: dict):
+        try:
+            repo = VersioningManager.__get_repo(config, no_init=True)
         except FileNotFoundError:
             return False
         return not repo.has_no_states
@@ -84,13 +144,47 @@ class VersioningManager:
             shutil.rmtree(states_path)
         return self.manager.update_config(config, "Versioning", False)
 
+    def create_state_async(self, config: dict, message: str = "No message") -> StateBatch:
+        """
+        Create a new state in a background thread and return a batch
+        to wait for. The state is taken after a short debounce delay:
+        the requests made for the same bottle until the state is ready
+        are merged in the same batch, as none of their callers is
+        allowed to modify the bottle before waiting for it.
+        """
+        key = ManagerUtils.get_bottle_path(config)
+        with self.__batches_lock:
+            batch = self.__batches.get(key)
+            if batch is not None:
+                if not batch.started:
+                    batch.messages.append(message)
+                return batch
+
+            batch = StateBatch(message)
+            self.__batches[key] = batch
+
+        def run():
+            time.sleep(self.batch_delay)
+            with self.__batches_lock:
+                batch.started = True
+            try:
+                res = self.create_state(config, message=", ".join(batch.messages))
+            except Exception as e:
+                logging.error(f"Cannot create the state: {e}")
+                res = Result(status=False, message=str(e))
+            finally:
+                with self.__batches_lock:
+                    del self.__batches[key]
+            batch.done(res)
+
+        threading.Thread(target=run, daemon=True).start()
+        return batch
+
     def create_state(self, config: dict, message: str = "No message"):
+        self.manager.config_store.flush()
         task_id = str(uuid.uuid4())
         patterns = self.__get_patterns(config)
-        repo = FVSRepo(
-            repo_path=ManagerUtils.get_bottle_path(config),
-            use_compression=config["Parameters"]["versioning_compression"]
-        )
+        repo = self.__get_repo(config)
         GLib.idle_add(
             self.__operation_manager.new_task,
             task_id,
@@ -124,17 +218,11 @@ class VersioningManager:
         """
         if not config.get("Versioning"):
             try:
-                repo = FVSRepo(
-                    repo_path=ManagerUtils.get_bottle_path(config),
-                    use_compression=config["Parameters"]["versioning_compression"]
-                )
+                repo = self.__get_repo(config)
             except FVSStateNotFound:
                 logging.warning("The FVS repository may be corrupted, trying to re-initialize it")
                 self.re_initialize(config)
-                repo = FVSRepo(
-                    repo_path=ManagerUtils.get_bottle_path(config),
-                    use_compression=config["Parameters"]["versioning_compression"]
-                )
+                repo = self.__get_repo(config)
             return Result(
                 status=True,
                 message=_("States list retrieved successfully!"),
@@ -159,13 +247,12 @@ class VersioningManager:
         return states
 
     def set_state(self, config: dict, state_id: int, after=False) -> Result:
+        # a pending write would overwrite the restored configuration
+        self.manager.config_store.flush()
         if not config.get("Versioning"):
             task_id = str(uuid.uuid4())
             patterns = self.__get_patterns(config)
-            repo = FVSRepo(
-                repo_path=ManagerUtils.get_bottle_path(config),
-                use_compression=config["Parameters"]["versioning_compression"]
-            )
+            repo = self.__get_repo(config)
             res = Result(
                 status=True,
                 message=_("State {0} restored successfully!").format(state_id)
@@ -200,47 +287,21 @@ class VersioningManager:
         bottle_index = self.get_index(config)
         state_index = self.get_state_files(config, state_id)
 
-        search_sources = list(range(int(state_id) + 1))
-        search_sources.reverse()
-
-        # check for removed and changed files
-        remove_files = []
-        edit_files = []
-        for file in bottle_index.get("Files"):
-            if file["file"] not in [file["file"] for file in state_index.get("Files")]:
-                remove_files.append(file)
-            elif file["checksum"] not in [file["checksum"] for file in state_index.get("Files")]:
-                edit_files.append(file)
-        logging.info(f"[{len(remove_files)}] files to remove.")
-        logging.info(f"[{len(edit_files)}] files to replace.")
-
-        # check for new files
-        add_files = []
-        for file in state_index.get("Files"):
-            if file["file"] not in [file["file"] for file in bottle_index.get("Files")]:
-                add_files.append(file)
-        logging.info(f"[{len(add_files)}] files to add.")
-
-        # perform file updates
-        for file in remove_files:
-            os.remove("%s/drive_c/%s" % (bottle_path, file["file"]))
-
-        for file in add_files:
-            for i in search_sources:
-                source = "%s/states/%s/drive_c/%s" % (bottle_path, str(state_id), file["file"])
-                target = "%s/drive_c/%s" % (bottle_path, file["file"])
-                shutil.copy2(source, target)
-
-        for file in edit_files:
-            for i in search_sources:
-                source = "%s/states/%s/drive_c/%s" % (
-                    bottle_path, str(i), file["file"])
-                if os.path.isfile(source):
-                    checksum = FileUtils().get_checksum(source)
-                    if file["checksum"] == checksum:
-                        break
-                target = "%s/drive_c/%s" % (bottle_path, file["file"])
-                shutil.copy2(source, target)
+        plan = self.__plan_legacy_restore(config, bottle_index, state_index, int(state_id))
+        logging.info(f"[{len(plan['remove'])}] files to remove.")
+        logging.info(f"[{len(plan['copy'])}] files to add or replace.")
+
+        task_id = str(uuid.uuid4())
+        GLib.idle_add(
+            self.__operation_manager.new_task,
+            task_id,
+            _("Restoring state {} …".format(state_id)),
+            False
+        )
+        try:
+            self.__apply_legacy_restore(plan, task_id)
+        finally:
+            GLib.idle_add(self.__operation_manager.remove_task, task_id)
 
         # update State in bottle config
         self.manager.update_config(config, "State", state_id)
@@ -260,6 +321,88 @@ class VersioningManager:
 
         return True
 
+    @staticmethod
+    def __plan_legacy_restore(config: dict, bottle_index: dict, state_index: dict, state_id: int) -> dict:
+        """
+        Compare the bottle and state indexes and return the files to
+        remove and the (source, target) copies to perform. The source of
+        a file is taken from the newest state (up to state_id) storing
+        the wanted version of it, according to the state indexes, so no
+        file has to be hashed.
+        """
+        bottle_path = ManagerUtils.get_bottle_path(config)
+        bottle_files = {f["file"]: f["checksum"] for f in bottle_index.get("Files", [])}
+        state_files = {f["file"]: f["checksum"] for f in state_index.get("Files", [])}
+        states_path = os.path.join(bottle_path, "states")
+        drive_path = os.path.join(bottle_path, "drive_c")
+
+        state_indexes = {state_id: state_files}
+
+        def get_state_checksum(i: int, file: str):
+            if i not in state_indexes:
+                index = VersioningManager.get_state_files(config, i)
+                state_indexes[i] = {f["file"]: f["checksum"] for f in index.get("Files", [])}
+            return state_indexes[i].get(file)
+
+        remove = [
+            os.path.join(drive_path, file)
+            for file in bottle_files if file not in state_files
+        ]
+        copy = []
+        for file, checksum in state_files.items():
+            if bottle_files.get(file) == checksum:
+                continue
+
+            fallback = None
+            source = None
+            for i in range(state_id, -1, -1):
+                candidate = os.path.join(states_path, str(i), "drive_c", file)
+                if not os.path.isfile(candidate):
+                    continue
+                if get_state_checksum(i, file) == checksum:
+                    source = candidate
+                    break
+                fallback = fallback or candidate
+
+            source = source or fallback
+            if source is None:
+                logging.warning(f"No state stores the file [{file}], skipping.")
+                continue
+            copy.append((source, os.path.join(drive_path, file)))
+
+        return {"remove": remove, "copy": copy}
+
+    def __apply_legacy_restore(self, plan: dict, task_id: str):
+        """Apply a restore plan, copying the files in parallel."""
+        total = len(plan["remove"]) + len(plan["copy"])
+        done = 0
+        last_update = 0
+        lock = threading.Lock()
+
+        def step():
+            nonlocal done, last_update
+            with lock:
+                done += 1
+                now = time.time()
+                if now - last_update < .1 and done < total:
+                    return
+                last_update = now
+                GLib.idle_add(self.__operation_manager.update_task, task_id, done, 1, total)
+
+        def copy(source: str, target: str):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            step()
+
+        for file in plan["remove"]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(file)
+            step()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for future in [pool.submit(copy, *c) for c in plan["copy"]]:
+                future.result()
+
     @staticmethod
     def get_state_files(config: dict, state_id: int, plain: bool = False) -> dict:
         """
@@ -283,6 +426,7 @@ class VersioningManager:
             "Update_Date": str(datetime.now()),
             "Files": []
         }
+        files = []
         for file in glob("%s/drive_c/**" % bottle_path, recursive=True):
             if not os.path.isfile(file):
                 continue
@@ -293,8 +437,11 @@ class VersioningManager:
             if file[len(bottle_path) + 9:].split("/")[0] in ["users"]:
                 continue
 
+            files.append(file)
+
+        for file, checksum in HashCache(bottle_path).files(files, "md5", prune=True).items():
             cur_index["Files"].append({
                 "file": file[len(bottle_path) + 9:],
-                "checksum": FileUtils().get_checksum(file)
+                "checksum": checksum
             })
         return cur_index
@@ -0,0 +1,169 @@
+# cache.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import time
+import hashlib
+import threading
+import contextlib
+import urllib.request
+from typing import Union
+from http.client import HTTPException
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.globals import Paths
+from bottles.backend.utils import yaml
+
+logging = Logger()
+
+
+class RepoCache:
+    """
+    On-disk cache for the repository indexes and manifests. Each resource
+    is stored with its ETag and Last-Modified headers. A cached resource
+    is served immediately and revalidated in the background with a
+    conditional request (once per session), so the updated copy is
+    picked up on the next access. Local (file://) repositories are never
+    cached.
+    """
+
+    path = os.path.join(Paths.cache, "repository")
+    timeout = 10
+
+    __revalidated = set()
+    __lock = threading.Lock()
+
+    def __init__(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def __paths(self, url: str) -> tuple:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{key}.data"), os.path.join(self.path, f"{key}.yml")
+
+    def __read_meta(self, url: str) -> dict:
+        _, meta_path = self.__paths(url)
+        try:
+            with open(meta_path, "r") as f:
+                meta = yaml.load(f)
+        except (FileNotFoundError, yaml.YAMLError):
+            return {}
+        if not isinstance(meta, dict) or meta.get("url") != url:
+            return {}
+        return meta
+
+    def __read(self, url: str) -> Union[bytes, None]:
+        data_path, _ = self.__paths(url)
+        try:
+            with open(data_path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def __write(self, url: str, data: Union[bytes, None], headers) -> None:
+        data_path, meta_path = self.__paths(url)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "checked": time.time()
+        }
+        try:
+            if data is not None:
+                with open(f"{data_path}.part", "wb") as f:
+                    f.write(data)
+                os.replace(f"{data_path}.part", data_path)
+            with open(f"{meta_path}.part", "w") as f:
+                yaml.dump(meta, f)
+            os.replace(f"{meta_path}.part", meta_path)
+        except OSError as e:
+            logging.warning(f"Cannot write repository cache for {url}: {e}")
+
+    @staticmethod
+    def __validators(meta: dict, headers) -> dict:
+        """Merge the cached validators with the ones sent with a 304."""
+        return {
+            "ETag": headers.get("ETag") or meta.get("etag"),
+            "Last-Modified": headers.get("Last-Modified") or meta.get("last_modified")
+        }
+
+    def has(self, url: str) -> bool:
+        """Return True if url is cached."""
+        data_path, _ = self.__paths(url)
+        return os.path.exists(data_path) and bool(self.__read_meta(url))
+
+    def fetch(self, url: str) -> Union[bytes, None]:
+        """
+        Fetch url from the network, using a conditional request if a
+        copy is cached. Returns the up-to-date content or None if the
+        resource cannot be fetched.
+        """
+        meta = self.__read_meta(url)
+        request = urllib.request.Request(url)
+        if meta and self.__read(url) is not None:
+            if meta.get("etag"):
+                request.add_header("If-None-Match", meta["etag"])
+            if meta.get("last_modified"):
+                request.add_header("If-Modified-Since", meta["last_modified"])
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as res:
+                data = res.read()
+                self.__write(url, data, res.headers)
+                return data
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                self.__write(url, None, self.__validators(meta, e.headers))
+                return self.__read(url)
+            logging.debug(f"Cannot fetch {url}: {e}")
+        except (urllib.error.URLError, HTTPException, OSError) as e:
+            logging.debug(f"Cannot fetch {url}: {e}")
+        return None
+
+    def revalidate(self, url: str) -> None:
+        """Revalidate url in a background thread, once per session."""
+        with self.__lock:
+            if url in self.__revalidated:
+                return
+            self.__revalidated.add(url)
+
+        threading.Thread(target=self.fetch, args=(url,), daemon=True).start()
+
+    def get(self, url: str, offline: bool = False) -> Union[bytes, None]:
+        """
+        Return the content of url. Cached copies are returned immediately
+        and revalidated in the background, unless offline is True. Not
+        cached resources are fetched synchronously.
+        """
+        if url.startswith("file://"):
+            with contextlib.suppress(urllib.error.URLError, OSError):
+                with urllib.request.urlopen(url) as res:
+                    return res.read()
+            return None
+
+        data = self.__read(url) if self.__read_meta(url) else None
+        if data is not None:
+            if not offline:
+                self.revalidate(url)
+            return data
+
+        if offline:
+            return None
+
+        with self.__lock:
+            self.__revalidated.add(url)
+        return self.fetch(url)
+
@@ -16,10 +16,9 @@
 #
 
 from bottles.backend.utils import yaml
-import urllib.request
-from http.client import RemoteDisconnected
 
 from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.repos.cache import RepoCache
 
 logging = Logger()
 
@@ -29,28 +28,37 @@ class Repo:
 
     def __init__(self, url: str, index: str, offline: bool = False):
         self.url = url
+        self.offline = offline
+        self.cache = RepoCache()
         self.catalog = self.__get_catalog(index, offline)
 
     def __get_catalog(self, index: str, offline: bool = False):
-        if index in ["", None] or offline:
+        if index in ["", None]:
+            return {}
+
+        res = self.cache.get(index, offline)
+        if res is None:
+            logging.error(f"Cannot fetch {self.name} repository index.")
             return {}
 
         try:
-            with urllib.request.urlopen(index) as url:
-                index = yaml.load(url.read())
-                logging.info(f"Catalog {self.name} loaded")
-                return index
-        except (urllib.error.HTTPError, urllib.error.URLError, yaml.YAMLError):
+            index = yaml.load(res)
+            logging.info(f"Catalog {self.name} loaded")
+            return index
+        except yaml.YAMLError:
             logging.error(f"Cannot fetch {self.name} repository index.")
             return {}
 
     def get_manifest(self, url: str, plain: bool = False):
+        res = self.cache.get(url, self.offline)
+        if res is None:
+            logging.error(f"Cannot fetch {self.name} manifest.")
+            return
+
         try:
-            with urllib.request.urlopen(url) as u:
-                res = u.read()
-                if plain:
-                    return res.decode("utf-8")
-                return yaml.load(res)
-        except (urllib.error.HTTPError, urllib.error.URLError, RemoteDisconnected, yaml.YAMLError):
+            if plain:
+                return res.decode("utf-8")
+            return yaml.load(res)
+        except (UnicodeDecodeError, yaml.YAMLError):
             logging.error(f"Cannot fetch {self.name} manifest.")
             return
@@ -29,6 +29,7 @@ from bottles.backend.wine.executor import WineExecutor
 from bottles.backend.wine.wineboot import WineBoot
 from bottles.backend.wine.wineserver import WineServer
 from bottles.backend.wine.reg import Reg
+from bottles.backend.wine.session import BottleSession
 
 logging = Logger()
 
@@ -61,8 +62,9 @@ class Runner:
         active DLLComponents (dxvk, dxvk-nvapi, vkd3d…).
         """
         logging.info(f"Doing runner update for bottle: {config['Name']}")
-        wineboot = WineBoot(config)
-        wineserver = WineServer(config)
+        session = BottleSession.get(config)
+        wineboot = session.get_program(WineBoot)
+        wineserver = session.get_program(WineServer)
         
         if not runner.startswith("sys-"):
             runner_path = ManagerUtils.get_runner_path(runner)
@@ -91,20 +93,25 @@ class Runner:
             value=runner
         ).data["config"]
 
+        # the config may be a new dict (e.g. Steam bottles), the session
+        # used from now on must be the one install_dll_component gets
+        session = BottleSession.get(up_config)
+
         # perform a prefix update
-        wineboot.update()
+        session.get_program(WineBoot).update()
 
-        # re-initialize DLLComponents
-        if config["Parameters"]["dxvk"]:
-            manager.install_dll_component(config, "dxvk", overrides_only=True)
-        if config["Parameters"]["dxvk_nvapi"]:
-            manager.install_dll_component(config, "nvapi", overrides_only=True)
-        if config["Parameters"]["vkd3d"]:
-            manager.install_dll_component(config, "vkd3d", overrides_only=True)
+        # re-initialize DLLComponents, with a single registry import
+        with session.get_program(Reg).transaction():
+            if up_config["Parameters"]["dxvk"]:
+                manager.install_dll_component(up_config, "dxvk", overrides_only=True)
+            if up_config["Parameters"]["dxvk_nvapi"]:
+                manager.install_dll_component(up_config, "nvapi", overrides_only=True)
+            if up_config["Parameters"]["vkd3d"]:
+                manager.install_dll_component(up_config, "vkd3d", overrides_only=True)
 
         # enable Steam runtime if using Proton
         if "proton" in runner.lower() and RuntimeManager.get_runtimes("steam"):
-            manager.update_config(config, "use_steam_runtime", True, "Parameters")
+            manager.update_config(up_config, "use_steam_runtime", True, "Parameters")
 
         return Result(
             status=True,
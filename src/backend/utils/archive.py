@@ -0,0 +1,551 @@
+# archive.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import os
+import stat
+import time
+import gzip
+import uuid
+import queue
+import tarfile
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.utils import yaml
+from bottles.backend.utils.hashing import Hasher
+
+try:
+    import zstandard
+    zstd_available = True
+except ImportError:
+    zstd_available = False
+
+logging = Logger()
+
+MANIFEST_NAME = ".bottles-backup.yml"
+HASH_ALGORITHM = "sha256"
+
+
+# the supported codecs and the extension of their archives
+CODECS = {"gzip": ".tar.gz", "zstd": ".tar.zst"}
+
+
+def check_codec(codec: str):
+    """Raise ValueError if codec cannot be used."""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec: {codec}")
+    if codec == "zstd" and not zstd_available:
+        logging.error("zstd not available: the zstandard Python module is not installed.")
+        raise ValueError("zstd not available")
+
+
+def get_codec(path: str, codec: str = None) -> str:
+    """
+    Return the codec to use for an archive: the one of its extension if
+    known, the given one (gzip by default) otherwise.
+    """
+    if path.endswith((".tar.zst", ".tar.zstd")):
+        codec = "zstd"
+    elif path.endswith((".tar.gz", ".tgz")):
+        codec = "gzip"
+    codec = codec or "gzip"
+    check_codec(codec)
+    return codec
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    File-like object compressing the written data with gzip on a pool of
+    threads (as pigz does). Data is split in chunks, each one is
+    compressed to an independent gzip member; members are written in
+    order, so the output is a standard multi-member gzip file.
+    """
+
+    chunk_size = 4 * 1024 * 1024
+
+    def __init__(self, fileobj, level: int = 6, workers: int = None):
+        super().__init__()
+        self.fileobj = fileobj
+        self.level = max(1, min(9, level))
+        self.workers = workers or os.cpu_count() or 1
+        self.__pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.__pending = deque()
+        self.__buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        self.__buffer += data
+        while len(self.__buffer) >= self.chunk_size:
+            self.__submit(bytes(self.__buffer[:self.chunk_size]))
+            del self.__buffer[:self.chunk_size]
+        return len(data)
+
+    def __submit(self, chunk: bytes):
+        self.__pending.append(self.__pool.submit(gzip.compress, chunk, self.level, mtime=0))
+        # bound the memory used by the chunks waiting to be written
+        while len(self.__pending) > self.workers * 2:
+            self.fileobj.write(self.__pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.__buffer:
+                self.__submit(bytes(self.__buffer))
+                self.__buffer.clear()
+            while self.__pending:
+                self.fileobj.write(self.__pending.popleft().result())
+        finally:
+            self.__pool.shutdown()
+            super().close()
+
+
+class _HashingReader:
+    """Wrap a file object to hash and account the data read from it."""
+
+    def __init__(self, fileobj, on_read: callable):
+        self.fileobj = fileobj
+        self.hash = Hasher.new(HASH_ALGORITHM)
+        self.on_read = on_read
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.hash.update(data)
+        self.on_read(len(data))
+        return data
+
+
+class ArchiveWriter:
+    """
+    Write a tar archive streamed through a parallel compressor: gzip
+    chunks compressed on all the cores, or zstd with its own threads
+    (requires the zstandard module). The codec is the one of the path
+    extension, or the given one for other paths. Paths are added with
+    an explicit arcname, so the process working directory is never
+    changed. A manifest with the hash of every regular file is added as
+    the last member, so an archive without it is incomplete: if an error
+    happens while it is written, the output file is removed instead.
+    The number of processed bytes is sent to fn_update(done, total) at
+    most every update_interval seconds.
+    If the manifest of a previous archive is passed as base, the regular
+    files which did not change since then are left out, and the new
+    archive is chained to the base one: see ArchiveReader.
+    """
+
+    update_interval = .25
+    copy_buffer = 1024 * 1024
+
+    def __init__(self, path: str, level: int = 6, fn_update: callable = None, base: dict = None,
+                 codec: str = None):
+        self.path = path
+        self.codec = get_codec(path, codec)
+        self.level = level
+        self.fn_update = fn_update
+        self.base = base
+        self.manifest = {
+            "version": 1,
+            "id": str(uuid.uuid4()),
+            "algorithm": HASH_ALGORITHM,
+            "codec": self.codec,
+            "base": None,
+            "base_id": None,
+            "files": {}
+        }
+        if base:
+            self.manifest["base"] = base["path"]
+            self.manifest["base_id"] = base["id"]
+        self.__done = 0
+        self.__total = 0
+        self.__last_update = 0
+        self.__file = open(path, "wb")
+        if self.codec == "zstd":
+            cctx = zstandard.ZstdCompressor(level=level, threads=-1)
+            self.__stream = cctx.stream_writer(self.__file, closefd=False)
+        else:
+            self.__stream = ParallelGzipWriter(self.__file, level)
+        self.__tar = tarfile.open(fileobj=self.__stream, mode="w|", copybufsize=self.copy_buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    @staticmethod
+    def scan(src: str, arcname: str, exclude: callable = None) -> list:
+        """
+        Return the (path, arcname) entries of the given tree, skipping
+        the ones for which exclude(arcname) is True. Symlinks are not
+        followed.
+        """
+        entries = [(src, arcname)]
+        for root, dirs, files in os.walk(src):
+            rel = os.path.relpath(root, src)
+            _root = arcname if rel == "." else os.path.join(arcname, rel)
+            for name in sorted(dirs) + sorted(files):
+                _arcname = os.path.join(_root, name)
+                if exclude is not None and exclude(_arcname):
+                    if name in dirs:
+                        dirs.remove(name)
+                    continue
+                entries.append((os.path.join(root, name), _arcname))
+            dirs.sort()
+        return entries
+
+    def add_entries(self, entries: list):
+        """
+        Add the given (path, arcname) entries to the archive. Directories
+        and links are always added, regular files only if they changed
+        since the base archive.
+        """
+        base_files = self.base["files"] if self.base else {}
+        for path, arcname in entries:
+            with contextlib.suppress(OSError):
+                st = os.lstat(path)
+                if stat.S_ISREG(st.st_mode) and not self.__unchanged(base_files.get(arcname), st):
+                    self.__total += st.st_size
+
+        for path, arcname in entries:
+            try:
+                st = os.lstat(path)
+            except FileNotFoundError:
+                # removed while the backup is running
+                continue
+
+            # unchanged files are left out before gettarinfo is called: it
+            # registers the inode, and the other names of a hardlinked file
+            # would be stored as links to a member missing in this archive
+            known = base_files.get(arcname)
+            if stat.S_ISREG(st.st_mode) and known and known["size"] == st.st_size:
+                if known["mtime"] == st.st_mtime or known["hash"] == Hasher.file(path, HASH_ALGORITHM):
+                    self.manifest["files"][arcname] = dict(known, mtime=st.st_mtime)
+                    continue
+
+            try:
+                tarinfo = self.__tar.gettarinfo(path, arcname)
+            except FileNotFoundError:
+                continue
+            if tarinfo is None:
+                continue
+
+            if not tarinfo.isreg():
+                self.__tar.addfile(tarinfo)
+                continue
+
+            with open(path, "rb") as f:
+                reader = _HashingReader(f, self.__account)
+                self.__tar.addfile(tarinfo, reader)
+            self.manifest["files"][arcname] = {
+                "size": tarinfo.size,
+                "mtime": tarinfo.mtime,
+                "hash": reader.hash.hexdigest()
+            }
+
+    @staticmethod
+    def __unchanged(known: dict, st: os.stat_result) -> bool:
+        return bool(known) and known["size"] == st.st_size and known["mtime"] == st.st_mtime
+
+    def add_bytes(self, arcname: str, data: bytes):
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.size = len(data)
+        tarinfo.mtime = int(time.time())
+        tarinfo.mode = 0o644
+        self.__tar.addfile(tarinfo, io.BytesIO(data))
+
+    def __account(self, size: int):
+        self.__done += size
+        now = time.time()
+        if self.fn_update is None or now - self.__last_update < self.update_interval:
+            return
+        self.__last_update = now
+        self.fn_update(self.__done, max(self.__total, 1))
+
+    def close(self):
+        if self.__file.closed:
+            return
+        try:
+            self.add_bytes(MANIFEST_NAME, yaml.dump(self.manifest).encode("utf-8"))
+            self.__tar.close()
+            self.__stream.close()
+            self.__file.close()
+        except BaseException:
+            self.abort()
+            raise
+        if self.fn_update is not None:
+            self.fn_update(self.__total, max(self.__total, 1))
+
+    def abort(self):
+        """Close the archive without the manifest and remove the output file."""
+        if self.__file.closed and self.__tar.closed and self.__stream.closed:
+            return
+        self.__file.close()
+        # what is still buffered can't be written anymore
+        for f in [self.__stream, self.__tar]:
+            with contextlib.suppress(OSError, ValueError):
+                f.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+
+class _DecompressPipe:
+    """
+    File-like object returning the decompressed content of a file. The
+    decompression runs on its own thread, a few chunks ahead of the
+    reader, so it overlaps with the extraction of the files.
+    """
+
+    chunk_size = 1024 * 1024
+    queue_size = 16
+
+    def __init__(self, file, codec: str):
+        self.file = file
+        self.codec = codec
+        self.__queue = queue.Queue(maxsize=self.queue_size)
+        self.__stop = threading.Event()
+        self.__chunk = b""
+        self.__offset = 0
+        self.__eof = False
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __open(self):
+        if self.codec == "zstd":
+            return zstandard.ZstdDecompressor().stream_reader(self.file, closefd=False)
+        if self.codec == "gzip":
+            return gzip.GzipFile(fileobj=self.file, mode="rb")
+        return self.file
+
+    def __put(self, item) -> bool:
+        while not self.__stop.is_set():
+            with contextlib.suppress(queue.Full):
+                self.__queue.put(item, timeout=.1)
+                return True
+        return False
+
+    def __run(self):
+        try:
+            stream = self.__open()
+            while True:
+                data = stream.read(self.chunk_size)
+                if not data or not self.__put(data):
+                    break
+        except Exception as e:
+            self.__put(e)
+            return
+        self.__put(None)
+
+    def read(self, size: int = -1) -> bytes:
+        parts = []
+        while size != 0:
+            if self.__offset >= len(self.__chunk):
+                if self.__eof:
+                    break
+                item = self.__queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                if item is None:
+                    self.__eof = True
+                    break
+                self.__chunk, self.__offset = item, 0
+                continue
+
+            available = len(self.__chunk) - self.__offset
+            n = available if size < 0 else min(size, available)
+            parts.append(self.__chunk[self.__offset:self.__offset + n])
+            self.__offset += n
+            if size > 0:
+                size -= n
+        return b"".join(parts)
+
+    def close(self):
+        self.__stop.set()
+        self.__thread.join()
+
+
+class ArchiveReader:
+    """
+    Read a tar archive written by ArchiveWriter, or any other tar.gz.
+    The codec is detected from the content, the archive is decompressed
+    once, on a separate thread, while the members are extracted.
+    The extraction is done by hand instead of using TarFile.extract:
+    members which would be written outside of the destination (absolute
+    paths, "..", paths through links, hardlinks to links) and special
+    files are rejected, existing files are replaced and never written through,
+    the files are preallocated and the setuid/setgid bits dropped.
+    The progress is sent to fn_update(done, total, rate) with the read
+    bytes of the archive and the extraction speed in bytes/s.
+    """
+
+    magic = {
+        b"\x1f\x8b": "gzip",
+        b"\x28\xb5\x2f\xfd": "zstd"
+    }
+    copy_buffer = 1024 * 1024
+    update_interval = .25
+
+    def __init__(self, path: str, fn_update: callable = None):
+        self.path = path
+        self.fn_update = fn_update
+        self.manifest = {}
+        self.rejected = []
+        self.__written = 0
+        self.__start = 0
+        self.__last_update = 0
+
+    def __get_codec(self, file) -> str:
+        head = file.read(4)
+        file.seek(0)
+        codec = next((c for m, c in self.magic.items() if head.startswith(m)), None)
+        if codec is not None:
+            check_codec(codec)
+        return codec
+
+    def extract(self, dest: str, wanted: callable = None) -> set:
+        """
+        Extract the members for which wanted(member) is True (all of them
+        by default) in dest, return the names of the extracted ones. The
+        archive manifest, if any, is loaded in self.manifest.
+        """
+        extracted = set()
+        directories = []
+        dest = os.path.realpath(dest)
+        total = os.path.getsize(self.path)
+        self.__start = time.time()
+
+        with open(self.path, "rb") as file:
+            pipe = _DecompressPipe(file, self.__get_codec(file))
+            try:
+                with tarfile.open(fileobj=pipe, mode="r|", copybufsize=self.copy_buffer) as tar:
+                    for member in tar:
+                        if member.name == MANIFEST_NAME:
+                            self.manifest = yaml.load(tar.extractfile(member)) or {}
+                            continue
+                        if wanted is not None and not wanted(member):
+                            continue
+
+                        path = self.__get_safe_path(member, dest)
+                        if path is None:
+                            logging.warning(f"Rejected unsafe archive member: {member.name}")
+                            self.rejected.append(member.name)
+                            continue
+
+                        self.__extract_member(tar, member, path, dest)
+                        if member.isdir():
+                            directories.append((member, path))
+                        extracted.add(member.name)
+                        self.__update(file.tell(), total)
+            finally:
+                pipe.close()
+
+        # directories are restored last, as the extraction touches them
+        for member, path in reversed(directories):
+            if os.path.islink(path):
+                continue
+            with contextlib.suppress(OSError):
+                os.chmod(path, member.mode & 0o777 | 0o700)
+                os.utime(path, (member.mtime, member.mtime))
+
+        self.__update(total, total, force=True)
+        return extracted
+
+    @staticmethod
+    def __is_safe_name(name: str) -> bool:
+        return bool(name) and not os.path.isabs(name) and ".." not in name.split("/")
+
+    def __get_safe_path(self, member: tarfile.TarInfo, dest: str):
+        """Return where member has to be extracted, None if it is unsafe."""
+        if not (member.isreg() or member.isdir() or member.issym() or member.islnk()):
+            return None
+        if not self.__is_safe_name(member.name):
+            return None
+        if member.islnk() and not self.__is_safe_name(member.linkname):
+            return None
+
+        path = os.path.join(dest, member.name.rstrip("/"))
+        paths = [path]
+        if member.islnk():
+            target = os.path.join(dest, member.linkname)
+            # os.link does not follow symlinks: linking one would plant a
+            # copy of it (e.g. to a file outside of dest) under a new name
+            if os.path.islink(target) or not os.path.isfile(target):
+                return None
+            paths.append(target)
+        # the parents must not be (or be reached through) links to the outside
+        for _path in paths:
+            parent = os.path.realpath(os.path.dirname(_path))
+            if os.path.commonpath([parent, dest]) != dest:
+                return None
+        return path
+
+    def __extract_member(self, tar: tarfile.TarFile, member: tarfile.TarInfo, path: str, dest: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if member.isdir():
+            if not os.path.isdir(path) or os.path.islink(path):
+                self.__remove(path)
+                os.makedirs(path, 0o700)
+            return
+
+        self.__remove(path)
+        if member.issym():
+            os.symlink(member.linkname, path)
+        elif member.islnk():
+            os.link(os.path.join(dest, member.linkname), path)
+        else:
+            self.__write_file(tar.extractfile(member), member, path)
+
+    def __write_file(self, src, member: tarfile.TarInfo, path: str):
+        # the path was unlinked: O_EXCL and O_NOFOLLOW make sure the data
+        # is never written through a link created in the meantime
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW | os.O_CLOEXEC, 0o600)
+        with open(fd, "wb", buffering=0) as f:
+            if member.size and hasattr(os, "posix_fallocate"):
+                with contextlib.suppress(OSError):
+                    os.posix_fallocate(fd, 0, member.size)
+            while True:
+                data = src.read(self.copy_buffer)
+                if not data:
+                    break
+                f.write(data)
+                self.__written += len(data)
+            os.fchmod(fd, member.mode & 0o777)
+        os.utime(path, (member.mtime, member.mtime), follow_symlinks=False)
+
+    @staticmethod
+    def __remove(path: str):
+        if os.path.isdir(path) and not os.path.islink(path):
+            return
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+
+    def __update(self, done: int, total: int, force: bool = False):
+        now = time.time()
+        if self.fn_update is None or (not force and now - self.__last_update < self.update_interval):
+            return
+        self.__last_update = now
+        rate = self.__written / max(now - self.__start, .001)
+        self.fn_update(done, max(total, 1), rate)
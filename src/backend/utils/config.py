@@ -0,0 +1,178 @@
+# config.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import copy
+import atexit
+import tempfile
+import threading
+import contextlib
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.utils import yaml
+
+logging = Logger()
+
+
+class ConfigStore:
+    """
+    Write the bottle configurations to disk. Changes are recorded with
+    edit() and flushed delay seconds after the last one, so a burst of
+    updates results in a single write. Inside a batch() the flush is
+    held until the outermost batch ends, then done right away, so other
+    processes (e.g. bottles-cli) read the new configuration at once.
+    The data to write is copied when the edit ends, in the thread which
+    made it; a write which fails is retried up to max_retries times.
+
+    Files are written to a temporary file which is synced and renamed
+    over the configuration, so a crash never leaves a truncated file.
+    Pending changes are flushed at exit, call flush() before reading
+    the configuration files from disk (versioning, backups…).
+    """
+
+    delay = .5
+    max_retries = 3
+
+    def __init__(self, fn_written: callable = None):
+        self.__fn_written = fn_written
+        self.__lock = threading.RLock()
+        self.__local = threading.local()
+        self.__pending = {}
+        atexit.register(self.flush)
+
+    @staticmethod
+    def dump(path: str, config: dict):
+        """Atomically write config as YAML to path."""
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+
+        fd, tmp = tempfile.mkstemp(prefix=".bottle-", suffix=".yml.part", dir=os.path.dirname(path))
+        try:
+            os.fchmod(fd, mode)
+            with os.fdopen(fd, "w") as f:
+                yaml.dump(config, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+            raise
+
+    @contextlib.contextmanager
+    def edit(self, path: str, config: dict, key: str):
+        """
+        Mark key of config as modified, the changes made to config in the
+        with block are then written to path.
+        """
+        with self.__lock:
+            yield config
+            entry = self.__pending.setdefault(path, {"config": config, "keys": set(), "timer": None, "retries": 0})
+            entry["config"] = config
+            entry["data"] = self.__snapshot(config)
+            entry["keys"].add(key)
+            entry["retries"] = 0
+
+            if entry["timer"] is not None:
+                entry["timer"].cancel()
+                entry["timer"] = None
+
+            if getattr(self.__local, "depth", 0) > 0:
+                self.__local.paths.add(path)
+                return
+
+            self.__schedule(path, entry, self.delay)
+
+    def __schedule(self, path: str, entry: dict, delay: float):
+        entry["timer"] = threading.Timer(delay, self.flush, args=(path,))
+        entry["timer"].daemon = True
+        entry["timer"].start()
+
+    @staticmethod
+    def __snapshot(config: dict) -> dict:
+        """Copy config, retrying if another thread changes it meanwhile."""
+        for _ in range(3):
+            with contextlib.suppress(RuntimeError):
+                return copy.deepcopy(config)
+        return copy.deepcopy(config)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Hold the writes of the edits made in the with block (by this thread) until it ends."""
+        if getattr(self.__local, "depth", 0) == 0:
+            self.__local.depth = 0
+            self.__local.paths = set()
+        self.__local.depth += 1
+        try:
+            yield
+        finally:
+            self.__local.depth -= 1
+            if self.__local.depth == 0:
+                for path in self.__local.paths:
+                    self.flush(path)
+
+    def get_dirty_keys(self, path: str) -> set:
+        """Return the keys modified since the last write of path."""
+        with self.__lock:
+            entry = self.__pending.get(path)
+            return set(entry["keys"]) if entry else set()
+
+    def flush(self, path: str = None):
+        """Write the pending changes of path (or of every file) now."""
+        with self.__lock:
+            paths = [path] if path is not None else list(self.__pending)
+            entries = []
+            for _path in paths:
+                entry = self.__pending.pop(_path, None)
+                if entry is None:
+                    continue
+                if entry["timer"] is not None:
+                    entry["timer"].cancel()
+                entries.append((_path, entry))
+
+            # the lock is held while writing, so the writes of a file
+            # are never reordered
+            written = []
+            for _path, entry in entries:
+                try:
+                    self.dump(_path, entry["data"])
+                except (OSError, yaml.YAMLError) as e:
+                    self.__retry(_path, entry, e)
+                    continue
+                written.append(entry["config"])
+
+        if self.__fn_written:
+            for config in written:
+                self.__fn_written(config)
+
+    def __retry(self, path: str, entry: dict, error: Exception):
+        """Queue a failed write again, unless a newer change is pending."""
+        newer = self.__pending.get(path)
+        if newer is not None:
+            newer["keys"] |= entry["keys"]
+            return
+
+        entry["retries"] += 1
+        if entry["retries"] > self.max_retries:
+            logging.error(f"Could not write {path}: {error}")
+            return
+
+        logging.warning(f"Could not write {path}, retrying: {error}")
+        self.__pending[path] = entry
+        self.__schedule(path, entry, self.delay * 2 ** entry["retries"])
@@ -31,17 +31,9 @@ class DisplayUtils:
     @staticmethod
     def check_nvidia_device():
         """Check if there is an nvidia device connected"""
-        _query = "NVIDIA Corporation".lower()
-        _proc = subprocess.Popen(
-            "lspci | grep 'VGA'",
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True
-        ).communicate()[0].decode("utf-8").lower()
-
-        if _query in _proc:
-            return True
-        return False
+        # imported here as globals imports this module
+        from bottles.backend.utils.hardware import HardwareInventory
+        return HardwareInventory.get().has_vga("nvidia")
 
     @staticmethod
     def display_server_type():
@@ -18,11 +18,12 @@
 import os
 import time
 import shutil
-import hashlib
 
 from typing import Union
 from pathlib import Path
 
+from bottles.backend.utils.hashing import Hasher
+
 
 class FileUtils:
     """
@@ -35,15 +36,7 @@ class FileUtils:
         """
         This function returns the MD5 checksum of the given file.
         """
-        checksum = hashlib.md5()
-
-        try:
-            with open(file, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    checksum.update(chunk)
-            return checksum.hexdigest().lower()
-        except FileNotFoundError:
-            return None
+        return Hasher.file(file, "md5")
 
     @staticmethod
     def use_insensitive_ext(string):
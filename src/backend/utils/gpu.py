@@ -15,9 +15,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import subprocess
-
 from bottles.backend.utils.vulkan import VulkanUtils  # pyright: reportMissingImports=false
+from bottles.backend.utils.hardware import HardwareInventory
 from bottles.backend.logger import Logger
 
 logging = Logger()
@@ -25,30 +24,12 @@ logging = Logger()
 
 # noinspection PyTypeChecker
 class GPUUtils:
-    __vendors = {
-        "nvidia": "NVIDIA Corporation",
-        "amd": "Advanced Micro Devices, Inc.",
-        "intel": "Intel Corporation"
-    }
-
     def __init__(self):
+        self.hw = HardwareInventory.get()
         self.vk = VulkanUtils()
 
     def list_all(self):
-        found = []
-        for _vendor in self.__vendors:
-            _proc = subprocess.Popen(
-                f"lspci | grep '{self.__vendors[_vendor]}'",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True
-            )
-            stdout, stderr = _proc.communicate()
-
-            if len(stdout) > 0:
-                found.append(_vendor)
-
-        return found
+        return self.hw.get_vendors()
 
     @staticmethod
     def assume_discrete(vendors: list):
@@ -60,32 +41,13 @@ class GPUUtils:
             return {"integrated": "intel", "discrete": "amd"}
         return {}
 
-    @staticmethod
-    def is_nouveau():
-        _proc = subprocess.Popen(
-            "lsmod | grep nouveau",
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True
-        )
-        stdout, stderr = _proc.communicate()
-        if len(stdout) > 0:
+    def is_nouveau(self):
+        if self.hw.is_nouveau:
             logging.warning("Nouveau driver detected, this may cause issues")
             return True
         return False
 
     def get_gpu(self):
-        checks = {
-            "nvidia": {
-                "query": "(VGA|3D).*NVIDIA"
-            },
-            "amd": {
-                "query": "(VGA|3D).*AMD/ATI"
-            },
-            "intel": {
-                "query": "(VGA|3D).*Intel"
-            }
-        }
         gpus = {
             "nvidia": {
                 "vendor": "nvidia",
@@ -124,18 +86,9 @@ class GPUUtils:
             gpus["nvidia"]["envs"] = {"DRI_PRIME": "1"}
             gpus["nvidia"]["icd"] = ""
 
-        for _check in checks:
-            _query = checks[_check]["query"]
-            _proc = subprocess.Popen(
-                f"lspci | grep -iP '{_query}'",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True
-            )
-            stdout, stderr = _proc.communicate()
-            if len(stdout) > 0:
-                found.append(_check)
-                result["vendors"][_check] = gpus[_check]
+        for _vendor in self.hw.get_gpu_vendors():
+            found.append(_vendor)
+            result["vendors"][_vendor] = gpus[_vendor]
 
         if len(found) >= 2:
             _discrete = self.assume_discrete(found)
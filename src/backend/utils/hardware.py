@@ -0,0 +1,247 @@
+# hardware.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import json
+import threading
+from glob import glob
+from typing import NamedTuple
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.globals import Paths
+from bottles.backend.utils import yaml
+
+logging = Logger()
+
+
+class PciDevice(NamedTuple):
+    slot: str
+    vendor: str
+    device_class: int
+    driver: str
+
+    @property
+    def is_gpu(self) -> bool:
+        # VGA compatible and 3D controllers, as matched by "lspci | grep -P '(VGA|3D)'"
+        return self.device_class >> 8 in (0x0300, 0x0302)
+
+
+class HardwareInventory:
+    """
+    Inventory of the hardware facts needed to build the environment of a
+    command: the PCI devices (vendor, class and bound driver) read from
+    sysfs and the Vulkan ICD loaders found on the system. It replaces the
+    lspci/lsmod processes and the ICD globs run for every command.
+
+    The inventory is read once per session and saved in the cache
+    directory, keyed on the kernel release and boot id (and on the ICD
+    directories, which change when a driver is installed), so it is only
+    read from the system again after a reboot or a driver update.
+    """
+
+    path = os.path.join(Paths.cache, "hardware.yml")
+    version = 1
+
+    vendor_ids = {
+        "0x10de": "nvidia",
+        "0x1002": "amd",
+        "0x8086": "intel"
+    }
+
+    vk_icd_dirs = [
+        "/usr/share/vulkan",
+        "/etc/vulkan",
+        "/usr/local/share/vulkan",
+        "/usr/local/etc/vulkan"
+    ]
+    if "FLATPAK_ID" in os.environ:
+        vk_icd_dirs += [
+            "/usr/lib/x86_64-linux-gnu/GL/vulkan",
+            "/usr/lib/i386-linux-gnu/GL/vulkan",
+        ]
+
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "HardwareInventory":
+        """Return the inventory of the session."""
+        with cls.__instance_lock:
+            if cls.__instance is None:
+                cls.__instance = cls()
+            return cls.__instance
+
+    def __init__(self):
+        key = self.__get_key()
+        data = self.__load(key)
+        if data is None:
+            data = {
+                "key": key,
+                "pci": self.__read_pci(),
+                "icd": self.__read_icd()
+            }
+            self.__save(data)
+
+        self.devices = [PciDevice(**d) for d in data["pci"]]
+        self.icd_loaders = data["icd"]
+
+    def __get_key(self) -> dict:
+        try:
+            with open("/proc/sys/kernel/random/boot_id", "r") as f:
+                boot_id = f.read().strip()
+        except OSError:
+            boot_id = ""
+
+        icd_dirs = {}
+        for _dir in self.vk_icd_dirs:
+            try:
+                icd_dirs[_dir] = os.stat(os.path.join(_dir, "icd.d")).st_mtime_ns
+            except OSError:
+                icd_dirs[_dir] = None
+
+        return {
+            "version": self.version,
+            "kernel": os.uname().release,
+            "boot_id": boot_id,
+            "icd_dirs": icd_dirs
+        }
+
+    @staticmethod
+    def __is_persistent(key: dict) -> bool:
+        # without a boot id a reboot cannot be detected
+        return bool(key.get("boot_id"))
+
+    def __load(self, key: dict):
+        if not self.__is_persistent(key):
+            return None
+        try:
+            with open(self.path, "r") as f:
+                data = yaml.load(f)
+        except (OSError, yaml.YAMLError):
+            return None
+        if not isinstance(data, dict) or data.get("key") != key:
+            return None
+        return data
+
+    def __save(self, data: dict):
+        if not self.__is_persistent(data["key"]):
+            return
+        try:
+            os.makedirs(Paths.cache, exist_ok=True)
+            with open(f"{self.path}.part", "w") as f:
+                yaml.dump(data, f)
+            os.replace(f"{self.path}.part", self.path)
+        except (OSError, yaml.YAMLError) as e:
+            logging.warning(f"Could not save the hardware inventory: {e}")
+
+    @staticmethod
+    def __read_pci() -> list:
+        devices = []
+        base = "/sys/bus/pci/devices"
+        try:
+            slots = sorted(os.listdir(base))
+        except OSError as e:
+            logging.warning(f"Could not read the PCI devices: {e}")
+            return devices
+
+        for slot in slots:
+            path = os.path.join(base, slot)
+            try:
+                with open(os.path.join(path, "vendor"), "r") as f:
+                    vendor = f.read().strip()
+                with open(os.path.join(path, "class"), "r") as f:
+                    device_class = int(f.read().strip(), 16)
+            except (OSError, ValueError):
+                continue
+            try:
+                driver = os.path.basename(os.readlink(os.path.join(path, "driver")))
+            except OSError:
+                driver = ""
+            devices.append({
+                "slot": slot,
+                "vendor": vendor,
+                "device_class": device_class,
+                "driver": driver
+            })
+
+        return devices
+
+    @classmethod
+    def __read_icd(cls) -> dict:
+        loaders = {
+            "nvidia": [],
+            "amd": [],
+            "intel": []
+        }
+
+        for _dir in cls.vk_icd_dirs:
+            for file in sorted(glob(f"{_dir}/icd.d/*.json")):
+                vendor = cls.__get_icd_vendor(file.lower())
+                if vendor is None:
+                    # the file name says nothing, look at the library it loads
+                    try:
+                        with open(file, "r") as f:
+                            library = json.load(f)["ICD"]["library_path"]
+                        vendor = cls.__get_icd_vendor(os.path.basename(library).lower())
+                    except (OSError, ValueError, KeyError, TypeError):
+                        pass
+                if vendor is not None:
+                    loaders[vendor].append(file)
+
+        return loaders
+
+    @staticmethod
+    def __get_icd_vendor(name: str):
+        if "nvidia" in name:
+            return "nvidia"
+        if "amd" in name or "radeon" in name:
+            return "amd"
+        if "intel" in name:
+            return "intel"
+        return None
+
+    def get_gpu_vendors(self) -> list:
+        """Return the vendors of the graphics cards, as "nvidia", "amd" or "intel"."""
+        vendors = []
+        for device in self.devices:
+            vendor = self.vendor_ids.get(device.vendor)
+            if device.is_gpu and vendor and vendor not in vendors:
+                vendors.append(vendor)
+        return vendors
+
+    def get_vendors(self) -> list:
+        """Return the known vendors of any PCI device."""
+        vendors = []
+        for device in self.devices:
+            vendor = self.vendor_ids.get(device.vendor)
+            if vendor and vendor not in vendors:
+                vendors.append(vendor)
+        return vendors
+
+    def has_vga(self, vendor: str) -> bool:
+        """Return True if a VGA controller of vendor is connected."""
+        return any(
+            d.device_class >> 8 == 0x0300 and self.vendor_ids.get(d.vendor) == vendor
+            for d in self.devices
+        )
+
+    @property
+    def is_nouveau(self) -> bool:
+        return any(d.driver == "nouveau" for d in self.devices if d.is_gpu)
+
+    def get_vk_icd(self, vendor: str) -> list:
+        return list(self.icd_loaders.get(vendor, []))
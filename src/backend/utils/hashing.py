@@ -0,0 +1,213 @@
+# hashing.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import time
+import sqlite3
+import hashlib
+import contextlib
+from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.globals import Paths
+
+try:
+    import xxhash
+    _xxhash = True
+except ImportError:
+    _xxhash = False
+
+try:
+    import blake3
+    _blake3 = True
+except ImportError:
+    _blake3 = False
+
+logging = Logger()
+
+
+class Hasher:
+    """
+    Hash files with bounded memory, reading them in chunks into a
+    reused buffer. Files are never mapped in memory: a file of a live
+    bottle truncated while it is hashed would kill the process with
+    SIGBUS instead of raising an error. Lists of files are hashed on a
+    pool of threads, the hash functions release the GIL while hashing so
+    the work runs in parallel.
+
+    Use the FAST algorithm for change detection only: it picks the
+    fastest hash available (xxh3_128 with the xxhash module, BLAKE3
+    with the blake3 module, SHA-1 otherwise). Its digests are prefixed
+    with the algorithm name (e.g. "xxh3_128:…"), so they are only ever
+    compared with digests of the same kind, see matches().
+    """
+
+    FAST = "fast"
+
+    chunk_size = 1024 * 1024
+    workers = min(8, (os.cpu_count() or 1) * 2)
+
+    @staticmethod
+    def get_fast_algorithm() -> str:
+        if _xxhash:
+            return "xxh3_128"
+        if _blake3:
+            return "blake3"
+        return "sha1"
+
+    @classmethod
+    def new(cls, algorithm: str):
+        """Return a new hash object for algorithm (any hashlib name, FAST, xxh3_128, blake3)."""
+        if algorithm == cls.FAST:
+            algorithm = cls.get_fast_algorithm()
+        if algorithm == "xxh3_128":
+            return xxhash.xxh3_128()
+        if algorithm == "blake3":
+            return blake3.blake3(max_threads=1)
+        return hashlib.new(algorithm)
+
+    @classmethod
+    def file(cls, path: str, algorithm: str = "sha256") -> Union[str, None]:
+        """Return the hex digest of the file, None if it cannot be read."""
+        _hash = cls.new(algorithm)
+        try:
+            with open(path, "rb", buffering=0) as f:
+                buffer = bytearray(cls.chunk_size)
+                view = memoryview(buffer)
+                while True:
+                    n = f.readinto(buffer)
+                    if not n:
+                        break
+                    _hash.update(view[:n])
+        except (OSError, ValueError):
+            return None
+
+        if algorithm == cls.FAST:
+            return f"{cls.get_fast_algorithm()}:{_hash.hexdigest()}"
+        return _hash.hexdigest()
+
+    @classmethod
+    def files(cls, paths: list, algorithm: str = "sha256") -> dict:
+        """Hash the given files in parallel, return a {path: digest} dict."""
+        if len(paths) < 2:
+            return {path: cls.file(path, algorithm) for path in paths}
+
+        with ThreadPoolExecutor(max_workers=cls.workers) as pool:
+            digests = pool.map(lambda p: cls.file(p, algorithm), paths)
+            return dict(zip(paths, digests))
+
+    @classmethod
+    def matches(cls, path: str, digest: str) -> bool:
+        """
+        Check the file against a digest returned by file(). Digests
+        without an algorithm prefix are legacy SHA-1 ones.
+        """
+        algorithm, _, value = digest.rpartition(":")
+        algorithm = algorithm or "sha1"
+        if not {"xxh3_128": _xxhash, "blake3": _blake3}.get(algorithm, True):
+            # the digest was made by a module which is not available
+            return False
+        return cls.file(path, algorithm) == value
+
+
+class HashCache:
+    """
+    Persistent cache of the file digests of a directory tree (a bottle,
+    a layer…), stored in a SQLite database in the cache directory. A
+    digest is reused as long as the (inode, size, mtime_ns) of the file
+    does not change, so only the new and modified files are read.
+    Files modified in the last racy_window seconds are not cached, as
+    another change within the mtime granularity would go unnoticed.
+    """
+
+    path = os.path.join(Paths.cache, "hashes")
+    racy_window = 2
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        key = hashlib.sha1(self.root.encode("utf-8")).hexdigest()
+        self.db = os.path.join(self.path, f"{key}.db")
+
+    def __connect(self) -> sqlite3.Connection:
+        os.makedirs(self.path, exist_ok=True)
+        conn = sqlite3.connect(self.db)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT, algorithm TEXT, inode INTEGER, size INTEGER, "
+            "mtime_ns INTEGER, digest TEXT, PRIMARY KEY (path, algorithm))"
+        )
+        return conn
+
+    def files(self, paths: list, algorithm: str = "sha256", prune: bool = False) -> dict:
+        """
+        Return a {path: digest} dict for the given files, hashing only
+        the ones which changed since the last call. If prune is True,
+        paths is the complete list of files of the tree and the entries
+        of the removed files are dropped.
+        """
+        try:
+            conn = self.__connect()
+        except sqlite3.Error as e:
+            logging.warning(f"Hash cache not available for {self.root}: {e}")
+            return Hasher.files(paths, algorithm)
+
+        column = algorithm
+        if algorithm == Hasher.FAST:
+            # the fast algorithm depends on the installed modules
+            column = f"{Hasher.FAST}:{Hasher.get_fast_algorithm()}"
+
+        with contextlib.closing(conn):
+            cached = {
+                row[0]: row[1:] for row in conn.execute(
+                    "SELECT path, inode, size, mtime_ns, digest FROM hashes WHERE algorithm = ?",
+                    (column,)
+                )
+            }
+
+            res = {}
+            stats = {}
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    res[path] = None
+                    continue
+                stats[path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+                entry = cached.get(path)
+                if entry is not None and entry[:3] == stats[path]:
+                    res[path] = entry[3]
+
+            missing = [p for p in stats if p not in res]
+            res.update(Hasher.files(missing, algorithm))
+
+            racy = time.time_ns() - self.racy_window * 10 ** 9
+            rows = [
+                (path, column, *stats[path], res[path])
+                for path in missing
+                if res[path] is not None and stats[path][2] < racy
+            ]
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)", rows)
+                    if prune:
+                        removed = [(p, column) for p in cached if p not in stats]
+                        conn.executemany("DELETE FROM hashes WHERE path = ? AND algorithm = ?", removed)
+            except sqlite3.Error as e:
+                logging.warning(f"Cannot update the hash cache of {self.root}: {e}")
+
+        return {path: res[path] for path in paths}
@@ -15,15 +15,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import os
+import time
 import locale
 import struct
-from functools import lru_cache
+import hashlib
+import threading
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.globals import Paths
+from bottles.backend.utils import yaml
+
+logging = Logger()
 
 
 class LnkUtils:
 
     @staticmethod
-    @lru_cache
     def get_data(path):
         """
         Gets data from a .lnk file, and returns them in a dictionary.
@@ -74,3 +82,159 @@ class LnkUtils:
                 return content[-1].decode(decode)
             except UnicodeDecodeError:
                 return None
+
+
+class LnkIndex:
+    """
+    Index of the shortcuts (.lnk) of a bottle and of their targets, kept
+    in memory and in the cache directory. The listing of a directory is
+    reused as long as its mtime does not change, and a shortcut is only
+    parsed again if its size or mtime changed, so looking for the
+    programs of a bottle does not walk and parse its Start Menu again.
+    Entries modified in the last racy_window seconds are not cached, as
+    another change within the mtime granularity would go unnoticed.
+    """
+
+    path = os.path.join(Paths.cache, "lnk")
+    racy_window = 2
+
+    __indexes = {}
+    __indexes_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, bottle_path: str) -> "LnkIndex":
+        """Return the index of the given bottle, shared between calls."""
+        with cls.__indexes_lock:
+            if bottle_path not in cls.__indexes:
+                cls.__indexes[bottle_path] = cls(bottle_path)
+            return cls.__indexes[bottle_path]
+
+    def __init__(self, bottle_path: str):
+        self.bottle_path = bottle_path
+        key = hashlib.sha1(os.path.realpath(bottle_path).encode("utf-8")).hexdigest()
+        self.__index_path = os.path.join(self.path, f"{key}.yml")
+        self.__lock = threading.Lock()
+        self.__changed = False
+
+        index = {}
+        try:
+            with open(self.__index_path, "r") as f:
+                index = yaml.load(f) or {}
+        except (FileNotFoundError, yaml.YAMLError):
+            pass
+        self.__dirs = index.get("dirs", {}) if isinstance(index, dict) else {}
+        self.__links = index.get("links", {}) if isinstance(index, dict) else {}
+
+    def __save(self):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(f"{self.__index_path}.part", "w") as f:
+                yaml.dump({"dirs": self.__dirs, "links": self.__links}, f)
+            os.replace(f"{self.__index_path}.part", self.__index_path)
+        except (OSError, yaml.YAMLError) as e:
+            logging.warning(f"Could not save the shortcuts index of {self.bottle_path}: {e}")
+
+    def __list_dir(self, path: str, st: os.stat_result, racy: int):
+        entry = self.__dirs.get(path)
+        if entry is not None and entry["mtime"] == st.st_mtime_ns:
+            return entry
+
+        links, dirs = [], []
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    if e.name.startswith("."):
+                        continue
+                    if e.is_dir():
+                        dirs.append(e.name)
+                    elif e.name.endswith(".lnk") and e.is_file():
+                        links.append(e.name)
+        except OSError:
+            return None
+
+        entry = {"mtime": st.st_mtime_ns, "links": sorted(links), "dirs": sorted(dirs)}
+        if st.st_mtime_ns < racy:
+            self.__dirs[path] = entry
+            self.__changed = True
+        return entry
+
+    def __walk(self, path: str, recursive: bool, found: list, seen: dict, racy: int):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        if (st.st_dev, st.st_ino) in seen:
+            return
+        seen[(st.st_dev, st.st_ino)] = path
+
+        entry = self.__list_dir(path, st, racy)
+        if entry is None:
+            return
+
+        found += [os.path.join(path, name) for name in entry["links"]]
+        if recursive:
+            for name in entry["dirs"]:
+                self.__walk(os.path.join(path, name), True, found, seen, racy)
+
+    def __get_target(self, path: str, racy: int):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        entry = self.__links.get(path)
+        if entry is not None and entry["stat"] == [st.st_size, st.st_mtime_ns]:
+            return entry["target"]
+
+        try:
+            target = LnkUtils.get_data(path)
+        except (OSError, struct.error, IndexError):
+            target = None
+
+        if st.st_mtime_ns < racy:
+            self.__links[path] = {"stat": [st.st_size, st.st_mtime_ns], "target": target}
+            self.__changed = True
+        return target
+
+    def get_shortcuts(self) -> list:
+        """
+        Return the [(shortcut path, target)] list of the shortcuts in the
+        Desktop and Start Menu folders of the bottle.
+        """
+        drive_c = os.path.join(self.bottle_path, "drive_c")
+        try:
+            users = sorted(os.listdir(os.path.join(drive_c, "users")))
+        except OSError:
+            users = []
+
+        roots = [(os.path.join(drive_c, "users", u, "Desktop"), False) for u in users]
+        roots += [(os.path.join(drive_c, "users", u, "Start Menu", "Programs"), True) for u in users]
+        roots.append((os.path.join(drive_c, "ProgramData", "Microsoft", "Windows", "Start Menu", "Programs"), True))
+        roots += [
+            (os.path.join(drive_c, "users", u, "AppData", "Roaming", "Microsoft", "Windows", "Start Menu", "Programs"), True)
+            for u in users
+        ]
+
+        with self.__lock:
+            racy = time.time_ns() - self.racy_window * 10 ** 9
+            found = []
+            seen = {}
+            for root, recursive in roots:
+                self.__walk(root, recursive, found, seen, racy)
+
+            shortcuts = [(path, self.__get_target(path, racy)) for path in found]
+
+            found = set(found)
+            for path in [p for p in self.__links if p not in found]:
+                del self.__links[path]
+                self.__changed = True
+            visited = set(seen.values())
+            for path in [p for p in self.__dirs if p not in visited]:
+                del self.__dirs[path]
+                self.__changed = True
+
+            if self.__changed:
+                self.__save()
+                self.__changed = False
+
+        return shortcuts
@@ -30,6 +30,7 @@ from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
 from bottles.backend.globals import Paths, user_apps_dir
 from bottles.backend.utils.imagemagick import ImageMagickUtils
 from bottles.backend.utils.generic import get_mime
+from bottles.backend.utils.transfer import FileTransfer
 
 logging = Logger()
 
@@ -123,6 +124,11 @@ class ManagerUtils:
             config: dict,
             fn_update: callable = None
     ) -> Union[str, bool]:
+        """
+        Copy the given file into the bottle storage directory, returning
+        the new path. The progress (0..1) is sent to fn_update in the main
+        loop.
+        """
         logging.info(f"Adding file {file_path} to the bottle …")
         bottle_path = ManagerUtils.get_bottle_path(config)
 
@@ -134,26 +140,21 @@ class ManagerUtils:
             os.makedirs(f"{bottle_path}/storage")
 
         file_name = os.path.basename(file_path)
-        file_size = os.path.getsize(file_path)
         file_new_path = f"{bottle_path}/storage/{file_name}"
 
+        def update(progress):
+            if fn_update:
+                GLib.idle_add(fn_update, progress)
+
         logging.info(f"Copying file {file_path} to the bottle …")
-        try:
-            with open(file_path, "rb") as f_in:
-                with open(file_new_path, "wb") as f_out:
-                    for i in range(file_size):
-                        f_out.write(f_in.read(1))
-                        _size = i / file_size
-
-                        if fn_update:
-                            if _size % 0.1 == 0:
-                                GLib.idle_add(fn_update, _size)
-                    GLib.idle_add(fn_update, 1)
-            return file_new_path
-        except (OSError, IOError):
+        transfer = FileTransfer(file_path, file_new_path, fn_update=update)
+        if not transfer.copy():
             logging.error(f"Could not copy file {file_path} to the bottle.")
             return False
 
+        logging.info(f"File copied using {transfer.method}.")
+        return file_new_path
+
     @staticmethod
     def get_exe_parent_dir(config, executable_path):
         """Get parent directory of the executable."""
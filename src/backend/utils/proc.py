@@ -16,6 +16,8 @@
 #
 
 import os
+import time
+import select
 import subprocess
 
 
@@ -26,8 +28,9 @@ class Proc:
     def __get_data(self, data):
         try:
             with open(os.path.join('/proc', str(self.pid), data), 'rb') as f:
-                return f.read().decode('utf-8')
-        except (FileNotFoundError, PermissionError):
+                return f.read().decode('utf-8', errors='replace')
+        except OSError:
+            # the process exited or belongs to another user
             return ""
 
     def get_cmdline(self):
@@ -42,6 +45,14 @@ class Proc:
     def get_name(self):
         return self.__get_data('stat')
 
+    def get_comm(self):
+        return self.__get_data('comm').strip()
+
+    def is_alive(self):
+        # zombies keep their /proc entry until reaped
+        stat = self.get_name()
+        return stat != "" and stat[stat.rfind(')') + 2:][:1] not in ['Z', 'X']
+
     def kill(self):
         subprocess.Popen(['kill', str(self.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
@@ -79,3 +90,125 @@ class ProcUtils:
     @staticmethod
     def get_by_pid(pid):
         return Proc(pid)
+
+
+class ProcessMonitor:
+    """
+    Follow the processes having env (e.g. WINEPREFIX=<bottle>) in their
+    environment through /proc and wait for them to exit. The values are
+    compared as paths, so a prefix reached through a symlink or with a
+    trailing slash is matched too.
+
+    Waiters block on pidfds, so they wake up as soon as the processes
+    exit instead of polling; where pidfds are not supported (Linux older
+    than 5.3), the processes are checked every poll_interval seconds.
+    """
+
+    poll_interval = .5
+
+    def __init__(self, env: str):
+        self.env = env
+        self.__key, _, value = env.partition('=')
+        self.__value = os.path.realpath(value)
+
+    @staticmethod
+    def __get_exe_name(proc: Proc) -> str:
+        # wine replaces the command line of its processes with the windows one
+        argv0 = proc.get_cmdline().split('\0', 1)[0]
+        return argv0.replace('\\', '/').rsplit('/', 1)[-1].lower()
+
+    def find(self, name: str) -> list:
+        """
+        Return the processes of the monitored environment running the
+        executable name (an executable or a windows or unix path to it).
+        """
+        name = name.replace('\\', '/').rsplit('/', 1)[-1].lower()
+        procs = []
+        for proc in ProcUtils.get_procs():
+            # the command line is read first, it is much shorter than the environment
+            if self.__get_exe_name(proc) != name and proc.get_comm().lower() != name[:15]:
+                continue
+            if self.__match_env(proc):
+                procs.append(proc)
+        return procs
+
+    def __match_env(self, proc: Proc) -> bool:
+        prefix = f"{self.__key}="
+        for var in proc.get_env().split('\0'):
+            if var.startswith(prefix):
+                return os.path.realpath(var[len(prefix):]) == self.__value
+        return False
+
+    def is_alive(self, name: str) -> bool:
+        return len(self.find(name)) > 0
+
+    def wait(self, name: str, timeout: float = None, poll_interval: float = None) -> bool:
+        """
+        Wait for all the processes running name to exit, including the
+        ones started while waiting. Return False if they are still
+        running after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            procs = self.find(name)
+            if len(procs) == 0:
+                return True
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+
+            self.wait_procs(procs, remaining, poll_interval or self.poll_interval)
+
+    @staticmethod
+    def wait_procs(procs: list, timeout: float = None, poll_interval: float = .5) -> bool:
+        """
+        Wait for procs to exit. Return False if some are still running
+        after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pidfds = []
+        try:
+            if hasattr(os, 'pidfd_open'):
+                try:
+                    for proc in procs:
+                        try:
+                            pidfds.append(os.pidfd_open(int(proc.pid)))
+                        except ProcessLookupError:
+                            pass
+                except OSError:
+                    # no pidfd support in the kernel
+                    for fd in pidfds:
+                        os.close(fd)
+                    pidfds = None
+            else:
+                pidfds = None
+
+            if pidfds is not None:
+                # a pidfd becomes readable when its process exits
+                poller = select.poll()
+                for fd in pidfds:
+                    poller.register(fd, select.POLLIN)
+                left = len(pidfds)
+                while left > 0:
+                    wait = None
+                    if deadline is not None:
+                        wait = max(0, int((deadline - time.monotonic()) * 1000))
+                    events = poller.poll(wait)
+                    if len(events) == 0:
+                        return False
+                    for fd, _ in events:
+                        poller.unregister(fd)
+                        left -= 1
+                return True
+
+            while any(proc.is_alive() for proc in procs):
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(poll_interval)
+            return True
+        finally:
+            for fd in pidfds or []:
+                os.close(fd)
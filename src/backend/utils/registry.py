@@ -0,0 +1,167 @@
+# registry.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import threading
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.globals import Paths
+from bottles.backend.utils import yaml
+
+logging = Logger()
+
+
+class BottleRegistry:
+    """
+    Keep the parsed configuration of the local bottles in memory, together
+    with the stat of the files it was read from (placeholder.yml and
+    bottle.yml). A refresh only stats the configurations and parses the
+    new or modified ones, the others are served from memory.
+
+    fn_load(name, bottle_path, config_path) returns the parsed config
+    (or None for broken bottles), fn_setup(name, bottle_path) performs
+    the housekeeping which only has to be done once per bottle and
+    session (cache directories, shader cache moves…).
+    """
+
+    def __init__(self, fn_load: callable, fn_setup: callable = None):
+        self.__fn_load = fn_load
+        self.__fn_setup = fn_setup
+        self.__lock = threading.RLock()
+        self.__entries = {}
+        self.__set_up = set()
+
+    @staticmethod
+    def __stat(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns
+
+    def __resolve(self, name: str, entry: dict):
+        """
+        Return the (bottle path, config path) of a bottle, following the
+        placeholder of the bottles stored in a custom path. The
+        placeholder is only parsed again when it changes.
+        """
+        bottle_path = os.path.join(Paths.bottles, name)
+        placeholder = os.path.join(bottle_path, "placeholder.yml")
+        placeholder_stat = self.__stat(placeholder)
+
+        if placeholder_stat is None:
+            return bottle_path, os.path.join(bottle_path, "bottle.yml"), None
+
+        if entry and entry["placeholder"] == placeholder_stat:
+            return bottle_path, entry["config_path"], placeholder_stat
+
+        try:
+            with open(placeholder, "r") as f:
+                placeholder_yaml = yaml.load(f)
+            if not placeholder_yaml.get("Path"):
+                raise ValueError("Missing Path in placeholder.yml")
+        except (OSError, AttributeError, yaml.YAMLError, ValueError):
+            return bottle_path, None, placeholder_stat
+
+        return bottle_path, os.path.join(placeholder_yaml.get("Path"), "bottle.yml"), placeholder_stat
+
+    def refresh(self) -> bool:
+        """
+        Reload the bottles which were added or modified since the last
+        call and forget the removed ones. Return True if anything changed.
+        """
+        try:
+            names = set(os.listdir(Paths.bottles))
+        except OSError:
+            names = set()
+
+        with self.__lock:
+            changed = False
+
+            for name in set(self.__entries) - names:
+                del self.__entries[name]
+                self.__set_up.discard(name)
+                changed = True
+
+            for name in names:
+                entry = self.__entries.get(name)
+                bottle_path, config_path, placeholder_stat = self.__resolve(name, entry)
+                config_stat = self.__stat(config_path) if config_path else None
+
+                if entry and entry["placeholder"] == placeholder_stat \
+                        and entry["config_path"] == config_path \
+                        and entry["stat"] == config_stat:
+                    continue
+
+                config = None
+                if config_stat is not None:
+                    config = self.__fn_load(name, bottle_path, config_path)
+                    # the loader can migrate (and so write) the config
+                    config_stat = self.__stat(config_path)
+
+                self.__entries[name] = {
+                    "placeholder": placeholder_stat,
+                    "config_path": config_path,
+                    "stat": config_stat,
+                    "config": config
+                }
+                changed = True
+
+                if config is not None and name not in self.__set_up and self.__fn_setup:
+                    self.__fn_setup(name, bottle_path)
+                    self.__set_up.add(name)
+
+            return changed
+
+    def touch(self, config: dict):
+        """
+        Record a write of the bottle.yml of config made by Bottles itself,
+        so the next refresh does not parse it again. The config is only
+        trusted if it is the one held by the registry, otherwise the file
+        will be reloaded.
+        """
+        with self.__lock:
+            for entry in self.__entries.values():
+                if entry["config"] is config:
+                    entry["stat"] = self.__stat(entry["config_path"])
+                    return
+
+    def invalidate(self, name: str = None):
+        """Force the reload of a bottle (or all of them) on the next refresh."""
+        with self.__lock:
+            if name is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(name, None)
+
+    def get_config_paths(self) -> dict:
+        """Return the {directory name: bottle.yml path} dict of the bottles."""
+        with self.__lock:
+            return {
+                name: entry["config_path"]
+                for name, entry in self.__entries.items()
+                if entry["config_path"]
+            }
+
+    def get_configs(self) -> dict:
+        """Return the {Name: config} dict of the valid bottles."""
+        with self.__lock:
+            return {
+                entry["config"]["Name"]: entry["config"]
+                for entry in self.__entries.values()
+                if entry["config"] is not None
+            }
@@ -0,0 +1,270 @@
+# snapshot.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import time
+import stat
+import fcntl
+import shutil
+import fnmatch
+import tempfile
+import contextlib
+import subprocess
+from fvs.exceptions import FVSNothingToCommit, FVSEmptyCommitMessage, FVSStateNotFound, FVSNothingToRestore
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.utils import yaml
+from bottles.backend.utils.transfer import FileTransfer, TreeCloner, FICLONE
+
+logging = Logger()
+
+
+class SnapshotRepo:
+    """
+    Versioning repository storing every state as a full snapshot of the
+    bottle, taken with a btrfs subvolume snapshot when the bottle is a
+    subvolume, or as a reflinked copy on CoW filesystems (btrfs, xfs…).
+    In both cases the snapshot shares the data with the bottle, so it is
+    almost instant and only the files modified later take space.
+    It exposes the subset of the FVSRepo interface used by the
+    VersioningManager and raises the same exceptions, with the same
+    semantics: restoring a state drops the subsequent ones.
+    """
+
+    dir_name = ".snapshots"
+    reserved = [".snapshots", ".fvs"]
+    __methods = {}
+
+    def __init__(self, repo_path: str, method: str = None):
+        self.repo_path = os.path.abspath(repo_path)
+        self.path = os.path.join(self.repo_path, self.dir_name)
+        self.__index_path = os.path.join(self.path, "index.yml")
+        self.__index = self.__load() or {"method": method, "active": -1, "states": {}}
+
+    @classmethod
+    def exists(cls, repo_path: str) -> bool:
+        return os.path.exists(os.path.join(repo_path, cls.dir_name, "index.yml"))
+
+    @classmethod
+    def get_method(cls, path: str):
+        """
+        Return the snapshot method supported for path: btrfs if it is a
+        subvolume and the btrfs tools are available, reflink if the
+        filesystem supports it, None otherwise. The probe writes files in
+        path, so it runs once per directory (and filesystem) and session.
+        """
+        st = os.stat(path)
+        key = (os.path.realpath(path), st.st_dev, st.st_ino)
+        if key not in cls.__methods:
+            cls.__methods[key] = cls.__probe_method(path, st)
+        return cls.__methods[key]
+
+    @staticmethod
+    def __probe_method(path: str, st: os.stat_result):
+        # only when the bottle directory is itself a subvolume (inode 256),
+        # which Bottles never creates: users have to make it one by hand
+        if st.st_ino == 256 and shutil.which("btrfs"):
+            res = subprocess.run(["stat", "-f", "-c", "%T", path], capture_output=True, text=True)
+            if res.stdout.strip() == "btrfs":
+                return "btrfs"
+
+        try:
+            with tempfile.TemporaryFile(dir=path) as src, tempfile.TemporaryFile(dir=path) as dest:
+                src.write(b"bottles")
+                src.flush()
+                fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+            return "reflink"
+        except OSError:
+            return None
+
+    def __load(self) -> dict:
+        try:
+            with open(self.__index_path, "r") as f:
+                index = yaml.load(f)
+        except (FileNotFoundError, yaml.YAMLError):
+            return {}
+        if not isinstance(index, dict):
+            return {}
+        index["states"] = {int(k): v for k, v in index.get("states", {}).items()}
+        return index
+
+    def __save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(f"{self.__index_path}.part", "w") as f:
+            yaml.dump(self.__index, f)
+        os.replace(f"{self.__index_path}.part", self.__index_path)
+
+    @property
+    def method(self) -> str:
+        return self.__index["method"]
+
+    @property
+    def states(self) -> dict:
+        return self.__index["states"]
+
+    @property
+    def active_state_id(self) -> int:
+        return self.__index["active"]
+
+    @property
+    def has_no_states(self) -> bool:
+        return not self.__index["states"]
+
+    def get_state_path(self, state_id: int) -> str:
+        return os.path.join(self.path, str(state_id))
+
+    def __scan(self, root: str, ignore: list) -> dict:
+        """
+        Return {relative path: (type, size, mtime_ns, link)} for the files
+        and links of a tree, skipping the ignored ones and the versioning
+        directories.
+        """
+        entries = {}
+        for _root, dirs, files in os.walk(root):
+            if _root == root:
+                dirs[:] = [d for d in dirs if d not in self.reserved]
+            for name in dirs + files:
+                path = os.path.join(_root, name)
+                rel = os.path.relpath(path, root)
+                try:
+                    st = os.lstat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    entries[rel] = ("dir", 0, 0, None)
+                elif self.__is_ignored(rel, ignore):
+                    continue
+                elif stat.S_ISLNK(st.st_mode):
+                    entries[rel] = ("link", 0, 0, os.readlink(path))
+                elif stat.S_ISREG(st.st_mode):
+                    entries[rel] = ("file", st.st_size, st.st_mtime_ns, None)
+        return entries
+
+    @staticmethod
+    def __is_ignored(rel: str, ignore: list) -> bool:
+        return any(fnmatch.fnmatch(rel, p) for p in ignore)
+
+    def commit(self, message: str, ignore: list = None) -> dict:
+        """Snapshot the bottle as a new state."""
+        if message in [None, ""]:
+            raise FVSEmptyCommitMessage()
+        ignore = ignore or []
+
+        if not self.has_no_states:
+            current = self.__scan(self.repo_path, ignore)
+            if current == self.__scan(self.get_state_path(self.active_state_id), ignore):
+                raise FVSNothingToCommit()
+
+        state_id = max(self.states) + 1 if self.states else 0
+        dest = self.get_state_path(state_id)
+        os.makedirs(self.path, exist_ok=True)
+        self.__remove_snapshot(dest)
+
+        start = time.time()
+        if self.method == "btrfs":
+            subprocess.run(
+                ["btrfs", "subvolume", "snapshot", self.repo_path, dest],
+                check=True, capture_output=True
+            )
+        else:
+            def ignore_func(src: str, names: list) -> set:
+                rel = os.path.relpath(src, self.repo_path)
+                ignored = set(self.reserved) & set(names) if rel == "." else set()
+                for name in names:
+                    path = os.path.join(src, name)
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        continue
+                    if self.__is_ignored(os.path.normpath(os.path.join(rel, name)), ignore):
+                        ignored.add(name)
+                return ignored
+
+            TreeCloner(self.repo_path, dest, ignore=ignore_func).clone()
+        logging.info(f"Snapshot {state_id} ({self.method}) taken in {time.time() - start:.2f}s.")
+
+        self.__index["states"][state_id] = {
+            "message": message,
+            "timestamp": time.time()
+        }
+        self.__index["active"] = state_id
+        self.__save()
+        return {"state_id": state_id, "message": message}
+
+    def restore_state(self, state_id: int, ignore: list = None):
+        """
+        Bring the bottle back to the given state: only the files which
+        differ are reflinked back from the snapshot. The subsequent states
+        are removed.
+        """
+        state_id = int(state_id)
+        if state_id not in self.states:
+            raise FVSStateNotFound(state_id)
+        ignore = ignore or []
+
+        src = self.get_state_path(state_id)
+        wanted = self.__scan(src, ignore)
+        current = self.__scan(self.repo_path, ignore)
+        if wanted == current:
+            raise FVSNothingToRestore()
+
+        # remove what was not there, deepest paths first
+        for rel in sorted(set(current) - set(wanted), reverse=True):
+            path = os.path.join(self.repo_path, rel)
+            if current[rel][0] == "dir":
+                with contextlib.suppress(OSError):
+                    os.rmdir(path)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+        for rel in sorted(wanted):
+            entry = wanted[rel]
+            if current.get(rel) == entry:
+                continue
+            path = os.path.join(self.repo_path, rel)
+            if entry[0] == "dir":
+                if not os.path.isdir(path) or os.path.islink(path):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+                    os.makedirs(path, exist_ok=True)
+                continue
+
+            if os.path.lexists(path):
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            if entry[0] == "link":
+                os.symlink(entry[3], path)
+            elif not FileTransfer(os.path.join(src, rel), path).copy():
+                raise OSError(f"Cannot restore {rel}")
+            else:
+                shutil.copystat(os.path.join(src, rel), path)
+
+        for _state_id in [s for s in self.states if s > state_id]:
+            self.__remove_snapshot(self.get_state_path(_state_id))
+            del self.__index["states"][_state_id]
+        self.__index["active"] = state_id
+        self.__save()
+
+    def __remove_snapshot(self, path: str):
+        if not os.path.exists(path):
+            return
+        if self.method == "btrfs":
+            res = subprocess.run(["btrfs", "subvolume", "delete", path], capture_output=True)
+            if res.returncode == 0:
+                return
+        shutil.rmtree(path)
@@ -0,0 +1,160 @@
+# startup.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import copy
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+from bottles.backend.globals import Paths
+from bottles.backend.utils import yaml
+
+logging = Logger()
+
+
+class StartupCache:
+    """
+    Store the result of the startup checks together with the mtimes of
+    the paths they scanned, so a warm start can skip the rescan of the
+    directories which have not been touched since the last run.
+    """
+
+    def __init__(self):
+        self.__path = os.path.join(Paths.cache, "startup.yml")
+        self.__lock = threading.Lock()
+        self.__data = self.__load()
+
+    def __load(self) -> dict:
+        try:
+            with open(self.__path, "r") as f:
+                data = yaml.load(f)
+        except (FileNotFoundError, yaml.YAMLError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    @staticmethod
+    def mtimes(paths: list) -> list:
+        """Return the mtimes (in ns) of the given paths, None if missing."""
+        res = []
+        for path in paths:
+            try:
+                res.append(os.stat(path).st_mtime_ns)
+            except (OSError, TypeError):
+                res.append(None)
+        return res
+
+    def get(self, name: str, mtimes: list):
+        """
+        Return a copy of the cached result for name if mtimes did not
+        change, so the caller can modify it without altering the cache.
+        """
+        with self.__lock:
+            entry = self.__data.get(name)
+            if not entry or entry.get("mtimes") != mtimes:
+                return None
+            return copy.deepcopy(entry.get("value"))
+
+    def set(self, name: str, mtimes: list, value):
+        with self.__lock:
+            self.__data[name] = {"mtimes": mtimes, "value": copy.deepcopy(value)}
+
+    def save(self):
+        with self.__lock:
+            data = dict(self.__data)
+        try:
+            os.makedirs(Paths.cache, exist_ok=True)
+            with open(self.__path, "w") as f:
+                yaml.dump(data, f)
+        except (OSError, yaml.YAMLError) as e:
+            logging.warning(f"Could not save the startup cache: {e}")
+
+
+class StartupScheduler:
+    """
+    Run the startup stages on a thread pool. The stages passed to the same
+    run() call are executed concurrently, unless they depend on other
+    stages of the call, each call waits for its stages to complete.
+    The duration of every stage is collected in times, which
+    is reported by the BOOT_TIME hook.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self.times = {}
+
+    def __timed(self, name: str, func: callable, after: list = None):
+        if after:
+            # run even if a dependency failed, its error is raised by run()
+            wait(after)
+        start = time.time()
+        try:
+            return func()
+        finally:
+            self.times[name] = time.time() - start
+
+    def run(self, stages: dict, depends: dict = None):
+        """
+        Run the given {name: callable} stages and wait for them. The
+        optional depends {name: [names]} makes a stage start only once
+        the listed stages of the same call are completed.
+        """
+        depends = depends or {}
+        if len(stages) == 1:
+            name, func = next(iter(stages.items()))
+            self.__timed(name, func)
+            return
+
+        workers = min(self.max_workers, len(stages))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="startup") as pool:
+            futures = {}
+            pending = list(stages)
+            while pending:
+                # dependencies are submitted first, so the stages waiting
+                # for them can't take all the workers before they start
+                ready = [
+                    name for name in pending
+                    if all(dep in futures for dep in depends.get(name, []))
+                ]
+                if not ready:
+                    raise ValueError(f"Unresolvable startup stages: {pending}")
+                for name in ready:
+                    after = [futures[dep] for dep in depends.get(name, [])]
+                    futures[name] = pool.submit(self.__timed, name, stages[name], after)
+                    pending.remove(name)
+
+        error = None
+        for name, future in futures.items():
+            exception = future.exception()
+            if exception is not None:
+                logging.error(f"Startup stage {name} failed: {exception}")
+                error = error or exception
+
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def report(times: dict):
+        """Log the given {stage: seconds} times if BOOT_TIME is set."""
+        if "BOOT_TIME" not in os.environ:
+            return
+
+        times_str = "Boot times:"
+        for stage, t in times.items():
+            times_str += f"\n\t - {stage} took: {t:.3f}s"
+        logging.info(times_str)
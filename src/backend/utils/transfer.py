@@ -0,0 +1,274 @@
+# transfer.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import time
+import errno
+import fcntl
+import shutil
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+
+logging = Logger()
+
+# ioctl to share the extents of a file with another one (btrfs, xfs, …)
+FICLONE = 0x40049409
+
+# errors meaning that the kernel/filesystem does not support a copy method
+_UNSUPPORTED = {
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+    errno.ENOTTY, errno.EBADF, errno.EPERM, errno.ETXTBSY
+}
+
+
+class FileTransfer:
+    """
+    Copy a file using the fastest method available: a reflink (the copy
+    shares the data with the source on CoW filesystems), then an in-kernel
+    copy with copy_file_range or sendfile, falling back to a buffered
+    copy in large chunks. The progress (0..1) is sent to fn_update at most
+    every update_interval seconds.
+    """
+
+    chunk_size = 64 * 1024 * 1024
+    buffer_size = 8 * 1024 * 1024
+    update_interval = .1
+
+    def __init__(
+            self,
+            src: str,
+            dest: str,
+            fn_update: callable = None,
+            reflink: bool = True
+    ):
+        self.src = src
+        self.dest = dest
+        self.fn_update = fn_update
+        self.reflink = reflink
+        self.method = None
+        self.__size = 0
+        self.__last_update = 0
+
+    def copy(self) -> bool:
+        """Copy src to dest, return False on failure."""
+        try:
+            with open(self.src, "rb") as f_in, open(self.dest, "wb") as f_out:
+                self.__size = os.fstat(f_in.fileno()).st_size
+                self.__copy(f_in.fileno(), f_out.fileno())
+            shutil.copymode(self.src, self.dest)
+        except OSError as e:
+            logging.error(f"Could not copy {self.src} to {self.dest}: {e}")
+            self.__discard()
+            return False
+
+        self.__update(self.__size, force=True)
+        return True
+
+    def __copy(self, fd_in: int, fd_out: int):
+        if self.reflink and self.__reflink(fd_in, fd_out):
+            self.method = "reflink"
+            return
+
+        for method, func in [
+            ("copy_file_range", self.__copy_file_range),
+            ("sendfile", self.__sendfile)
+        ]:
+            try:
+                func(fd_in, fd_out)
+                self.method = method
+                return
+            except OSError as e:
+                # only fall back if nothing has been written yet
+                if e.errno not in _UNSUPPORTED or os.lseek(fd_out, 0, os.SEEK_CUR) != 0:
+                    raise
+
+        self.__buffered(fd_in, fd_out)
+        self.method = "buffered"
+
+    @staticmethod
+    def __reflink(fd_in: int, fd_out: int) -> bool:
+        try:
+            fcntl.ioctl(fd_out, FICLONE, fd_in)
+            return True
+        except OSError:
+            return False
+
+    def __copy_file_range(self, fd_in: int, fd_out: int):
+        if not hasattr(os, "copy_file_range"):
+            raise OSError(errno.ENOSYS, "copy_file_range not available")
+        copied = 0
+        while True:
+            n = os.copy_file_range(fd_in, fd_out, self.chunk_size)
+            if n == 0:
+                break
+            copied += n
+            self.__update(copied)
+
+    def __sendfile(self, fd_in: int, fd_out: int):
+        copied = 0
+        while True:
+            n = os.sendfile(fd_out, fd_in, None, self.chunk_size)
+            if n == 0:
+                break
+            copied += n
+            self.__update(copied)
+
+    def __buffered(self, fd_in: int, fd_out: int):
+        os.lseek(fd_in, 0, os.SEEK_SET)
+        os.lseek(fd_out, 0, os.SEEK_SET)
+        os.ftruncate(fd_out, 0)
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        copied = 0
+        with open(fd_in, "rb", buffering=0, closefd=False) as f_in:
+            while True:
+                n = f_in.readinto(buffer)
+                if not n:
+                    break
+                written = 0
+                while written < n:
+                    written += os.write(fd_out, view[written:n])
+                copied += n
+                self.__update(copied)
+
+    def __update(self, copied: int, force: bool = False):
+        if self.fn_update is None:
+            return
+        now = time.time()
+        if not force and now - self.__last_update < self.update_interval:
+            return
+        self.__last_update = now
+        self.fn_update(copied / self.__size if self.__size else 1)
+
+    def __discard(self):
+        with contextlib.suppress(OSError):
+            os.remove(self.dest)
+
+
+class TreeCloner:
+    """
+    Clone a directory tree as cheaply as possible. Files are reflinked
+    when the filesystem supports it, so the clone shares the data with
+    the source until one of them is modified. Otherwise they are copied
+    by a pool of workers, or hardlinked if hardlinks is True: only for
+    read-only trees (runners, components), as wine and the installers
+    write the files of a bottle in place, which would change every tree
+    sharing them. The directory stats are applied once all the files
+    are in place. Accepts the same ignore callable as shutil.copytree.
+    """
+
+    workers = min(8, (os.cpu_count() or 1) * 2)
+
+    def __init__(
+            self,
+            src: str,
+            dest: str,
+            symlinks: bool = True,
+            ignore: callable = None,
+            hardlinks: bool = False
+    ):
+        self.src = src
+        self.dest = dest
+        self.symlinks = symlinks
+        self.ignore = ignore
+        self.hardlinks = hardlinks
+        self.stats = {"reflink": 0, "hardlink": 0, "copy": 0}
+        self.__can_reflink = True
+        self.__can_hardlink = hardlinks
+        self.__lock = threading.Lock()
+
+    def clone(self) -> dict:
+        """Clone src into dest (which can exist), return the stats."""
+        dirs = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = []
+            self.__walk(self.src, self.dest, pool, futures, dirs)
+            for future in futures:
+                future.result()
+
+        # the copies change the mtime of the directories, deepest come first
+        for src, dest in dirs:
+            shutil.copystat(src, dest)
+
+        logging.info(
+            "Tree cloned: {reflink} reflinked, {hardlink} hardlinked, {copy} copied.".format(**self.stats)
+        )
+        return self.stats
+
+    def __walk(self, src: str, dest: str, pool, futures: list, dirs: list):
+        os.makedirs(dest, exist_ok=True)
+        entries = list(os.scandir(src))
+        ignored = set()
+        if self.ignore is not None:
+            ignored = self.ignore(src, [e.name for e in entries])
+
+        for entry in entries:
+            if entry.name in ignored:
+                continue
+            _dest = os.path.join(dest, entry.name)
+
+            if entry.is_symlink() and self.symlinks:
+                # only the link (or file) in the way, never what it points to
+                if os.path.islink(_dest) or os.path.isfile(_dest):
+                    os.unlink(_dest)
+                os.symlink(os.readlink(entry.path), _dest)
+            elif entry.is_dir():
+                self.__walk(entry.path, _dest, pool, futures, dirs)
+            elif entry.is_file():
+                if not self.__link(entry.path, _dest):
+                    futures.append(pool.submit(self.__copy, entry.path, _dest))
+
+        dirs.append((src, dest))
+
+    def __link(self, src: str, dest: str) -> bool:
+        """Try to reflink or hardlink src to dest."""
+        if self.__can_reflink:
+            try:
+                with open(src, "rb") as f_in, open(dest, "wb") as f_out:
+                    fcntl.ioctl(f_out.fileno(), FICLONE, f_in.fileno())
+                shutil.copystat(src, dest)
+                self.__count("reflink")
+                return True
+            except OSError as e:
+                if e.errno in _UNSUPPORTED:
+                    self.__can_reflink = False
+
+        if self.__can_hardlink:
+            try:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(dest)
+                os.link(src, dest)
+                self.__count("hardlink")
+                return True
+            except OSError as e:
+                if e.errno in {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP}:
+                    self.__can_hardlink = False
+
+        return False
+
+    def __copy(self, src: str, dest: str):
+        if not FileTransfer(src, dest, reflink=False).copy():
+            raise OSError(f"Could not copy {src} to {dest}")
+        shutil.copystat(src, dest)
+        self.__count("copy")
+
+    def __count(self, method: str):
+        with self.__lock:
+            self.stats[method] += 1
@@ -0,0 +1,121 @@
+# watcher.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+from gi.repository import Gio, GLib
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+
+logging = Logger()
+
+
+class FileWatcher:
+    """
+    Watch files and directories for changes made by Bottles or outside of
+    it, and call back on the main loop. Paths are watched with a
+    Gio.FileMonitor (inotify on Linux); when a monitor cannot be created
+    (unsupported filesystem, inotify limits reached…) the path is polled
+    instead, comparing its mtime every poll_interval seconds.
+
+    Events are coalesced: the callback is called once, delay ms after the
+    last event of a burst, so extracting a runner or writing a config
+    results in a single refresh.
+    """
+
+    delay = 500
+    poll_interval = 2
+
+    def __init__(self):
+        self.__watches = {}
+        self.__pending = {}
+
+    @staticmethod
+    def __mtime(path: str):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def watch(self, tag: str, path: str, callback: callable, directory: bool = True):
+        """
+        Watch path and call callback() when it changes. The tag identifies
+        the watch, watching an already used tag replaces it.
+        """
+        self.unwatch(tag)
+        file = Gio.File.new_for_path(path)
+        try:
+            if directory:
+                monitor = file.monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            else:
+                monitor = file.monitor_file(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            monitor.connect("changed", self.__on_changed, tag)
+            self.__watches[tag] = {"path": path, "callback": callback, "monitor": monitor}
+            return
+        except GLib.Error as e:
+            logging.warning(f"Cannot monitor {path} ({e.message}), polling it instead.")
+
+        watch = {"path": path, "callback": callback, "mtime": self.__mtime(path)}
+        watch["source"] = GLib.timeout_add_seconds(self.poll_interval, self.__poll, tag)
+        self.__watches[tag] = watch
+
+    def unwatch(self, tag: str):
+        watch = self.__watches.pop(tag, None)
+        if watch is None:
+            return
+        if "monitor" in watch:
+            watch["monitor"].cancel()
+        else:
+            GLib.source_remove(watch["source"])
+        if tag in self.__pending:
+            GLib.source_remove(self.__pending.pop(tag))
+
+    def get_tags(self) -> list:
+        return list(self.__watches)
+
+    def stop(self):
+        for tag in list(self.__watches):
+            self.unwatch(tag)
+
+    def __on_changed(self, _monitor, _file, _other_file, event, tag):
+        if event == Gio.FileMonitorEvent.ATTRIBUTE_CHANGED:
+            return
+        self.__schedule(tag)
+
+    def __poll(self, tag) -> bool:
+        watch = self.__watches.get(tag)
+        if watch is None:
+            return False
+        mtime = self.__mtime(watch["path"])
+        if mtime != watch["mtime"]:
+            watch["mtime"] = mtime
+            self.__schedule(tag)
+        return True
+
+    def __schedule(self, tag: str):
+        if tag in self.__pending:
+            GLib.source_remove(self.__pending[tag])
+        self.__pending[tag] = GLib.timeout_add(self.delay, self.__fire, tag)
+
+    def __fire(self, tag: str) -> bool:
+        self.__pending.pop(tag, None)
+        watch = self.__watches.get(tag)
+        if watch is not None:
+            try:
+                watch["callback"]()
+            except Exception as e:
+                logging.error(f"Failed to handle a change of {watch['path']}: {e}")
+        return False
@@ -1,3 +1,10 @@
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+import contextlib
+
 import yaml as _yaml
 try:
     from yaml import CLoader as Loader, CDumper as Dumper
@@ -31,4 +38,74 @@ def load(stream, Loader=Loader):
     return _yaml.safe_load(stream)
 
 
-YAMLError = _yaml.YAMLError
\ No newline at end of file
+YAMLError = _yaml.YAMLError
+
+# seconds a YAML file has to be left untouched before it is cached
+racy_window = 2
+
+
+def __get_compact_path(path: str) -> str:
+    """
+    Return the path of the compact copy of a YAML file, or None while
+    bottles.backend.globals is being imported: the paths are not known
+    yet and the data file is read through this module.
+    """
+    try:
+        from bottles.backend.globals import Paths
+    except ImportError:
+        return None
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(Paths.compact, f"{key}.pickle")
+
+
+def __get_stat(path: str) -> tuple:
+    st = os.stat(path)
+    return st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns
+
+
+def load_file(path: str):
+    """
+    Load a YAML file. The parsed data is also stored in a compact cache
+    (pickle) in Paths.compact, which is used instead of the YAML file as
+    long as the latter does not change: the YAML file remains the source
+    of truth, it can still be edited by hand.
+    Raises the same exceptions of opening and loading the file.
+    """
+    st = __get_stat(path)
+    cache = __get_compact_path(path)
+    if cache is None:
+        with open(path, "r") as f:
+            return load(f)
+
+    with contextlib.suppress(Exception):
+        with open(cache, "rb") as f:
+            entry = pickle.load(f)
+        if entry["stat"] == st:
+            return entry["data"]
+
+    with open(path, "r") as f:
+        data = load(f)
+
+    # a change within the timestamp granularity would go unnoticed
+    if st[2] < time.time_ns() - racy_window * 10 ** 9:
+        with contextlib.suppress(OSError, pickle.PickleError):
+            os.makedirs(os.path.dirname(cache), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(cache))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump({"stat": st, "data": data}, f, protocol=5)
+                os.replace(tmp, cache)
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp)
+    return data
+
+
+def dump_file(data, path: str, **kwargs):
+    """Dump data to a YAML file, dropping its compact cache."""
+    with open(path, "w") as f:
+        dump(data, f, **kwargs)
+    cache = __get_compact_path(path)
+    if cache is not None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(cache)
\ No newline at end of file
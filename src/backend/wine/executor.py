@@ -14,6 +14,7 @@ from bottles.backend.wine.explorer import Explorer
 from bottles.backend.wine.winepath import WinePath
 from bottles.backend.wine.winedbg import WineDbg
 from bottles.backend.wine.winebridge import WineBridge
+from bottles.backend.wine.session import BottleSession
 
 logging = Logger()
 
@@ -118,7 +119,7 @@ class WineExecutor:
         ).run()
 
     def __get_cwd(self, cwd: str) -> Union[str, None]:
-        winepath = WinePath(self.config)
+        winepath = BottleSession.get(self.config).get_program(WinePath)
         if cwd in [None, ""]:
             path = self.exec_path
             if winepath.is_windows(self.exec_path):
@@ -184,7 +185,7 @@ class WineExecutor:
         so we use Wine Starter, which will exit as soon
         as the program is launched
         """
-        winepath = WinePath(self.config)
+        winepath = BottleSession.get(self.config).get_program(WinePath)
         start = Start(self.config)
 
         if winepath.is_unix(self.exec_path):
@@ -224,7 +225,7 @@ class WineExecutor:
         #         status=True,
         #         data={"output": res}
         #     )
-        winepath = WinePath(self.config)
+        winepath = BottleSession.get(self.config).get_program(WinePath)
         if self.use_virt_desktop:
             if winepath.is_unix(self.exec_path):
                 self.exec_path = winepath.to_windows(self.exec_path)
@@ -346,6 +347,6 @@ class WineExecutor:
 
         logging.info("Starting {} monitors".format(len(self.monitoring)))
 
-        winedbg = WineDbg(self.config, silent=True)
+        winedbg = BottleSession.get(self.config).get_program(WineDbg, silent=True)
         for m in self.monitoring:
             winedbg.wait_for_process(name=m)
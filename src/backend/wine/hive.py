@@ -0,0 +1,758 @@
+import os
+import time
+import fcntl
+import tempfile
+import contextlib
+
+from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
+
+logging = Logger()
+
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_BINARY = 3
+REG_DWORD = 4
+REG_LINK = 6
+REG_MULTI_SZ = 7
+REG_QWORD = 11
+
+# .reg files are written as regedit exports them, in UTF-16 with this
+# header, so the strings (also the hex data of REG_EXPAND_SZ and
+# REG_MULTI_SZ values) don't depend on the ANSI code page of the prefix
+REG_HEADER = "Windows Registry Editor Version 5.00"
+REG_ENCODING = "utf-16"
+
+# seconds between 1601-01-01 (FILETIME epoch) and 1970-01-01
+_FILETIME_EPOCH = 11644473600
+
+_ESCAPES = {"a": "\a", "b": "\b", "e": "\x1b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+_CONTROLS = {v: k for k, v in _ESCAPES.items()}
+
+
+def escape(text: str, quotes: str = '""') -> str:
+    """Escape text as wine does when saving a hive (dump_strW)."""
+    res = []
+    for i, c in enumerate(text):
+        o = ord(c)
+        if o < 32:
+            if c in _CONTROLS:
+                res.append(f"\\{_CONTROLS[c]}")
+            elif text[i + 1:i + 2] in list("01234567"):
+                res.append(f"\\{o:03o}")
+            else:
+                res.append(f"\\{o:o}")
+        elif o < 127:
+            if c == "\\" or c in quotes:
+                res.append("\\")
+            res.append(c)
+        else:
+            units = c.encode("utf-16-le")
+            for j in range(0, len(units), 2):
+                res.append(f"\\x{int.from_bytes(units[j:j + 2], 'little'):04x}")
+    return "".join(res)
+
+
+def unescape(text: str, start: int = 0, end_char: str = None):
+    """
+    Unescape text from start as wine does when loading a hive
+    (parse_strW). If end_char is given, stop at its first unescaped
+    occurrence and return (string, index after end_char).
+    """
+    if end_char is not None:
+        # fast path, for the (common) text with no other escape than \\
+        end = text.find(end_char, start)
+        if end != -1:
+            segment = text[start:end]
+            if "\\" not in segment.replace("\\\\", ""):
+                return segment.replace("\\\\", "\\"), end + 1
+
+    res = []
+    units = []  # pending UTF-16 code units from \x escapes
+    i, size = start, len(text)
+
+    def flush_units():
+        if units:
+            res.append(b"".join(u.to_bytes(2, "little") for u in units).decode("utf-16-le", "surrogatepass"))
+            units.clear()
+
+    while i < size:
+        c = text[i]
+        if end_char is not None and c == end_char:
+            flush_units()
+            return "".join(res), i + 1
+        if c != "\\" or i + 1 >= size:
+            flush_units()
+            res.append(c)
+            i += 1
+            continue
+
+        c = text[i + 1]
+        i += 2
+        if c == "x":
+            j = i
+            while j < size and j - i < 4 and text[j] in "0123456789abcdefABCDEF":
+                j += 1
+            if j == i:
+                flush_units()
+                res.append("x")
+                continue
+            units.append(int(text[i:j], 16))
+            i = j
+            continue
+
+        flush_units()
+        if c in "01234567":
+            j = i
+            while j < size and j - i < 2 and text[j] in "01234567":
+                j += 1
+            res.append(chr(int(text[i - 1:j], 8)))
+            i = j
+        else:
+            res.append(_ESCAPES.get(c, c))
+
+    if end_char is not None:
+        raise ValueError(f"Missing {end_char} in {text!r}")
+    flush_units()
+    return "".join(res)
+
+
+def sort_key(name: str) -> tuple:
+    """Return the key to sort key names in the order wine saves them."""
+    # depth first, the subkeys sorted by their upper case names
+    return tuple(name.upper().split("\\"))
+
+
+def filetime(seconds: float = None) -> int:
+    if seconds is None:
+        seconds = time.time()
+    return int((seconds + _FILETIME_EPOCH) * 10 ** 7)
+
+
+class HiveKey:
+    """
+    A key of a hive. The values are kept as the text they were read from
+    (value_lines) and only parsed on request, so keys which are not
+    modified are written back as they were read and can be compared
+    without being parsed.
+    """
+
+    __slots__ = ("name", "mtime", "meta", "value_lines", "raw", "_values")
+
+    def __init__(self, name: str, mtime: int = 0):
+        self.name = name
+        self.mtime = mtime
+        self.meta = []  # "#time=…", "#class=…", "#link"…
+        self.value_lines = []
+        self.raw = None  # header line read from the hive, None once modified
+        self._values = None
+
+    @classmethod
+    def parse_header(cls, line: str) -> "HiveKey":
+        name, pos = unescape(line, 1, "]")
+        try:
+            mtime = int(line[pos:].strip() or 0)
+        except ValueError:
+            mtime = 0
+        key = cls(name, mtime)
+        key.raw = line
+        return key
+
+    @staticmethod
+    def parse_value_name(line: str):
+        """Return the (name, data text) of a value line, "" is the default value."""
+        if line.startswith("@="):
+            return "", line[2:]
+        if not line.startswith('"'):
+            raise ValueError(f"Invalid value line: {line!r}")
+        name, pos = unescape(line, 1, '"')
+        if line[pos:pos + 1] != "=":
+            raise ValueError(f"Invalid value line: {line!r}")
+        return name, line[pos + 1:]
+
+    @property
+    def values(self) -> dict:
+        """The {lower name: (name, raw line)} dict of the values."""
+        if self._values is None:
+            self._values = {}
+            for line in self.value_lines:
+                name = self.parse_value_name(line)[0]
+                self._values[name.lower()] = (name, line)
+        return self._values
+
+    @property
+    def is_link(self) -> bool:
+        return "#link" in self.meta
+
+    def get_value(self, name: str):
+        """Return the (type, data) of a value, None if it does not exist."""
+        value = self.values.get(name.lower())
+        if value is None:
+            return None
+        return parse_data(self.parse_value_name(value[1])[1])
+
+    def set_value(self, name: str, value_type: int, data):
+        self.values[name.lower()] = (name, format_value(name, value_type, data))
+        self.touch()
+
+    def delete_value(self, name: str) -> bool:
+        if self.values.pop(name.lower(), None) is None:
+            return False
+        self.touch()
+        return True
+
+    def touch(self):
+        now = time.time()
+        self.mtime = int(now)
+        self.meta = [m for m in self.meta if not m.startswith("#time=")]
+        self.meta.insert(0, f"#time={filetime(now):x}")
+        self.value_lines = [raw for _name, raw in self.values.values()]
+        self.raw = None
+
+    def get_lines(self) -> list:
+        header = self.raw if self.raw is not None else f"[{escape(self.name, '[]')}] {self.mtime}"
+        return [header] + self.meta + self.value_lines
+
+
+def parse_data(text: str):
+    """Parse the data of a value as written in a hive or .reg file, return (type, data)."""
+    if text.startswith('"'):
+        return REG_SZ, unescape(text, 1, '"')[0]
+
+    for prefix, value_type in [("str:", REG_SZ), ("str(2):", REG_EXPAND_SZ), ("str(7):", REG_MULTI_SZ)]:
+        if text.startswith(prefix + '"'):
+            data = unescape(text, len(prefix) + 1, '"')[0]
+            if value_type == REG_MULTI_SZ:
+                return value_type, [s for s in data.split("\0") if s]
+            return value_type, data
+
+    if text.startswith("dword:"):
+        return REG_DWORD, int(text[6:].strip(), 16)
+
+    value_type = REG_BINARY
+    if text.startswith("hex("):
+        end = text.index("):")
+        value_type = int(text[4:end], 16)
+        text = text[end + 2:]
+    elif text.startswith("hex:"):
+        text = text[4:]
+    else:
+        raise ValueError(f"Unknown value data: {text!r}")
+
+    hex_data = "".join(text.replace("\\\n", "").split()).replace(",", "")
+    return value_type, bytes.fromhex(hex_data)
+
+
+def format_data(value_type: int, data) -> str:
+    """Return the data of a value as wine writes it in a hive."""
+    if value_type == REG_SZ and isinstance(data, str):
+        return f'"{escape(data)}"'
+    if value_type == REG_EXPAND_SZ and isinstance(data, str):
+        return f'str(2):"{escape(data)}"'
+    if value_type == REG_MULTI_SZ and isinstance(data, (list, tuple)):
+        return f'str(7):"{escape("".join(f"{s}{chr(0)}" for s in data))}"'
+    if value_type == REG_DWORD and isinstance(data, int):
+        return f"dword:{data & 0xffffffff:08x}"
+    if value_type == REG_QWORD and isinstance(data, int):
+        data = (data & 0xffffffffffffffff).to_bytes(8, "little")
+    if not isinstance(data, (bytes, bytearray)):
+        raise ValueError(f"Invalid data for registry type {value_type}: {data!r}")
+
+    prefix = "hex:" if value_type == REG_BINARY else f"hex({value_type:x}):"
+    return prefix + ",".join(f"{b:02x}" for b in data)
+
+
+def format_value(name: str, value_type: int, data) -> str:
+    _name = "@" if name == "" else f'"{escape(name)}"'
+    return f"{_name}={format_data(value_type, data)}"
+
+
+class HiveReader:
+    """
+    Read the keys of a hive one at a time, without loading the whole
+    file. The header (the lines before the first key) is available as
+    soon as the reader is created.
+    """
+
+    def __init__(self, file):
+        self.__lines = iter(file)
+        self.__pending = None
+        self.header = []
+        for line in self.__lines:
+            line = line.rstrip("\n")
+            if line.startswith("["):
+                self.__pending = line
+                break
+            self.header.append(line)
+        # the blank line before each key is not part of the header
+        while self.header and not self.header[-1]:
+            self.header.pop()
+
+    def __iter__(self):
+        if self.__pending is None:
+            return
+        key = HiveKey.parse_header(self.__pending)
+        self.__pending = None
+        continued = False
+
+        for line in self.__lines:
+            if line[-1:] == "\n":
+                line = line[:-1]
+            if continued:
+                # hex data continued from the previous line
+                key.value_lines[-1] += "\n" + line
+                continued = line[-1:] == "\\"
+                continue
+            if not line:
+                continue
+
+            c = line[0]
+            if c == "[":
+                yield key
+                key = HiveKey.parse_header(line)
+            elif c == "#" or c == ";":
+                key.meta.append(line)
+            else:
+                key.value_lines.append(line)
+                continued = line[-1] == "\\"
+
+        yield key
+
+
+class RegistryHive:
+    """
+    A wine registry hive (system.reg, user.reg, userdef.reg), read and
+    written in the text format of the wineserver. It must only be
+    written while the wineserver of the prefix is not running, as the
+    wineserver keeps the registry in memory and saves it on exit.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.keys = {}  # lower name: HiveKey
+        self.modified = False
+        with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+            reader = HiveReader(f)
+            self.header = reader.header
+            for key in reader:
+                self.keys[key.name.lower()] = key
+
+        if not self.header or not self.header[0].startswith("WINE REGISTRY Version 2"):
+            raise ValueError(f"{path} is not a wine registry hive")
+
+    def get_key(self, name: str, create: bool = False):
+        key = self.keys.get(name.lower())
+        if key is None and create:
+            key = HiveKey(name)
+            key.touch()
+            self.keys[name.lower()] = key
+            self.modified = True
+        return key
+
+    def get_value(self, key: str, name: str):
+        """Return the (type, data) of a value, None if it does not exist."""
+        _key = self.get_key(key)
+        return _key.get_value(name) if _key else None
+
+    def set_value(self, key: str, name: str, value_type: int, data):
+        self.get_key(key, create=True).set_value(name, value_type, data)
+        self.modified = True
+
+    def delete_value(self, key: str, name: str) -> bool:
+        _key = self.get_key(key)
+        if _key is None or not _key.delete_value(name):
+            return False
+        self.modified = True
+        return True
+
+    def delete_key(self, name: str) -> bool:
+        """Delete a key with its subkeys."""
+        prefix = name.lower() + "\\"
+        found = [k for k in self.keys if k == name.lower() or k.startswith(prefix)]
+        for k in found:
+            del self.keys[k]
+        self.modified = self.modified or bool(found)
+        return bool(found)
+
+    def resolve(self, name: str) -> str:
+        """
+        Follow the symbolic links (e.g. System\\CurrentControlSet) found
+        in name. Return the real name of the key, raise ValueError if a
+        link leads outside of this hive.
+        """
+        parts = name.split("\\")
+        for i in range(1, len(parts) + 1):
+            key = self.keys.get("\\".join(parts[:i]).lower())
+            if key is None or not key.is_link:
+                continue
+            value = key.get_value("SymbolicLinkValue")
+            if value is None:
+                continue
+            target = value[1].decode("utf-16-le") if isinstance(value[1], bytes) else value[1]
+            target = target.rstrip("\0")
+            root = self.get_root()
+            if not root or not target.lower().startswith(root.lower() + "\\"):
+                raise ValueError(f"The link {key.name} leads outside of {self.path}")
+            return self.resolve("\\".join([target[len(root) + 1:]] + parts[i:]))
+        return name
+
+    def get_root(self) -> str:
+        """Return the path of the hive in the registry, e.g. \\Registry\\Machine."""
+        for line in self.header:
+            if line.startswith(";; All keys relative to "):
+                # e.g. \\Machine or \\User\\S-1-5-21-0-0-0-1000
+                return "\\Registry" + unescape(line[len(";; All keys relative to "):])
+        return ""
+
+    def save(self):
+        """Atomically write the hive."""
+        try:
+            mode = os.stat(self.path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+
+        fd, tmp = tempfile.mkstemp(prefix=".hive-", suffix=".reg.part", dir=os.path.dirname(self.path))
+        try:
+            os.fchmod(fd, mode)
+            with os.fdopen(fd, "w", encoding="utf-8", errors="surrogateescape") as f:
+                for line in self.header:
+                    f.write(line + "\n")
+                for key in sorted(self.keys.values(), key=lambda k: sort_key(k.name)):
+                    f.write("\n")
+                    f.write("\n".join(key.get_lines()) + "\n")
+            os.replace(tmp, self.path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+            raise
+        self.modified = False
+
+
+@contextlib.contextmanager
+def server_lock(prefix: str):
+    """
+    Take the lock the wineserver of prefix holds while it runs, yield
+    False if it is held (the wineserver is running). While the lock is
+    held, a wineserver started for prefix waits for it before loading
+    the hives.
+    """
+    st = os.stat(prefix)
+    base = f"/tmp/.wine-{os.getuid()}"
+    server_dir = os.path.join(base, f"server-{st.st_dev:x}-{st.st_ino:x}")
+    # wine refuses to use these directories if others can access them
+    for _dir in [base, server_dir]:
+        with contextlib.suppress(FileExistsError):
+            os.mkdir(_dir, 0o700)
+
+    fd = os.open(os.path.join(server_dir, "lock"), os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+    try:
+        try:
+            # the same record lock as wine: a write lock on the first byte
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 0)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, 0)
+    finally:
+        os.close(fd)
+
+
+class OfflineRegistry:
+    """
+    Apply registry changes to the hives of a bottle without running
+    wine, for when its wineserver is not running: see server_lock.
+    """
+
+    roots = {
+        "HKEY_LOCAL_MACHINE": ("system.reg", ""),
+        "HKLM": ("system.reg", ""),
+        "HKEY_CLASSES_ROOT": ("system.reg", "Software\\Classes"),
+        "HKCR": ("system.reg", "Software\\Classes"),
+        "HKEY_CURRENT_USER": ("user.reg", ""),
+        "HKCU": ("user.reg", ""),
+        "HKEY_USERS\\.DEFAULT": ("userdef.reg", "")
+    }
+
+    def __init__(self, bottle_path: str):
+        self.bottle_path = bottle_path
+        self.__hives = {}
+
+    def locate(self, key: str):
+        """Return the (hive, key name in the hive) of a full key path."""
+        for root, (hive_file, base) in self.roots.items():
+            if key.upper() == root or key.upper().startswith(root + "\\"):
+                name = "\\".join(p for p in [base, key[len(root) + 1:]] if p)
+                if hive_file not in self.__hives:
+                    self.__hives[hive_file] = RegistryHive(os.path.join(self.bottle_path, hive_file))
+                hive = self.__hives[hive_file]
+                return hive, hive.resolve(name)
+        raise ValueError(f"Unsupported registry root: {key}")
+
+    @staticmethod
+    def __unescape_reg(text: str) -> str:
+        """Unescape a string of a .reg file, as regedit does."""
+        res, i = [], 0
+        while i < len(text):
+            if text[i] == "\\" and i + 1 < len(text):
+                # unknown escapes are kept as they are
+                _escapes = {"\\": "\\", '"': '"', "n": "\n", "r": "\r", "0": "\0"}
+                res.append(_escapes.get(text[i + 1], text[i:i + 2]))
+                i += 2
+                continue
+            res.append(text[i])
+            i += 1
+        return "".join(res)
+
+    def apply_bundle(self, bundle: dict):
+        """
+        Apply a bundle in the format of Reg.import_bundle and write the
+        modified hives. Raise ValueError (nothing is written) if a change
+        cannot be applied offline.
+        """
+        changes = []
+        for key, values in bundle.items():
+            if key.startswith("-"):
+                hive, name = self.locate(key[1:])
+                changes.append((hive.delete_key, name))
+                continue
+
+            hive, name = self.locate(key)
+            changes.append((hive.get_key, name, True))
+            for value in values:
+                value_name = self.__unescape_reg(str(value["value"]))
+                data = value["data"]
+                if data == "-":
+                    changes.append((hive.delete_value, name, value_name))
+                elif "key_type" in value:
+                    value_type, data = parse_data(f"{value['key_type']}:{data}")
+                    if value_type in [REG_EXPAND_SZ, REG_MULTI_SZ]:
+                        data = data.decode("utf-16-le", errors="surrogatepass")
+                        if value_type == REG_EXPAND_SZ:
+                            data = data.split("\0")[0]
+                        else:
+                            data = [_s for _s in data.split("\0") if _s]
+                    changes.append((hive.set_value, name, value_name, value_type, data))
+                else:
+                    changes.append((hive.set_value, name, value_name, REG_SZ, self.__unescape_reg(str(data))))
+
+        for func, *args in changes:
+            func(*args)
+
+        for hive in self.__hives.values():
+            if hive.modified:
+                hive.save()
+
+
+def write_reg(bundle: dict, file, header: bool = True):
+    """
+    Write a bundle in the format of Reg.import_bundle as a .reg file,
+    which has to be opened with REG_ENCODING. Keys prefixed with - are
+    deleted.
+    """
+    if header:
+        file.write(f"{REG_HEADER}\n\n")
+
+    for key in bundle:
+        file.write(f"[{key}]\n")
+
+        for value in bundle[key]:
+            if value["data"] == "-":
+                file.write(f'"{value["value"]}"=-\n')
+            elif "key_type" in value:
+                file.write(f'"{value["value"]}"={value["key_type"]}:{value["data"]}\n')
+            else:
+                file.write(f'"{value["value"]}"="{value["data"]}"\n')
+
+        file.write("\n")
+
+
+class RegistryDiff:
+    """
+    Compare two versions of a hive (e.g. a bottle hive and the one of a
+    layer mounting it) and return the changes as a bundle in the format
+    of Reg.import_bundle, which turns the old hive into the new one.
+
+    The hives are read one key at a time, walking both files in the
+    order wine saves the keys (depth first, subkeys sorted), so hives
+    of hundreds of MB are compared in constant memory. Hives which are
+    not in this order are sorted in memory instead.
+    """
+
+    roots = {
+        "\\Machine": "HKEY_LOCAL_MACHINE",
+        "\\User\\.Default": "HKEY_USERS\\.Default",
+        "\\User": "HKEY_CURRENT_USER"
+    }
+
+    class Unsorted(ValueError):
+        pass
+
+    def __init__(self, old_path: str, new_path: str):
+        self.old_path = old_path
+        self.new_path = new_path
+
+    def __get_root(self, header: list) -> str:
+        for line in header:
+            if line.startswith(";; All keys relative to "):
+                path = unescape(line[len(";; All keys relative to "):])
+                for root, key in self.roots.items():
+                    if path == root or path.startswith(root + "\\"):
+                        return key
+        raise ValueError(f"Unknown registry root in {self.new_path}")
+
+    @classmethod
+    def __stream(cls, reader):
+        last = None
+        for key in reader:
+            _key = sort_key(key.name)
+            if last is not None and _key <= last:
+                raise cls.Unsorted(f"{key.name} is out of order")
+            last = _key
+            yield _key, key
+
+    @classmethod
+    def __sorted(cls, reader):
+        return iter(sorted(((sort_key(k.name), k) for k in reader), key=lambda k: k[0]))
+
+    @staticmethod
+    def __escape_reg(text: str) -> str:
+        return text.replace("\\", "\\\\").replace('"', '\\"')
+
+    @classmethod
+    def to_entry(cls, name: str, raw: str) -> dict:
+        """Convert a value line of a hive to an import_bundle entry."""
+        value_type, data = parse_data(HiveKey.parse_value_name(raw)[1])
+        entry = {"value": cls.__escape_reg(name)}
+
+        if value_type == REG_SZ and isinstance(data, str) and data.isascii() and data.isprintable():
+            entry["data"] = cls.__escape_reg(data)
+            return entry
+        if value_type == REG_DWORD:
+            entry["data"] = f"{data:08x}"
+            entry["key_type"] = "dword"
+            return entry
+
+        # the strings are stored in UTF-16 as in the hive, whatever the type
+        if isinstance(data, str):
+            data = f"{data}\0".encode("utf-16-le", errors="surrogatepass")
+        elif isinstance(data, list):
+            data = "".join(f"{_s}\0" for _s in data + [""]).encode("utf-16-le", errors="surrogatepass")
+
+        entry["data"] = ",".join(f"{b:02x}" for b in data)
+        entry["key_type"] = "hex" if value_type == REG_BINARY else f"hex({value_type:x})"
+        return entry
+
+    @staticmethod
+    def __strings(data) -> list:
+        if isinstance(data, bytes):
+            return data.decode("utf-16-le", errors="replace").rstrip("\0").split("\0")
+        return data if isinstance(data, list) else [data]
+
+    @classmethod
+    def __same_value(cls, old_raw: str, new_raw: str) -> bool:
+        """Compare two value lines, ignoring how the data is formatted."""
+        if old_raw == new_raw:
+            return True
+        old_type, old_data = parse_data(HiveKey.parse_value_name(old_raw)[1])
+        new_type, new_data = parse_data(HiveKey.parse_value_name(new_raw)[1])
+        if old_type != new_type:
+            return False
+        if old_type in [REG_SZ, REG_EXPAND_SZ, REG_MULTI_SZ]:
+            # the same string can be stored as str(N) or hex(N)
+            return cls.__strings(old_data) == cls.__strings(new_data)
+        return old_data == new_data
+
+    def changes(self, sort: bool = False):
+        """
+        Yield the (key, entries) changes, in the format of the bundles of
+        Reg.import_bundle. Raise RegistryDiff.Unsorted if a hive is not
+        in the order wine saves it and sort is False.
+        """
+        with open(self.old_path, "r", encoding="utf-8", errors="surrogateescape") as old_file, \
+                open(self.new_path, "r", encoding="utf-8", errors="surrogateescape") as new_file:
+            old_reader = HiveReader(old_file)
+            new_reader = HiveReader(new_file)
+            root = self.__get_root(new_reader.header)
+            walk = self.__sorted if sort else self.__stream
+            yield from self.__merge(root, walk(old_reader), walk(new_reader))
+
+    def __merge(self, root: str, old, new):
+        old_item = next(old, None)
+        new_item = next(new, None)
+        deleted = None  # sort key of the last deleted key, its subkeys are gone too
+
+        while old_item is not None or new_item is not None:
+            if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+                _key, key = old_item
+                old_item = next(old, None)
+                if deleted is not None and _key[:len(deleted)] == deleted:
+                    continue
+                if key.is_link:
+                    continue
+                # wine does not save the keys having subkeys but no values,
+                # the key still exists if the new hive has a subkey of it
+                if new_item is not None and new_item[0][:len(_key)] == _key:
+                    entries = [{"value": self.__escape_reg(n), "data": "-"} for n, _r in key.values.values()]
+                    if entries:
+                        yield f"{root}\\{key.name}", entries
+                    continue
+                deleted = _key
+                yield f"-{root}\\{key.name}", []
+                continue
+
+            if old_item is None or new_item[0] < old_item[0]:
+                _key, key = new_item
+                new_item = next(new, None)
+                if not key.is_link:
+                    yield f"{root}\\{key.name}", [self.to_entry(n, r) for n, r in key.values.values()]
+                continue
+
+            old_key = old_item[1]
+            new_key = new_item[1]
+            old_item = next(old, None)
+            new_item = next(new, None)
+            if old_key.value_lines == new_key.value_lines or new_key.is_link:
+                continue
+
+            old_values = old_key.values
+            entries = [
+                {"value": self.__escape_reg(name), "data": "-"}
+                for lower, (name, _raw) in old_values.items()
+                if lower not in new_key.values
+            ]
+            entries += [
+                self.to_entry(name, raw)
+                for lower, (name, raw) in new_key.values.items()
+                if lower not in old_values or not self.__same_value(old_values[lower][1], raw)
+            ]
+            if entries:
+                yield f"{root}\\{new_key.name}", entries
+
+    def get_bundle(self) -> dict:
+        """Return the changes as a bundle for Reg.import_bundle."""
+        try:
+            return dict(self.changes())
+        except self.Unsorted as e:
+            logging.warning(f"Comparing the hives in memory: {e}")
+            return dict(self.changes(sort=True))
+
+    def export(self, path: str) -> int:
+        """
+        Write the changes to path as a .reg patch and return the number
+        of changed keys.
+        """
+        for sort in [False, True]:
+            count = 0
+            try:
+                with open(path, "w", encoding=REG_ENCODING, errors="surrogatepass") as f:
+                    f.write(f"{REG_HEADER}\n\n")
+                    for key, entries in self.changes(sort=sort):
+                        write_reg({key: entries}, f, header=False)
+                        count += 1
+                return count
+            except self.Unsorted as e:
+                logging.warning(f"Comparing the hives in memory: {e}")
+        return 0
+
@@ -1,10 +1,14 @@
 import os
 import uuid
+import struct
+import threading
+import contextlib
 from typing import NewType
 
 from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
 from bottles.backend.wine.wineprogram import WineProgram
 from bottles.backend.wine.winedbg import WineDbg
+from bottles.backend.wine.hive import OfflineRegistry, REG_ENCODING, server_lock, write_reg
 from bottles.backend.utils.manager import ManagerUtils
 
 logging = Logger()
@@ -14,11 +18,105 @@ class Reg(WineProgram):
     program = "Wine Registry CLI"
     command = "reg"
 
+    def __init__(self, config: dict, silent=False):
+        super().__init__(config, silent=silent)
+        self.__local = threading.local()
+
+    @property
+    def __bundle(self):
+        """The bundle of the running transaction of this thread, if any."""
+        if getattr(self.__local, "depth", 0) > 0:
+            return self.__local.bundle
+        return None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Gather the add, remove and import_bundle calls made by this thread
+        in the with block and apply them with a single import when the
+        outermost transaction ends, instead of launching reg.exe for each
+        of them. Nested transactions join the outer one. Nothing is
+        applied if the block raises.
+        """
+        local = self.__local
+        if getattr(local, "depth", 0) == 0:
+            local.depth = 0
+            local.bundle = {}
+        local.depth += 1
+        try:
+            yield self
+        except BaseException:
+            local.bundle = {}
+            raise
+        finally:
+            local.depth -= 1
+
+        if local.depth == 0 and local.bundle:
+            bundle = {key: list(values.values()) for key, values in local.bundle.items()}
+            local.bundle = {}
+            self.__import(bundle)
+
+    def __queue(self, key: str, entry: dict):
+        # the last change of a value wins, as it would applying them in order
+        values = self.__bundle.setdefault(key, {})
+        values.pop(entry["value"], None)
+        values[entry["value"]] = entry
+
+    @staticmethod
+    def __escape(text) -> str:
+        return str(text).replace("\\", "\\\\").replace('"', '\\"')
+
+    @staticmethod
+    def __hex(data: bytes) -> str:
+        return ",".join(f"{b:02x}" for b in data)
+
+    @staticmethod
+    def __to_int(data) -> int:
+        try:
+            return int(str(data), 0)
+        except ValueError:
+            return int(str(data))
+
+    def __to_entry(self, value: str, data, key_type) -> dict:
+        """Convert the arguments of a reg.exe add to an import_bundle entry."""
+        value = self.__escape(value)
+        data = "" if data is None else data
+
+        if key_type in [False, None, "", "REG_SZ"]:
+            return {"value": value, "data": self.__escape(data)}
+        if key_type == "REG_DWORD":
+            return {"value": value, "data": f"{self.__to_int(data) & 0xffffffff:08x}", "key_type": "dword"}
+        if key_type == "REG_QWORD":
+            _data = struct.pack("<Q", self.__to_int(data) & 0xffffffffffffffff)
+            return {"value": value, "data": self.__hex(_data), "key_type": "hex(b)"}
+        if key_type == "REG_EXPAND_SZ":
+            _data = f"{data}\0".encode("utf-16-le")
+            return {"value": value, "data": self.__hex(_data), "key_type": "hex(2)"}
+        if key_type == "REG_MULTI_SZ":
+            # reg.exe separates the strings with \0
+            _data = "".join(f"{s}\0" for s in str(data).split("\\0") if s) + "\0"
+            return {"value": value, "data": self.__hex(_data.encode("utf-16-le")), "key_type": "hex(7)"}
+        if key_type == "REG_BINARY":
+            return {"value": value, "data": self.__hex(bytes.fromhex(str(data))), "key_type": "hex"}
+        raise ValueError(f"Unsupported registry type: {key_type}")
+
     def add(self, key: str, value: str, data: str, key_type: str = False):
         config = self.config
+
+        if self.__bundle is not None:
+            try:
+                self.__queue(key, self.__to_entry(value, data, key_type))
+                return
+            except ValueError as e:
+                logging.warning(f"{e}, adding [{value}] outside of the transaction.")
+        else:
+            with contextlib.suppress(ValueError):
+                if self.__apply_offline({key: [self.__to_entry(value, data, key_type)]}):
+                    return
+
         logging.info(f"Adding Key: [{key}] with Value: [{value}] and "
                      f"Data: [{data}] in {config['Name']} registry")
-        winedbg = WineDbg(config)
+        winedbg = self.session.get_program(WineDbg)
         args = "add '%s' /v '%s' /d '%s' /f" % (key, value, data)
 
         if key_type:
@@ -27,7 +125,7 @@ class Reg(WineProgram):
             )
 
         # avoid conflicts when executing async
-        winedbg.wait_for_process("reg.exe")
+        winedbg.wait_for_process("reg.exe", timeout=60)
 
         res = self.launch(args, communicate=True, minimal=True, action_name="add")
         logging.info(res, )
@@ -35,45 +133,72 @@ class Reg(WineProgram):
     def remove(self, key: str, value: str):
         """Remove a key from the registry"""
         config = self.config
+
+        if self.__bundle is not None:
+            self.__queue(key, {"value": self.__escape(value), "data": "-"})
+            return
+        if self.__apply_offline({key: [{"value": self.__escape(value), "data": "-"}]}):
+            return
+
         logging.info(f"Removing Value: [{key}] from Key: [{value}] in "
                      f"{config['Name']} registry")
-        winedbg = WineDbg(config)
+        winedbg = self.session.get_program(WineDbg)
         args = "delete '%s' /v %s /f" % (key, value)
 
         # avoid conflicts when executing async
-        winedbg.wait_for_process("reg.exe")
+        winedbg.wait_for_process("reg.exe", timeout=60)
 
         res = self.launch(args, communicate=True, minimal=True, action_name="remove")
         logging.info(res, )
 
     def import_bundle(self, bundle: dict):
         """Import a bundle of keys into the registry"""
+        if self.__bundle is not None:
+            for key in bundle:
+                self.__bundle.setdefault(key, {})
+                for value in bundle[key]:
+                    self.__queue(key, value)
+            return
+
+        self.__import(bundle)
+
+    def __apply_offline(self, bundle: dict) -> bool:
+        """
+        Write the bundle straight to the hives of the bottle if its
+        wineserver is not running, instead of starting wine to import it.
+        Return False if wine has to be used.
+        """
+        config = self.config
+        try:
+            # held while writing, so a wineserver cannot load the old hives
+            with server_lock(self.session.bottle_path) as locked:
+                if not locked:
+                    return False
+                OfflineRegistry(self.session.bottle_path).apply_bundle(bundle)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Cannot edit the registry of {config['Name']} offline: {e}")
+            return False
+
+        logging.info(f"Registry of {config['Name']} updated offline")
+        return True
+
+    def __import(self, bundle: dict):
+        if self.__apply_offline(bundle):
+            return
+
         config = self.config
         logging.info(f"Importing bundle to {config['Name']} registry")
-        winedbg = WineDbg(config)
+        winedbg = self.session.get_program(WineDbg)
         reg_file = ManagerUtils.get_temp_path(f"{uuid.uuid4()}.reg")
 
         # prepare reg file
-        with open(reg_file, "w") as f:
-            f.write("REGEDIT4\n\n")
-
-            for key in bundle:
-                f.write(f"[{key}]\n")
-
-                for value in bundle[key]:
-                    if value["data"] == "-":
-                        f.write(f'"{value["value"]}"=-\n')
-                    elif "key_type" in value:
-                        f.write(f'"{value["value"]}"={value["key_type"]}:{value["data"]}\n')
-                    else:
-                        f.write(f'"{value["value"]}"="{value["data"]}"\n')
-
-                f.write("\n")
+        with open(reg_file, "w", encoding=REG_ENCODING) as f:
+            write_reg(bundle, f)
 
         args = f"import {reg_file}"
 
         # avoid conflicts when executing async
-        winedbg.wait_for_process("reg.exe")
+        winedbg.wait_for_process("reg.exe", timeout=60)
 
         res = self.launch(args, communicate=True, minimal=True, action_name="import_bundle")
         logging.info(res, )
@@ -4,6 +4,7 @@ from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
 from bottles.backend.wine.catalogs import win_versions
 from bottles.backend.wine.reg import Reg
 from bottles.backend.wine.wineboot import WineBoot
+from bottles.backend.wine.session import BottleSession
 
 logging = Logger()
 
@@ -12,7 +13,8 @@ class RegKeys:
 
     def __init__(self, config: dict):
         self.config = config
-        self.reg = Reg(self.config)
+        self.session = BottleSession.get(config)
+        self.reg = self.session.get_program(Reg)
 
     def set_windows(self, version: str):
         """
@@ -37,7 +39,7 @@ class RegKeys:
         if version == "winxp" and self.config.get("Arch") == "win64":
             version = "winxp64"
 
-        wineboot = WineBoot(self.config)
+        wineboot = self.session.get_program(WineBoot)
         del_keys = {
             "HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows\\CurrentVersion": [
                 "SubVersionNumber", "VersionNumber"
@@ -50,14 +52,6 @@ class RegKeys:
             "HKEY_LOCAL_MACHINE\\System\\CurrentControlSet\\Control\\Windows": "CSDVersion",
             "HKEY_CURRENT_USER\\Software\\Wine": "Version"
         }
-        for d in del_keys:
-            _val = del_keys.get(d)
-            if isinstance(_val, list):
-                for v in _val:
-                    self.reg.remove(d, v)
-            else:
-                self.reg.remove(d, _val)
-
         if version not in ["win98", "win95"]:
             bundle = {
                 "HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion": [
@@ -161,7 +155,17 @@ class RegKeys:
                 }
             ]
 
-        self.reg.import_bundle(bundle)
+        # the deletions and the new values are applied with a single import
+        with self.reg.transaction():
+            for d in del_keys:
+                _val = del_keys.get(d)
+                if isinstance(_val, list):
+                    for v in _val:
+                        self.reg.remove(d, v)
+                else:
+                    self.reg.remove(d, _val)
+
+            self.reg.import_bundle(bundle)
 
         wineboot.restart()
         wineboot.update()
@@ -188,19 +192,20 @@ class RegKeys:
         This function toggles the virtual desktop for a bottle, updating
         the Desktop's registry key.
         """
-        wineboot = WineBoot(self.config)
+        wineboot = self.session.get_program(WineBoot)
 
         if state:
-            self.reg.add(
-                key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer",
-                value="Desktop",
-                data="Default"
-            )
-            self.reg.add(
-                key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer\\Desktops",
-                value="Default",
-                data=resolution
-            )
+            with self.reg.transaction():
+                self.reg.add(
+                    key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer",
+                    value="Desktop",
+                    data="Default"
+                )
+                self.reg.add(
+                    key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer\\Desktops",
+                    value="Default",
+                    data=resolution
+                )
         else:
             self.reg.remove(
                 key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer",
@@ -0,0 +1,99 @@
+# session.py
+#
+# Copyright 2022 brombinmirko <send@mirko.pm>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, in version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+
+from bottles.backend.utils.manager import ManagerUtils
+
+
+class BottleSession:
+    """
+    Per-bottle state shared by the wine wrappers. The wrappers (WineBoot,
+    WineServer, WineDbg…) are created on first use and then reused, so
+    their caches (e.g. WineServer.is_alive) last between calls instead
+    of being lost with every new instance; the commands run for the
+    bottle drop them, since a launch can start or stop the wine server.
+    The values derived from the configuration (bottle path, runner
+    binary…) are computed once for each set of configuration values
+    they depend on.
+
+    A session follows a configuration dict: passing another dict for the
+    same bottle replaces the session, so a wrapper never runs with a
+    configuration other than the one it was asked for.
+    """
+
+    __sessions = {}
+    __lock = threading.Lock()
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.__lock = threading.Lock()
+        self.__programs = {}
+        self.__values = {}
+
+    @classmethod
+    def get(cls, config: dict) -> "BottleSession":
+        key = (config.get("Environment"), config.get("Path"), config.get("CompatData"))
+        with cls.__lock:
+            session = cls.__sessions.get(key)
+            if session is None or session.config is not config:
+                session = cls(config)
+                cls.__sessions[key] = session
+            return session
+
+    def get_program(self, program: type, silent: bool = False):
+        """Return the shared instance of a WineProgram for the bottle."""
+        with self.__lock:
+            key = (program, silent)
+            if key not in self.__programs:
+                self.__programs[key] = program(self.config, silent=silent)
+            return self.__programs[key]
+
+    def get_value(self, name: str, deps: tuple, func: callable):
+        """
+        Return func(), computed again only when deps (the configuration
+        values it depends on) change.
+        """
+        with self.__lock:
+            entry = self.__values.get(name)
+            if entry is not None and entry[0] == deps:
+                return entry[1]
+        value = func()
+        with self.__lock:
+            self.__values[name] = (deps, value)
+        return value
+
+    def clear_caches(self):
+        """Drop the cached state of the shared wrappers, e.g. after a launch."""
+        with self.__lock:
+            programs = list(self.__programs.values())
+        for program in programs:
+            program.clear_cache()
+
+    def clear_values(self):
+        """Drop the memoized values, e.g. when the configuration changes."""
+        with self.__lock:
+            self.__values.clear()
+
+    @property
+    def bottle_path(self) -> str:
+        config = self.config
+        return self.get_value(
+            "bottle_path",
+            (config.get("Environment"), config.get("Path"), config.get("CompatData")),
+            lambda: ManagerUtils.get_bottle_path(config)
+        )
@@ -19,7 +19,7 @@ class Start(WineProgram):
             environment: dict = None,
             cwd: str = None
     ):
-        winepath = WinePath(self.config)
+        winepath = self.session.get_program(WinePath)
 
         if winepath.is_unix(file):
             # running unix paths with start is not recommended
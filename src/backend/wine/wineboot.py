@@ -23,7 +23,7 @@ class WineBoot(WineProgram):
         }
         envs = {"WINEDEBUG": "-all", "DISPLAY": ":3.0", "WINEDLLOVERRIDES": "winemenubuilder=d"}
 
-        if status == 0 and not WineServer(self.config).is_alive():
+        if status == 0 and not self.session.get_program(WineServer).is_alive():
             logging.info("There is no running wineserver.")
             return
 
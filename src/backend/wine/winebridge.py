@@ -15,7 +15,7 @@ class WineBridge(WineProgram):
     internal_path = "winebridge"
 
     def __wineserver_status(self):
-        return WineServer(self.config).is_alive()
+        return self.session.get_program(WineServer).is_alive()
 
     def is_available(self):
         if os.path.isfile(self.get_command()):
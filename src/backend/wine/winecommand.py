@@ -8,8 +8,10 @@ from bottles.backend.managers.runtime import RuntimeManager
 from bottles.backend.managers.sandbox import SandboxManager
 from bottles.backend.utils.terminal import TerminalUtils
 from bottles.backend.utils.manager import ManagerUtils
+from bottles.backend.wine.session import BottleSession
 from bottles.backend.utils.display import DisplayUtils
 from bottles.backend.utils.gpu import GPUUtils
+from bottles.backend.utils.hardware import HardwareInventory
 from bottles.backend.globals import Paths, gamemode_available, gamescope_available, mangohud_available, \
     obs_vkc_available, vmtouch_available
 from bottles.backend.logger import Logger
@@ -77,6 +79,7 @@ class WineCommand:
     This class is used to run a wine command with a custom environment.
     It also handles the launch in a terminal or not.
     """
+    __runtimes = None
 
     def __init__(
             self,
@@ -108,7 +111,7 @@ class WineCommand:
         if config.get("Environment", "Custom") == "Steam":
             bottle = config.get("Path")
         else:
-            bottle = ManagerUtils.get_bottle_path(config)
+            bottle = BottleSession.get(config).bottle_path
 
         if not cwd:
             '''
@@ -126,6 +129,57 @@ class WineCommand:
         return cwd
 
     def get_env(self, environment: dict = None, return_steam_env: bool = False, return_clean_env: bool = False) -> dict:
+        """
+        Return the environment for the command. Building it probes the
+        runner and runtime libraries, so it is memoized in the bottle
+        session, keyed on what it depends on: the bottle configuration,
+        the given environment, the flags, the environment of Bottles
+        itself and the runner and runtime directories, so installing a
+        runner or a runtime is seen by the next command. The GPUs come
+        from the hardware inventory, which is fixed for the session.
+        """
+        config = self.config
+        runtimes = (self.__stat(Paths.runtimes), self.__stat("/app/etc/runtime"))
+        if runtimes != WineCommand.__runtimes:
+            # RuntimeManager keeps the runtimes found for the session
+            RuntimeManager.get_runtimes.cache_clear()
+            WineCommand.__runtimes = runtimes
+
+        try:
+            key = (
+                repr(config),
+                repr(environment),
+                dict(os.environ),
+                self.__stat(ManagerUtils.get_runner_path(config.get("Runner"))),
+                runtimes
+            )
+        except (TypeError, ValueError):
+            return self.__build_env(environment, return_steam_env, return_clean_env)
+
+        flags = (return_steam_env, return_clean_env, bool(self.terminal), bool(self.minimal))
+        env = BottleSession.get(config).get_value(
+            f"env:{flags}",
+            key,
+            lambda: self.__build_env(environment, return_steam_env, return_clean_env)
+        )
+
+        # the dxvk.conf written by the build can be removed meanwhile
+        conf = env.get("DXVK_CONFIG_FILE")
+        if conf and os.path.basename(conf) == "dxvk.conf" and not os.path.exists(conf):
+            params = config.get("Parameters") or {}
+            if params.get("dxvk_nvapi") and not return_steam_env:
+                self.__set_dxvk_nvapi_conf(os.path.dirname(conf))
+        return dict(env)
+
+    @staticmethod
+    def __stat(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def __build_env(self, environment: dict = None, return_steam_env: bool = False, return_clean_env: bool = False) -> dict:
         env = WineEnv(clean=return_steam_env or return_clean_env)
         config = self.config
         arch = config.get("Arch", None)
@@ -144,7 +198,7 @@ class WineCommand:
 
         dll_overrides = []
         gpu = GPUUtils().get_gpu()
-        is_nvidia = DisplayUtils.check_nvidia_device()
+        is_nvidia = HardwareInventory.get().has_vga("nvidia")
         ld = []
 
         # Bottle environment variables
@@ -363,6 +417,14 @@ class WineCommand:
         return env.get()["envs"]
 
     def __get_runner(self) -> str:
+        config = self.config
+        return BottleSession.get(config).get_value(
+            "runner",
+            (config.get("Runner"), config.get("Arch"), config.get("Environment"), config.get("RunnerPath")),
+            self.__resolve_runner
+        )
+
+    def __resolve_runner(self) -> str:
         config = self.config
         runner = config.get("Runner")
         arch = config.get("Arch")
@@ -536,6 +598,13 @@ class WineCommand:
         )
 
     def run(self):
+        try:
+            return self.__run()
+        finally:
+            # the launch may have started or stopped the wine server
+            BottleSession.get(self.config).clear_caches()
+
+    def __run(self):
         if None in [self.runner, self.env]:
             return
 
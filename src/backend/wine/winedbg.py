@@ -1,5 +1,4 @@
 import re
-import time
 import subprocess
 from typing import NewType
 
@@ -8,6 +7,7 @@ from bottles.backend.wine.wineprogram import WineProgram
 from bottles.backend.wine.wineserver import WineServer
 from bottles.backend.wine.wineboot import WineBoot
 from bottles.backend.utils.decorators import cache
+from bottles.backend.utils.proc import ProcessMonitor
 
 logging = Logger()
 
@@ -18,7 +18,18 @@ class WineDbg(WineProgram):
     colors = "debug"
 
     def __wineserver_status(self):
-        return WineServer(self.config).is_alive()
+        return self.session.get_program(WineServer).is_alive()
+
+    @property
+    def monitor(self) -> ProcessMonitor:
+        """The monitor of the processes running on the wineprefix."""
+        if self.config.get("Environment", "Custom") == "Steam":
+            bottle = self.config.get("Path")
+        else:
+            bottle = self.session.bottle_path
+        return self.session.get_value(
+            "process_monitor", (bottle,), lambda: ProcessMonitor(f"WINEPREFIX={bottle}")
+        )
 
     @cache(seconds=5)
     def get_processes(self):
@@ -72,25 +83,26 @@ class WineDbg(WineProgram):
 
         return processes
 
-    def wait_for_process(self, name: str, timeout: int = .5):
-        """Wait for a process to exit."""
+    def wait_for_process(self, name: str, timeout: float = None, poll_interval: float = .5):
+        """
+        Wait for a process to exit, at most timeout seconds if given.
+        The processes are followed through /proc, poll_interval is only
+        used to check them again on kernels not supporting pidfds.
+        Return False if the process is still running after timeout.
+        """
         if not self.__wineserver_status():
             return True
 
-        while True:
-            processes = self.get_processes()
-            if len(processes) == 0:
-                break
-            if name not in [p["name"] for p in processes]:
-                break
-            time.sleep(timeout)
+        if not self.monitor.wait(name, timeout=timeout, poll_interval=poll_interval):
+            logging.warning(f"{name} is still running after {timeout}s, not waiting anymore.")
+            return False
         return True
 
     def kill_process(self, pid: str = None, name: str = None):
         """
         Kill a process by its PID or name.
         """
-        wineboot = WineBoot(self.config)
+        wineboot = self.session.get_program(WineBoot)
         if not self.__wineserver_status():
             return
 
@@ -127,6 +139,9 @@ class WineDbg(WineProgram):
         """
         Check if a process is running on the wineprefix.
         """
+        if name and not pid:
+            return self.monitor.is_alive(name)
+
         if not self.__wineserver_status:
             return False
 
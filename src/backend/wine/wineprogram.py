@@ -4,6 +4,7 @@ from typing import NewType, Union
 from bottles.backend.logger import Logger  # pyright: reportMissingImports=false
 from bottles.backend.globals import Paths
 from bottles.backend.wine.winecommand import WineCommand
+from bottles.backend.wine.session import BottleSession
 
 logging = Logger()
 
@@ -20,6 +21,14 @@ class WineProgram:
         self.config = config
         self.silent = silent
 
+    @property
+    def session(self) -> BottleSession:
+        """The session of the bottle, holding the shared wrappers."""
+        return BottleSession.get(self.config)
+
+    def clear_cache(self):
+        """Drop the cached state of the wrapper, called by the session after a launch."""
+
     def get_command(self, args: str = None):
         command = self.command
 
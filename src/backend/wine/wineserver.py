@@ -55,6 +55,9 @@ class WineServer(WineProgram):
             return True
         return False
 
+    def clear_cache(self):
+        self.is_alive.cache_clear()
+
     def wait(self):
         config = self.config
         bottle = ManagerUtils.get_bottle_path(config)
@@ -72,6 +75,7 @@ class WineServer(WineProgram):
             cwd=bottle,
             env=env
         ).wait()
+        self.clear_cache()
 
     def kill(self, signal: int = -1):
         args = "-k"
@@ -83,6 +87,7 @@ class WineServer(WineProgram):
             communicate=True,
             action_name="sending signal to the wine server"
         )
+        self.clear_cache()
 
     def force_kill(self):
         bottle = ManagerUtils.get_bottle_path(self.config)
@@ -92,3 +97,4 @@ class WineServer(WineProgram):
 
         if len(procs) == 0:
             self.kill(9)
+        self.clear_cache()
@@ -68,6 +68,7 @@ class DuplicateDialog(Adw.Window):
 
         RunAsync(self.pulse)
         name = self.entry_name.get_text()
+        self.parent.manager.config_store.flush()
 
         RunAsync(
             task_func=BackupManager.duplicate_bottle,
@@ -21,6 +21,8 @@ from gettext import gettext as _
 gi.require_version('Adw', '1')
 from gi.repository import Gtk, Adw
 
+from bottles.backend.utils.file import FileUtils
+
 
 @Gtk.Template(resource_path='/com/usebottles/bottles/task-entry.ui')
 class TaskEntry(Adw.ActionRow):
@@ -45,14 +47,17 @@ class TaskEntry(Adw.ActionRow):
         if not cancellable:
             self.btn_cancel.hide()
 
-    def update_status(self, count=False, block_size=False, total_size=False, completed=False):
+    def update_status(self, count=False, block_size=False, total_size=False, completed=False, rate=False):
         if total_size == 0:
             self.set_subtitle(_("Calculating…"))
             return
 
         if not completed:
             percent = int(count * block_size * 100 / total_size)
-            self.set_subtitle(f'{str(percent)}%')
+            if rate:
+                self.set_subtitle(f'{str(percent)}% ({FileUtils.get_human_size(rate)}/s)')
+            else:
+                self.set_subtitle(f'{str(percent)}%')
         else:
             percent = 100
 
@@ -81,10 +86,10 @@ class OperationManager:
         self.__tasks[task_id] = self.__new_widget(title, cancellable)
         self.window.page_details.btn_operations.set_visible(True)
 
-    def update_task(self, task_id, count=False, block_size=False, total_size=False, completed=False):
+    def update_task(self, task_id, count=False, block_size=False, total_size=False, completed=False, rate=False):
         if self.get_task(task_id):
             self.__tasks[task_id].update_status(
-                count, block_size, total_size, completed
+                count, block_size, total_size, completed, rate
             )
 
     def remove_task(self, task_id):
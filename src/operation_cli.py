@@ -11,7 +11,8 @@ class OperationManager:
                     count=False,
                     block_size=False,
                     total_size=False,
-                    completed=False
+                    completed=False,
+                    rate=False
                     ):
         pass
 
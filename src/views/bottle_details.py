@@ -29,6 +29,7 @@ from bottles.backend.runner import Runner
 from bottles.backend.managers.backup import BackupManager
 from bottles.backend.utils.terminal import TerminalUtils
 from bottles.backend.utils.manager import ManagerUtils
+from bottles.backend.utils.archive import CODECS
 
 from bottles.widgets.executable import ExecButton
 
@@ -76,6 +77,7 @@ class BottleView(Adw.PreferencesPage):
     btn_killall = Gtk.Template.Child()
     btn_backup_config = Gtk.Template.Child()
     btn_backup_full = Gtk.Template.Child()
+    btn_backup_incremental = Gtk.Template.Child()
     btn_duplicate = Gtk.Template.Child()
     btn_delete = Gtk.Template.Child()
     btn_flatpak_doc = Gtk.Template.Child()
@@ -116,6 +118,7 @@ class BottleView(Adw.PreferencesPage):
         self.btn_killall.connect("clicked", self.wineboot, 0)
         self.btn_backup_config.connect("clicked", self.__backup, "config")
         self.btn_backup_full.connect("clicked", self.__backup, "full")
+        self.btn_backup_incremental.connect("clicked", self.__backup, "incremental")
         self.btn_duplicate.connect("clicked", self.__duplicate)
         self.btn_flatpak_doc.connect(
             "clicked",
@@ -262,14 +265,20 @@ class BottleView(Adw.PreferencesPage):
         """
         This function pop up the file chooser where the user
         can select the path where to export the bottle backup.
-        Use the backup_type param to export config or full.
+        Use the backup_type param to export config, full or incremental.
         """
         title = _("Select the location where to save the backup config")
         hint = f"backup_{self.config.get('Path')}.yml"
+        codec = self.window.settings.get_string("backup-codec")
+        level = self.window.settings.get_int("backup-level")
+        ext = CODECS.get(codec, ".tar.gz")
 
         if backup_type == "full":
             title = _("Select the location where to save the backup archive")
-            hint = f"backup_{self.config.get('Path')}.tar.gz"
+            hint = f"backup_{self.config.get('Path')}{ext}"
+        elif backup_type == "incremental":
+            title = _("Select the location where to save the backup archive")
+            hint = f"backup_{self.config.get('Path')}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}{ext}"
 
         def finish(result, error=False):
             if result.status:
@@ -286,7 +295,9 @@ class BottleView(Adw.PreferencesPage):
                     window=self.window,
                     config=self.config,
                     scope=backup_type,
-                    path=_file.get_path()
+                    path=_file.get_path(),
+                    level=level,
+                    codec=codec
                 )
 
         FileChooser(
@@ -419,6 +430,6 @@ class BottleView(Adw.PreferencesPage):
     def __set_steam_rules(self):
         status = False if self.config.get("Environment") == "Steam" else True
 
-        for w in [self.btn_delete, self.btn_backup_full, self.btn_duplicate]:
+        for w in [self.btn_delete, self.btn_backup_full, self.btn_backup_incremental, self.btn_duplicate]:
             w.set_visible(status)
             w.set_sensitive(status)
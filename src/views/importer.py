@@ -93,8 +93,8 @@ class ImporterView(Adw.Bin):
     def __import_full_bck(self, *_args):
         """
         This function show a dialog to the user, from which it can choose an
-        archive backup to import into Bottles. It supports only .tar.gz files
-        as Bottles export bottles in this format. Once selected, it will
+        archive backup to import into Bottles. It supports only .tar.gz and
+        .tar.zst files as Bottles export bottles in these formats. Once selected, it will
         be imported.
         """
         def set_path(_dialog, response, _file_dialog):
@@ -115,7 +115,7 @@ class ImporterView(Adw.Bin):
             title=_("Choose a backup archive"),
             action=Gtk.FileChooserAction.OPEN,
             buttons=(_("Cancel"), _("Import")),
-            filters=["tar.gz"],
+            filters=["tar.gz", "tar.zst"],
             callback=set_path
         )
 
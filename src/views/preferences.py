@@ -24,6 +24,7 @@ from bottles.widgets.component import ComponentEntry, ComponentExpander  # pyrig
 from bottles.dialogs.filechooser import FileChooser
 
 from bottles.backend.managers.data import DataManager
+from bottles.backend.utils.archive import CODECS, zstd_available
 
 
 @Gtk.Template(resource_path='/com/usebottles/bottles/preferences.ui')
@@ -45,6 +46,8 @@ class PreferencesWindow(Adw.PreferencesWindow):
     switch_steam_programs = Gtk.Template.Child()
     switch_epic_games = Gtk.Template.Child()
     switch_ubisoft_connect = Gtk.Template.Child()
+    combo_backup_codec = Gtk.Template.Child()
+    spin_backup_level = Gtk.Template.Child()
     list_winebridge = Gtk.Template.Child()
     list_runtimes = Gtk.Template.Child()
     list_runners = Gtk.Template.Child()
@@ -95,6 +98,7 @@ class PreferencesWindow(Adw.PreferencesWindow):
         self.settings.bind("steam-programs", self.switch_steam_programs, "active", Gio.SettingsBindFlags.DEFAULT)
         self.settings.bind("epic-games", self.switch_epic_games, "active", Gio.SettingsBindFlags.DEFAULT)
         self.settings.bind("ubisoft-connect", self.switch_ubisoft_connect, "active", Gio.SettingsBindFlags.DEFAULT)
+        self.__set_backup_options()
 
         # populate components lists
         self.populate_runtimes_list()
@@ -123,6 +127,24 @@ class PreferencesWindow(Adw.PreferencesWindow):
         if not self.style_manager.get_system_supports_color_schemes():
             self.row_theme.set_visible(True)
 
+    def __set_backup_options(self):
+        codecs = list(CODECS)
+        self.combo_backup_codec.set_selected(codecs.index(self.settings.get_string("backup-codec")))
+        self.spin_backup_level.set_value(self.settings.get_int("backup-level"))
+
+        if not zstd_available:
+            self.combo_backup_codec.set_sensitive(False)
+            self.combo_backup_codec.set_subtitle(_("zstd is not available, the zstandard module is not installed."))
+
+        self.combo_backup_codec.connect(
+            "notify::selected",
+            lambda combo, _param: self.settings.set_string("backup-codec", codecs[combo.get_selected()])
+        )
+        self.spin_backup_level.connect(
+            "value-changed",
+            lambda spin: self.settings.set_int("backup-level", spin.get_value_as_int())
+        )
+
     def __toggle_night(self, widget, state):
         if self.settings.get_boolean("dark-theme"):
             Adw.StyleManager.get_default().set_color_scheme(Adw.ColorScheme.FORCE_DARK)
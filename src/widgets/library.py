@@ -139,7 +139,7 @@ class LibraryEntry(Gtk.Box):
                 winedbg.wait_for_process,
                 callback=self.__reset_buttons,
                 name=self.program["executable"],
-                timeout=5
+                poll_interval=5
             )
 
         RunAsync(
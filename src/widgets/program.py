@@ -160,7 +160,7 @@ class ProgramEntry(Adw.ActionRow):
                 winedbg.wait_for_process,
                 callback=self.__reset_buttons,
                 name=self.executable,
-                timeout=5
+                poll_interval=5
             )
 
         RunAsync(